@@ -0,0 +1,4 @@
+'''Benchmarks of the toolkit.
+Run them with `python -m benchmarks` from the root of the repository, see
+`python -m benchmarks --help` for the options.
+'''
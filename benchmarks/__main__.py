@@ -0,0 +1,37 @@
+import argparse
+import sys
+
+from . import runner
+from . import bench_math
+from . import bench_builder
+from . import bench_render
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Run the benchmarks of the toolkit.')
+    parser.add_argument('-k', '--filter', help='only run the cases whose name contains this string')
+    parser.add_argument('--macro', action='store_true', help='also run the macro benchmarks rendering whole scenes')
+    parser.add_argument('--backend', choices=('osmesa', 'egl', 'cpu'), help='offscreen backend of the macro benchmarks')
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs of each case')
+    parser.add_argument('-o', '--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare the results against this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slow down reported as a regression')
+    args = parser.parse_args(argv)
+
+    bench_render.BACKEND = args.backend
+    results = runner.run(args.filter, args.macro, args.repeat, sys.stdout)
+    if args.output:
+        runner.save(results, args.output)
+    if args.baseline:
+        regressions = 0
+        print()
+        for name, before, after, ratio, status in runner.compare(results, runner.load(args.baseline), args.threshold):
+            print('{:<60} {:>10.6f} -> {:>10.6f} ms  x{:.2f} {}'.format(name, before * 1000, after * 1000, ratio, status))
+            if status == 'slower':
+                regressions += 1
+        if regressions:
+            print('{} regression{}'.format(regressions, 's' if regressions > 1 else ''))
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
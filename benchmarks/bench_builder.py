@@ -0,0 +1,31 @@
+from .runner import benchmark, toolkit
+
+Builder = toolkit.Builder
+
+@benchmark({'segments': 12}, {'segments': 1000}, {'segments': 10000})
+def circle(segments):
+    return lambda: Builder.circle(10, segments)
+
+@benchmark({'segments': 12}, {'segments': 1000}, {'segments': 10000})
+def circle_indexed(segments):
+    return lambda: Builder.circle(10, segments, indexed=True)
+
+@benchmark()
+def block():
+    return lambda: Builder.block((0, 0, 0), 1, 2, 3)
+
+@benchmark()
+def block_indexed():
+    return lambda: Builder.block((0, 0, 0), 1, 2, 3, indexed=True)
+
+@benchmark({'base_count': 4}, {'base_count': 1000})
+def pyramid(base_count):
+    return lambda: Builder.pyramid((0, 0, 0), 5, 3, base_count)
+
+@benchmark()
+def compile_cube():
+    cube = Builder.cube((0, 0, 0), 1)
+    def func():
+        cube.mark_dirty()
+        return cube.compile()
+    return func
@@ -0,0 +1,50 @@
+import itertools
+from .runner import benchmark, toolkit
+
+TransformationMatrix = toolkit.TransformationMatrix
+
+def _angles():
+    # A new angle at every call, so that no rotation is built twice from the same values.
+    angles = itertools.count(30, 1e-3)
+    return lambda: next(angles)
+
+@benchmark({'axis': (0, 0, 1)}, {'axis': (1, 1, 0)}, {'axis': (0.3, -1, 2)})
+def rotate(axis):
+    angle = _angles()
+    return lambda: TransformationMatrix.rotate(angle(), axis)
+
+@benchmark({'axis': (1, 1, 0)})
+def rotate_pivot(axis):
+    angle = _angles()
+    return lambda: TransformationMatrix.rotate(angle(), axis, (1, 2, 3))
+
+@benchmark()
+def from_euler_angles():
+    return lambda: TransformationMatrix.from_euler_angles(10, 20, 30)
+
+@benchmark()
+def c_values():
+    matrix = TransformationMatrix.rotate(30, (1, 1, 0))
+    def func():
+        # Changing the matrix makes sure no cached value is measured.
+        matrix.reset(matrix.array)
+        return matrix.c_values()
+    return func
+
+@benchmark()
+def multiply():
+    a = TransformationMatrix.rotate(30, (1, 1, 0))
+    b = TransformationMatrix.translate(1, 2, 3)
+    return lambda: a * b
+
+@benchmark()
+def transform_vector():
+    matrix = TransformationMatrix.rotate(30, (1, 1, 0))
+    vector = toolkit.Vector(1, 2, 3)
+    return lambda: matrix * vector
+
+@benchmark({'triangles': 1000}, {'triangles': 100000})
+def apply_transformation(triangles):
+    circle = toolkit.Builder.circle(10, triangles)
+    matrix = TransformationMatrix.rotate(1, (1, 1, 0))
+    return lambda: circle.applyTransformation(matrix)
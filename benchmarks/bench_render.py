@@ -0,0 +1,28 @@
+import math
+from .runner import benchmark, toolkit
+
+# Backend used by the macro benchmarks, set from the command line.
+BACKEND = None
+# Number of primitives of a cube built by Builder.cube.
+CUBE_PRIMITIVES = 18
+
+def build_scene(primitives, indexed):
+    '''Replace the scene with a grid of cubes having about the given number of primitives.'''
+    toolkit.to_render = []
+    toolkit.selection = -1
+    toolkit.scene_index.clear()
+    toolkit.history.clear()
+    count = max(1, primitives // CUBE_PRIMITIVES)
+    side = int(math.ceil(count ** (1 / 3)))
+    spacing = 3
+    for i in range(0, count):
+        x, y, z = i % side, (i // side) % side, i // (side * side)
+        offset = (side - 1) * spacing / 2
+        toolkit.add_renderable(toolkit.Builder.cube((x * spacing - offset, y * spacing - offset, z * spacing - offset), 2, indexed=indexed))
+    toolkit.camera.set_position((0, 0, -side * spacing * 2))
+
+@benchmark(*[{'primitives': n, 'indexed': indexed, 'frames': 10} for n in (1000, 10000, 100000) for indexed in (False, True)], macro=True)
+def render_scene(primitives, indexed, frames):
+    '''Render several frames per call, so the creation of the offscreen context is amortized.'''
+    build_scene(primitives, indexed)
+    return lambda: toolkit.StartHeadless(frames, backend=BACKEND)
@@ -0,0 +1,139 @@
+import json
+import platform
+import statistics
+import sys
+import time
+import timeit
+
+try:
+    import SimplePyToolKit as toolkit
+except ImportError:
+    # Running from a checkout without installing the toolkit.
+    import src as toolkit
+
+# Registered benchmarks, in registration order.
+BENCHMARKS = []
+
+class Benchmark:
+    '''A benchmark, run once for every set of parameters.
+    Args:
+        name (str): the name of the benchmark.
+        func (function): called with the parameters, returns the function to time.
+        params (list): list of dict of parameters.
+        macro (bool): macro benchmarks are only run when asked for.
+    '''
+
+    def __init__(self, name, func, params, macro):
+        self.name = name
+        self.func = func
+        self.params = params
+        self.macro = macro
+
+    def cases(self):
+        '''Returns a list of (case name, parameters).'''
+        retval = []
+        for params in self.params:
+            if params:
+                name = self.name + '[' + ','.join('{}={}'.format(k, v) for k, v in params.items()) + ']'
+            else:
+                name = self.name
+            retval.append((name, params))
+        return retval
+
+def benchmark(*params, macro=False):
+    '''Register a benchmark.
+    The decorated function receives the parameters, sets up what it needs and
+    returns the function to time.
+    Args:
+        params (*): dict of parameters, one per case; no parameters means a single case.
+        macro (bool): whether this is a macro benchmark.
+    '''
+    def register(func):
+        BENCHMARKS.append(Benchmark(func.__name__, func, list(params) or [{}], macro))
+        return func
+    return register
+
+def measure(func, repeat=5):
+    '''Time a function.
+    The number of calls per run is picked so that a run takes at least 0.2 seconds.
+    Returns:
+        dict: the seconds per call of the fastest run, the mean and standard deviation of all the runs.
+    '''
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    runs = [t / number for t in timer.repeat(repeat, number)]
+    return {
+        'min': min(runs),
+        'mean': statistics.mean(runs),
+        'stdev': statistics.stdev(runs) if len(runs) > 1 else 0.0,
+        'number': number,
+        'repeat': repeat,
+    }
+
+def run(pattern=None, macro=False, repeat=5, log=None):
+    '''Run the registered benchmarks.
+    Args:
+        pattern (str): only run the cases whose name contains pattern.
+        macro (bool): also run the macro benchmarks.
+        repeat (int): the number of runs of each case.
+        log (file): where to report the progress.
+    Returns:
+        dict: the results, keyed by case name.
+    '''
+    results = {}
+    for bench in BENCHMARKS:
+        if bench.macro and not macro:
+            continue
+        for name, params in bench.cases():
+            if pattern and pattern not in name:
+                continue
+            func = bench.func(**params)
+            result = measure(func, repeat)
+            result['params'] = params
+            results[name] = result
+            if log:
+                log.write('{:<60} {:>12.6f} ms\n'.format(name, result['min'] * 1000))
+                log.flush()
+    return results
+
+def metadata():
+    '''Describe the machine and the versions the benchmarks were run with.'''
+    import numpy
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'numpy': numpy.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+    }
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump({'meta': metadata(), 'results': results}, f, indent=2, sort_keys=True)
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+def compare(results, baseline, threshold=0.1):
+    '''Compare results against a baseline, using the fastest run of each case.
+    Args:
+        threshold (float): relative slow down above which a case is a regression.
+    Returns:
+        list: list of (case name, baseline seconds, current seconds, ratio, status) for the cases in both.
+    '''
+    retval = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]['min']
+        after = result['min']
+        ratio = after / before if before else float('inf')
+        if ratio > 1 + threshold:
+            status = 'slower'
+        elif ratio < 1 - threshold:
+            status = 'faster'
+        else:
+            status = 'same'
+        retval.append((name, before, after, ratio, status))
+    return retval
@@ -0,0 +1,114 @@
+from .Mesh import Mesh
+import numpy as np
+import weakref
+
+class StaticBatch:
+    '''A group of renderables that rarely change, drawn as a single mesh.
+    The meshes of the members are transformed by their full transformation and merged into
+    one vertex buffer, drawn with one call for the triangles and one for the lines. Colors are
+    kept per vertex, so members of different colors still share the same calls. The merged mesh
+    is only rebuilt after a member changes; members are watched, so moving or editing one is
+    enough to mark the batch as dirty.
+    Only meshes are merged, attached objects that are not renderables or meshes are not drawn.
+    Args:
+        members (*): the renderables to merge.
+    '''
+
+    def __init__(self, *members):
+        self.members = []
+        self._mesh = Mesh(())
+        self._dirty = True
+        # Incremented every time the batch is rebuilt.
+        self.rebuilds = 0
+        self._watchers = None
+        for member in members:
+            self.add(member)
+
+    def __len__(self):
+        return len(self.members)
+
+    def add(self, member):
+        '''Add a renderable to the batch.'''
+        if not hasattr(member, 'meshes') and not isinstance(member, Mesh):
+            raise TypeError("trying to batch '{}' which has no meshes".format(member.__class__.__name__))
+        self.members.append(member)
+        if hasattr(member, 'watch'):
+            member.watch(self)
+        self.mark_dirty()
+
+    def remove(self, member):
+        '''Remove a renderable from the batch.'''
+        for i, obj in enumerate(self.members):
+            if obj is member:
+                del self.members[i]
+                self.mark_dirty()
+                return
+        raise ValueError("{} is not in the batch".format(member))
+
+    def mark_dirty(self):
+        '''Rebuild the merged mesh before the next draw.'''
+        self._dirty = True
+        if self._watchers:
+            for watcher in list(self._watchers):
+                watcher.mark_bounds_dirty(self)
+
+    def mark_bounds_dirty(self, obj=None):
+        '''Called by the members when they change.'''
+        if not self._dirty:
+            self.mark_dirty()
+
+    def watch(self, watcher):
+        '''Call watcher.mark_bounds_dirty(self) whenever a member changes.'''
+        if self._watchers is None:
+            self._watchers = weakref.WeakSet()
+        self._watchers.add(watcher)
+
+    def is_dirty(self):
+        return self._dirty
+
+    def compile(self):
+        '''Returns the merged mesh of every member, rebuilding it if a member changed.'''
+        if self._dirty:
+            # Clear the flag first, a member changing during the rebuild marks it again.
+            self._dirty = False
+            vertices, colors, triangles, lines = [], [], [], []
+            count = 0
+            for member in self.members:
+                pairs = [(None, member)] if isinstance(member, Mesh) else member.meshes()
+                for matrix, mesh in pairs:
+                    if len(mesh.vertices) == 0:
+                        continue
+                    if matrix is None:
+                        vertices.append(mesh.vertices)
+                    else:
+                        matrix = np.asarray(matrix, dtype=np.float64)
+                        vertices.append(np.matmul(mesh.vertices, matrix[:3, :3]) + matrix[3, :3])
+                    colors.append(mesh.colors)
+                    triangles.append(mesh.triangles + count)
+                    lines.append(mesh.lines + count)
+                    count += len(mesh.vertices)
+            if vertices:
+                self._mesh.update(np.concatenate(vertices), np.concatenate(colors), np.concatenate(triangles), np.concatenate(lines))
+            else:
+                self._mesh.update(())
+            self.rebuilds += 1
+        return self._mesh
+
+    def get_bounds_key(self):
+        '''Changes every time the batch is rebuilt, rebuilding it first if a member changed.'''
+        self.compile()
+        return self.rebuilds
+
+    def get_bounds(self):
+        '''Returns the axis aligned box enclosing every member, as its minimum and maximum corners.'''
+        return self.compile().bounds
+
+    def meshes(self, matrix=None):
+        '''List the meshes of this object, see Renderable.meshes.'''
+        return [(matrix if matrix is not None else np.identity(4, dtype=np.float32), self.compile())]
+
+    def render(self):
+        '''Render this object using OpenGL'''
+        self.compile().render()
+
+    bounds = property(get_bounds)
@@ -1,83 +1,135 @@
 from .Renderable import *
+from .Instancing import InstancedMesh
+from .LevelOfDetail import LODChain, segment_sizes
+import numpy as np
 import math
 
-def line(p1, p2, color=(0.1, 0.4, 0.7, 1.0)):
+def _mesh(vertices, colors, triangles=(), lines=(), twoface=True):
+    '''Create a Mesh, adding the back face of every triangle if twoface is true.
+    Args:
+        vertices (array like): (n, 3) array of unique vertices.
+        colors (list): list of colors, one per vertex.
+        triangles (array like): (t, 3) array of vertex indices.
+        lines (array like): (l, 2) array of vertex indices.
+    Returns:
+        Mesh: the indexed mesh.
+    '''
+    triangles = np.asarray(triangles, dtype=np.uint32).reshape(-1, 3)
+    if twoface:
+        triangles = np.concatenate((triangles, triangles[:, ::-1]))
+    return Mesh(vertices, [to_rgba(c) for c in colors], triangles, lines)
+
+def _polygon_triangles(count):
+    '''Triangle indices of a simple polygon with count vertices, as built by polygon.'''
+    triangles = [(0, 1, 2)]
+    for i in range(3, count):
+        n = i + 1
+        if n == count:
+            n = 0
+        triangles.append((i, n, 2))
+    return triangles
+
+def _block_vertices(x, y, z, offset_x, offset_y, offset_z):
+    '''The 8 corners of a block, in the order used by block.'''
+    return [
+        (x - offset_x, y - offset_y, z + offset_z),
+        (x + offset_x, y - offset_y, z + offset_z),
+        (x + offset_x, y - offset_y, z - offset_z),
+        (x - offset_x, y - offset_y, z - offset_z),
+        (x - offset_x, y + offset_y, z + offset_z),
+        (x + offset_x, y + offset_y, z + offset_z),
+        (x + offset_x, y + offset_y, z - offset_z),
+        (x - offset_x, y + offset_y, z - offset_z),
+    ]
+
+# Faces and edges of a block, as indices of its corners.
+_BLOCK_FACES = (
+    (3, 2, 1, 0), # Bottom
+    (4, 5, 6, 7), # Top
+    (0, 1, 5, 4), # Front
+    (2, 3, 7, 6), # Back
+    (3, 0, 4, 7), # Left
+    (1, 2, 6, 5), # Right
+)
+_BLOCK_EDGES = (
+    (0, 1), (1, 2), (2, 3), (3, 0), # Bottom lines
+    (4, 5), (5, 6), (6, 7), (7, 4), # Top lines
+    (0, 4), (1, 5), (2, 6), (3, 7), # Corner lines
+)
+
+def line(p1, p2, color=(0.1, 0.4, 0.7, 1.0), indexed=False):
     ''' Create a line object.
     Args:
         p1 (tuple): len(p1) == 3, represents x, y and z.
         p2 (tuple): len(p2) == 3, represents x, y and z.
+        indexed (bool): if true, the line is stored as an indexed Mesh.
     Returns:
         Renderable: a line object.
     '''
+    if indexed:
+        return Renderable(line_mesh(p1, p2, color))
     ren_obj = Renderable()
     ren_obj.attach(Line(p1, p2, [color]))
     return ren_obj
     
-def circle(radius, segments = 12, color = (0.4, 0.7, 1.0, 1.0)):
+def circle(radius, segments = 12, color = (0.4, 0.7, 1.0, 1.0), indexed=False):
     '''Create a circle.
     Args:
         radius (float): the radius of the circle
+        indexed (bool): if true, the circle is stored as an indexed Mesh.
     Returnss:
         Renderable: a 2D circle object.
     '''
-    origin = Vector(0, 0, 0)
-    vertices = []
+    if indexed:
+        return Renderable(circle_mesh(radius, segments, color))
     # Generate vertices.
-    for i in range(0, segments):
-        angle = math.pi * 2 * i / segments
-        vertices.append(Vector(math.cos(angle) * radius, math.sin(angle) * radius, 0))
+    angles = np.arange(0, segments) * (math.pi * 2 / segments)
+    ring = np.zeros((segments, 3))
+    ring[:, 0] = np.cos(angles) * radius
+    ring[:, 1] = np.sin(angles) * radius
+    # Generate tris, from the origin to each pair of neighbouring vertices.
+    tris = np.stack((np.zeros((segments, 3)), ring, np.roll(ring, -1, axis=0)), axis=1)
     ren_obj = Renderable()
-    # Generate tris.
-    for i in range(0, segments):
-        n = i + 1
-        if n >= segments:
-            n -= segments
-        ren_obj.attach(Tri(origin, vertices[i], vertices[n], [color], True))
+    for points in tris:
+        ren_obj.attach(Tri.from_points(points, [color], True))
     return ren_obj
     
 
-def polygon(points, color = (0.4, 0.7, 1.0, 1.0)):
+def polygon(points, color = (0.4, 0.7, 1.0, 1.0), indexed=False):
     '''Create a polygonal shape based on several input points. Doesn't automatically create a concave shape.
     Args:
-        points (list): list of Vector or tuple with len of 3 representing x, y and z.
+        points (list): list of Vector or tuple with len of 3 representing x, y and z, or a VectorArray.
+        indexed (bool): if true, the polygon is stored as an indexed Mesh.
     Returns:
         Renderable: a 2D polygonal object.
     '''
+    if indexed:
+        return Renderable(polygon_mesh(points, color))
     # Check for input points count.
     count = len(points)
     if count < 3:
         raise ValueError("trying to build a polygon with {} {}.".format(count, "vertex" if count < 2 else "vertices"))
     # Process vertices
-    vertices = []
-    for p in points:
-        if isinstance(p, Vector):
-            vertices.append(p)
-        elif (isinstance(p, tuple) or isinstance(p, list)) and len(p) == 3:
-            vertices.append(Vector(p[0], p[1], p[2]))
-        else:
-            raise TypeError("unsupported type", p.__class__.__name__)
+    vertices = to_points(points)
     # Create a simple polygon, doesn't support concave shape.
     ren_obj = Renderable()
-    ren_obj.attach(Tri(vertices[0], vertices[1], vertices[2], [color], True))
-    p = 2
-    for i in range(3, count):
-        c = i
-        n = i + 1
-        if n == count:
-            n = 0
-        ren_obj.attach(Tri(vertices[c], vertices[n], vertices[p], [color], True))
+    for points in vertices[np.array(_polygon_triangles(count))]:
+        ren_obj.attach(Tri.from_points(points, [color], True))
     return ren_obj
 
-def block(p, width, height, length, fill_color = (0.4, 0.7, 1.0, 1.0), outline_color = (0.1, 0.4, 0.7, 1.0)):
+def block(p, width, height, length, fill_color = (0.4, 0.7, 1.0, 1.0), outline_color = (0.1, 0.4, 0.7, 1.0), indexed=False):
     '''Create a 3D block based on a position, width, height and length.
     Args:
         p (tuple): len(p) == 3, represents x, y and z of the position of the newly created block.
         width (float): width of the block.
         height (float): height of the block.
         length (float): length of the block.
+        indexed (bool): if true, the block is stored as an indexed Mesh.
     Returns:
         Renderable: a block object. 
     '''
+    if indexed:
+        return Renderable(block_mesh(p, width, height, length, fill_color, outline_color))
     # Get position.
     x, y, z = p
     # Get offset in x, y, and z direction from the position.
@@ -87,92 +139,208 @@ def block(p, width, height, length, fill_color = (0.4, 0.7, 1.0, 1.0), outline_c
     # Start creating the renderable.
     ren_obj = Renderable()
     # Generate solid layer
-    vertices = [
-        Vector(x - offset_x, y - offset_y, z + offset_z),
-        Vector(x + offset_x, y - offset_y, z + offset_z),
-        Vector(x + offset_x, y - offset_y, z - offset_z),
-        Vector(x - offset_x, y - offset_y, z - offset_z),
-        Vector(x - offset_x, y + offset_y, z + offset_z),
-        Vector(x + offset_x, y + offset_y, z + offset_z),
-        Vector(x + offset_x, y + offset_y, z - offset_z),
-        Vector(x - offset_x, y + offset_y, z - offset_z),
-    ]
-    # Bottom
-    ren_obj.attach(Quad(vertices[3], vertices[2], vertices[1], vertices[0], [fill_color], True))
-    # Top
-    ren_obj.attach(Quad(vertices[4], vertices[5], vertices[6], vertices[7], [fill_color], True))
-    # Front
-    ren_obj.attach(Quad(vertices[0], vertices[1], vertices[5], vertices[4], [fill_color], True))
-    # Back
-    ren_obj.attach(Quad(vertices[2], vertices[3], vertices[7], vertices[6], [fill_color], True))
-    # Left
-    ren_obj.attach(Quad(vertices[3], vertices[0], vertices[4], vertices[7], [fill_color], True))
-    # Right
-    ren_obj.attach(Quad(vertices[1], vertices[2], vertices[6], vertices[5], [fill_color], True))
+    corners = np.array(_block_vertices(x, y, z, offset_x, offset_y, offset_z))
+    for points in corners[np.array(_BLOCK_FACES)]:
+        ren_obj.attach(Quad.from_points(points, [fill_color], True))
     # Generate outer lines
-    offset_x += 0.005
-    offset_y += 0.005
-    offset_z += 0.005
-    vertices = [
-        Vector(x - offset_x, y - offset_y, z + offset_z),
-        Vector(x + offset_x, y - offset_y, z + offset_z),
-        Vector(x + offset_x, y - offset_y, z - offset_z),
-        Vector(x - offset_x, y - offset_y, z - offset_z),
-        Vector(x - offset_x, y + offset_y, z + offset_z),
-        Vector(x + offset_x, y + offset_y, z + offset_z),
-        Vector(x + offset_x, y + offset_y, z - offset_z),
-        Vector(x - offset_x, y + offset_y, z - offset_z),
-    ]
-    # Bottom lines
-    ren_obj.attach(Line(vertices[0], vertices[1], [outline_color]))
-    ren_obj.attach(Line(vertices[1], vertices[2], [outline_color]))
-    ren_obj.attach(Line(vertices[2], vertices[3], [outline_color]))
-    ren_obj.attach(Line(vertices[3], vertices[0], [outline_color]))
-    # Top lines
-    ren_obj.attach(Line(vertices[4], vertices[5], [outline_color]))
-    ren_obj.attach(Line(vertices[5], vertices[6], [outline_color]))
-    ren_obj.attach(Line(vertices[6], vertices[7], [outline_color]))
-    ren_obj.attach(Line(vertices[7], vertices[4], [outline_color]))
-    # Corner lines
-    ren_obj.attach(Line(vertices[0], vertices[4], [outline_color]))
-    ren_obj.attach(Line(vertices[1], vertices[5], [outline_color]))
-    ren_obj.attach(Line(vertices[2], vertices[6], [outline_color]))
-    ren_obj.attach(Line(vertices[3], vertices[7], [outline_color]))
+    corners = np.array(_block_vertices(x, y, z, offset_x + 0.005, offset_y + 0.005, offset_z + 0.005))
+    for points in corners[np.array(_BLOCK_EDGES)]:
+        ren_obj.attach(Line.from_points(points, [outline_color]))
     return ren_obj
 
-def cube(p, size, fill_color = (0.4, 0.7, 1.0, 1.0), outline_color = (0.1, 0.4, 0.7, 1.0)):
+def cube(p, size, fill_color = (0.4, 0.7, 1.0, 1.0), outline_color = (0.1, 0.4, 0.7, 1.0), indexed=False):
     '''Create a 3D cube based on a point and a size.
     Args:
         p (tuple): len(p) == 3, represents x, y and z of the position of the newly created cube.
         size (float): size of the cube.
+        indexed (bool): if true, the cube is stored as an indexed Mesh.
     Returns:
         Renderable: a cube object.
     '''
-    return block(p, size, size, size, fill_color, outline_color) # Build a block with the same witdh, height and length.
+    return block(p, size, size, size, fill_color, outline_color, indexed) # Build a block with the same witdh, height and length.
 
-def pyramid(p, height, radius, base_count=4, fill_color=(0.4, 0.7, 1.0, 1.0), outline_color=(0.1, 0.4, 0.7, 1.0)):
+def pyramid(p, height, radius, base_count=4, fill_color=(0.4, 0.7, 1.0, 1.0), outline_color=(0.1, 0.4, 0.7, 1.0), indexed=False):
     '''Create a 3D pyramid.
     Args:
         p (tuple): len(p) == 3, represents x, y and z of the position of the newly created pyramid.
         height (float): height of the pyramid.
         radius (float): radius of the base of the pyramid.
         base_count (int): the number of corner vertices of the pyramid.
+        indexed (bool): if true, the pyramid is stored as an indexed Mesh.
     Returns:
         Renderable: a pyramid object.
     '''
+    if indexed:
+        return Renderable(pyramid_mesh(p, height, radius, base_count, fill_color, outline_color))
     x, y, z = p
-    top = Vector(x, y + height, z)
-    vertices = []
+    top = np.array((x, y + height, z))
+    angles = np.arange(0, base_count) / base_count * math.pi * 2
+    base = np.zeros((base_count, 3))
+    base[:, 0] = radius * np.cos(angles)
+    base[:, 2] = radius * np.sin(angles)
+    ren_obj = polygon(base)
+    following = np.roll(base, -1, axis=0)
+    tops = np.tile(top, (base_count, 1))
+    sides = np.stack((base, following, tops), axis=1)
     for i in range(0, base_count):
-        angle = i / base_count * math.pi * 2
-        vertices.append(Vector(radius * math.cos(angle), 0, radius * math.sin(angle)))
-    ren_obj = polygon(vertices)
-    for i in range(0, len(vertices)):
-        n = i + 1
-        if n == len(vertices):
-            n = 0
-        ren_obj.attach(Tri(vertices[i], vertices[n], top, [fill_color], True))
-        ren_obj.attach(Line(vertices[i], top, [outline_color]))
-        ren_obj.attach(Line(vertices[i], vertices[n], [outline_color]))
+        ren_obj.attach(Tri.from_points(sides[i], [fill_color], True))
+        ren_obj.attach(Line.from_points(sides[i, ::2], [outline_color]))
+        ren_obj.attach(Line.from_points(sides[i, :2], [outline_color]))
 
     return ren_obj
+
+def line_mesh(p1, p2, color=(0.1, 0.4, 0.7, 1.0)):
+    '''Create the indexed mesh of a line, see line.
+    Returns:
+        Mesh: a line mesh.
+    '''
+    return _mesh(to_points((p1, p2)), [color, color], lines=[(0, 1)])
+
+def circle_mesh(radius, segments = 12, color = (0.4, 0.7, 1.0, 1.0)):
+    '''Create the indexed mesh of a circle, see circle.
+    Returns:
+        Mesh: a circle mesh sharing the center and the vertices around it between its triangles.
+    '''
+    angles = np.arange(0, segments) * (math.pi * 2 / segments)
+    vertices = np.zeros((segments + 1, 3))
+    vertices[1:, 0] = np.cos(angles) * radius
+    vertices[1:, 1] = np.sin(angles) * radius
+    i = np.arange(0, segments)
+    triangles = np.stack((np.zeros(segments, dtype=np.int64), i + 1, (i + 1) % segments + 1), axis=1)
+    return _mesh(vertices, [color] * (segments + 1), triangles)
+
+def polygon_mesh(points, color = (0.4, 0.7, 1.0, 1.0)):
+    '''Create the indexed mesh of a polygon, see polygon.
+    Returns:
+        Mesh: a polygon mesh.
+    '''
+    count = len(points)
+    if count < 3:
+        raise ValueError("trying to build a polygon with {} {}.".format(count, "vertex" if count < 2 else "vertices"))
+    return _mesh(to_points(points), [color] * count, _polygon_triangles(count))
+
+def block_mesh(p, width, height, length, fill_color = (0.4, 0.7, 1.0, 1.0), outline_color = (0.1, 0.4, 0.7, 1.0)):
+    '''Create the indexed mesh of a block, see block.
+    Returns:
+        Mesh: a block mesh with 8 vertices for the faces and 8 for the outline.
+    '''
+    x, y, z = p
+    offset_x = width / 2
+    offset_y = height / 2
+    offset_z = length / 2
+    vertices = _block_vertices(x, y, z, offset_x, offset_y, offset_z)
+    # The outline is slightly bigger than the faces.
+    vertices += _block_vertices(x, y, z, offset_x + 0.005, offset_y + 0.005, offset_z + 0.005)
+    triangles = []
+    for a, b, c, d in _BLOCK_FACES:
+        triangles.append((a, b, c))
+        triangles.append((a, c, d))
+    lines = [(a + 8, b + 8) for a, b in _BLOCK_EDGES]
+    return _mesh(vertices, [fill_color] * 8 + [outline_color] * 8, triangles, lines)
+
+def cube_mesh(p, size, fill_color = (0.4, 0.7, 1.0, 1.0), outline_color = (0.1, 0.4, 0.7, 1.0)):
+    '''Create the indexed mesh of a cube, see cube.
+    Returns:
+        Mesh: a cube mesh.
+    '''
+    return block_mesh(p, size, size, size, fill_color, outline_color)
+
+def pyramid_mesh(p, height, radius, base_count=4, fill_color=(0.4, 0.7, 1.0, 1.0), outline_color=(0.1, 0.4, 0.7, 1.0)):
+    '''Create the indexed mesh of a pyramid, see pyramid.
+    Returns:
+        Mesh: a pyramid mesh.
+    '''
+    if base_count < 3:
+        raise ValueError("trying to build a polygon with {} {}.".format(base_count, "vertex" if base_count < 2 else "vertices"))
+    x, y, z = p
+    angles = np.arange(0, base_count) / base_count * math.pi * 2
+    base = np.zeros((base_count, 3))
+    base[:, 0] = radius * np.cos(angles)
+    base[:, 2] = radius * np.sin(angles)
+    top = np.array([(x, y + height, z)])
+    # The base, the sides and the outline only differs by their colors.
+    vertices = np.concatenate((base, base, top, base, top))
+    colors = [(0.4, 0.7, 1.0, 1.0)] * base_count + [fill_color] * (base_count + 1) + [outline_color] * (base_count + 1)
+    i = np.arange(0, base_count)
+    n = (i + 1) % base_count
+    side = base_count
+    outline = base_count * 2 + 1
+    triangles = np.concatenate((
+        np.array(_polygon_triangles(base_count)),
+        np.stack((side + i, side + n, np.full(base_count, side + base_count)), axis=1),
+    ))
+    lines = np.concatenate((
+        np.stack((outline + i, np.full(base_count, outline + base_count)), axis=1),
+        np.stack((outline + i, outline + n), axis=1),
+    ))
+    return _mesh(vertices, colors, triangles, lines)
+
+def _segment_counts(finest, coarsest):
+    '''Halve the number of segments from finest until it reaches coarsest.'''
+    if coarsest < 3 or finest < coarsest:
+        raise ValueError("trying to build levels from {} down to {} segments".format(finest, coarsest))
+    counts = [finest]
+    while counts[-1] // 2 >= coarsest:
+        counts.append(counts[-1] // 2)
+    if counts[-1] != coarsest:
+        counts.append(coarsest)
+    return counts
+
+def circle_lod(radius, segments = 48, min_segments = 6, color = (0.4, 0.7, 1.0, 1.0)):
+    '''Create a circle with several levels of detail, the number of segments is halved at each level.
+    Args:
+        radius (float): the radius of the circle.
+        segments (int): the number of segments of the finest level.
+        min_segments (int): the number of segments of the coarsest level.
+    Returns:
+        Renderable: a 2D circle object, drawn with fewer segments as it gets smaller on screen.
+    '''
+    counts = _segment_counts(segments, min_segments)
+    return Renderable(LODChain([circle_mesh(radius, n, color) for n in counts], segment_sizes(counts)))
+
+def pyramid_lod(p, height, radius, base_count=32, min_base_count=4, fill_color=(0.4, 0.7, 1.0, 1.0), outline_color=(0.1, 0.4, 0.7, 1.0)):
+    '''Create a pyramid with several levels of detail, the number of corners of the base is halved at each level.
+    With many corners the pyramid is a cone, drawn with fewer corners as it gets smaller on screen.
+    Args:
+        p (tuple): len(p) == 3, represents x, y and z of the position of the newly created pyramid.
+        height (float): height of the pyramid.
+        radius (float): radius of the base of the pyramid.
+        base_count (int): the number of corner vertices of the finest level.
+        min_base_count (int): the number of corner vertices of the coarsest level.
+    Returns:
+        Renderable: a pyramid object.
+    '''
+    counts = _segment_counts(base_count, min_base_count)
+    levels = [pyramid_mesh(p, height, radius, n, fill_color, outline_color) for n in counts]
+    return Renderable(LODChain(levels, segment_sizes(counts)))
+
+def _translations(points):
+    '''Translation matrices to each point, as a (n, 4, 4) array.'''
+    points = to_points(points).astype(np.float32)
+    matrices = np.tile(np.identity(4, dtype=np.float32), (len(points), 1, 1))
+    matrices[:, 3, :3] = points
+    return matrices
+
+def cubes(points, size, fill_color = (0.4, 0.7, 1.0, 1.0), outline_color = (0.1, 0.4, 0.7, 1.0), colors=None):
+    '''Create many identical cubes sharing a single mesh.
+    Args:
+        points (list): list of Vector or tuple, or a VectorArray, the position of each cube.
+        size (float): the size of the cubes.
+        colors (array like): the color of each cube, multiplying the fill and outline colors.
+    Returns:
+        InstancedMesh: the cubes.
+    '''
+    return InstancedMesh(cube_mesh((0, 0, 0), size, fill_color, outline_color), _translations(points), colors)
+
+def pyramids(points, height, radius, base_count=4, fill_color=(0.4, 0.7, 1.0, 1.0), outline_color=(0.1, 0.4, 0.7, 1.0), colors=None):
+    '''Create many identical pyramids sharing a single mesh.
+    Args:
+        points (list): list of Vector or tuple, or a VectorArray, the center of the base of each pyramid.
+        height (float): the height of the pyramids.
+        radius (float): the radius of the base of the pyramids.
+        base_count (int): the number of vertices of the base.
+        colors (array like): the color of each pyramid, multiplying the fill and outline colors.
+    Returns:
+        InstancedMesh: the pyramids.
+    '''
+    return InstancedMesh(pyramid_mesh((0, 0, 0), height, radius, base_count, fill_color, outline_color), _translations(points), colors)
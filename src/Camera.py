@@ -1,11 +1,9 @@
 from OpenGL.GLUT import *
 from .Renderable import TransformationMatrix
 from .Renderable import Transform
+from .Renderable import Quaternion
 from .Renderable import Vector
 import math
-import threading
-import time
-from functools import reduce
 from .InputHandler import *
 
 class Camera:
@@ -32,29 +30,50 @@ class Camera:
     position = property(get_position, set_position)
     rotation = property(get_rotation, set_rotation)
 
-    def reset(self):
-        # Set positional matrix.
-        x, y, z = self.transform.position
-        self.positional_matrix = TransformationMatrix.translate(x, y, z)
-        # Set rotational matrix.
+    def get_orientation(self):
+        '''Returns the rotation of the camera as a Quaternion.'''
+        if isinstance(self.transform.rotation, Quaternion):
+            return self.transform.rotation
+        # Euler angles of the camera turn the other way around the y axis.
         rx, ry, rz = self.transform.rotation
-        self.rotational_matrix = TransformationMatrix.from_euler_angles(rx, -ry, rz)
+        return Quaternion.from_euler_angles(rx, -ry, rz)
+
+    orientation = property(get_orientation)
+
+    def reset(self):
         # Set the actual matrix of the camera.
-        self.matrix.set_identity()
-        self.matrix.multiply(self.positional_matrix)
-        self.matrix.multiply(self.rotational_matrix)
+        self.transform.reset(self.orientation)
+        self.positional_matrix = self.transform.positional_matrix
+        self.rotational_matrix = self.transform.rotational_matrix
     
-class CameraController(threading.Thread):
+class CameraController:
+    '''Moves a camera with the keyboard and rotates it by dragging the mouse.
+    The controller is updated at every step of the update loop with the duration
+    of the step. Input events are folded into the state of the binded keys and the
+    mouse movement as they arrive, so no release is ever lost; it does nothing while
+    no binded key or mouse button is pressed. The rotation of the camera has to be euler angles.
+    '''
+
+    # Horizontal movement angle of each combination of forward, leftward, backward and rightward keys.
+    DIRECTIONS = {
+        (1, 0, 0, 0): 0, # Forward.
+        (0, 1, 0, 0): 90, # Left.
+        (0, 0, 1, 0): 180, # Backward.
+        (0, 0, 0, 1): 270, # Right.
+        (1, 1, 0, 0): 45, # Forward Left.
+        (1, 0, 0, 1): 315, # Forward Right.
+        (0, 1, 1, 0): 135, # Backward Left.
+        (0, 0, 1, 1): 225, # Backward Right.
+    }
 
     def __init__(self, camera, movement_speed, rotation_speed, key_forward=b'w', key_backward=b's', key_leftward=b'a', key_rightward=b'd', key_upward=b' ', key_downward=b'x'):
-        super().__init__()
         # The camera to controll.
         self.camera = camera
         # Movement speed of the camera (unit/s).
         self.movement_speed = movement_speed
         # Rotation speed of the camera (deg/s)
         self.rotation_speed = rotation_speed
-        # Whether this thread is running or not.
+        # Whether this controller is listening to the inputs or not.
         self.running = False
         # Key Bindings.
         self.key_forward = key_forward
@@ -63,116 +82,118 @@ class CameraController(threading.Thread):
         self.key_rightward = key_rightward
         self.key_upward = key_upward
         self.key_downward = key_downward
-        
+        # Binded keys currently pressed.
+        self._held = set()
+        # Whether the camera is rotating, while the left mouse button is pressed.
+        self._rotating = False
+        self._last_mouse_position = None
+        # Mouse movement since the last update.
+        self._dx = 0
+        self._dy = 0
+
+    def start(self):
+        '''Start listening to the inputs.'''
+        if not self.running:
+            self._euler_angles()
+            add_listener(self.handle_event)
+            self.running = True
+
     def stop_listening(self):
         self.running = False
-        
-    def run(self):
-        global mouse_position
-        # Horizontal movement keybind.
-        binded = [self.key_forward, self.key_leftward, self.key_backward, self.key_rightward]
-        # Set this thread as running.
-        self.running = True
-        # Delay between the loops.
-        delay = 0.01
-        # Previous time before current loop.
-        last_time = time.time()
-        # Store the position of the mouse in the last loop.
-        last_mouse_position = get_mouse_position()
-        # Whether the camera is rotating; used for ignoring the first mouse click.
-        # The first click is ignored as to initialize the last_mouse_position.
-        rotating_camera = False
-        while self.running:
-            # Handle time changes.
-            current_time = time.time()
-            delta = (current_time - last_time)
-            # Handles camera movements.
-            if (self.movement_speed != 0):
-                # The combination of the keybind.
-                combination = tuple(is_key_down(x) for x in binded)
-                # True if any key is pressed; otherwise false.
-                any_down = reduce(lambda x, y: x or y, combination)
-                # The movement direction of the camera.
-                direction = (0, 0, 0)
-                if any_down: # Get horizontal movement, only if a key binded to the movement is pressed.
-                    # -1 notates that no movement should be made.
-                    angle = -1
-                    if combination == (1, 0, 0, 0):
-                        # Forward.
-                        angle = 0
-                    elif combination == (0, 1, 0, 0):
-                        # Left.
-                        angle = 90
-                    elif combination == (0, 0, 1, 0):
-                        # Backward.
-                        angle = 180
-                    elif combination == (0, 0, 0, 1):
-                        # Right.
-                        angle = 270
-                    elif combination == (1, 1, 0, 0):
-                        # Forward Left.
-                        angle = 45
-                    elif combination == (1, 0, 0, 1):
-                        # Forward Right.
-                        angle = 315
-                    elif combination == (0, 1, 1, 0):
-                        # Backward Left.
-                        angle = 135
-                    elif combination == (0, 0, 1, 1):
-                        # Backward Right.
-                        angle = 225
-                    if angle != -1:
-                        # Set the x and z components of the direction based on the movement angle.
-                        angle = math.radians(angle)
-                        direction = (math.sin(angle), 0, math.cos(angle))   
-                if is_key_down(self.key_upward) and not is_key_down(self.key_downward): # Get upwards movement.
-                    direction = (direction[0], 1, direction[2])
-                elif not is_key_down(self.key_upward) and is_key_down(self.key_downward): # Get downwards movement.
-                    direction = (direction[0], -1, direction[2])
-                # Apply changes if changes were made.
-                if direction != (0, 0, 0):
-                    # Normalize the direction vector.
-                    direction = Vector.normalize(direction)
-                    # Seperate the x, y and z component of the vector.
-                    x, y, z = direction
-                    # Reverse the y component, this is primarily because the renderer is reversed for y axis.
-                    y = -y
-                    # Rotate the direction based on the camera's rotation.
-                    # Doesn't use rotation through z axis.
-                    rx, ry, _ = self.camera.rotation
-                    # Convert the angle to radians.
-                    rx = math.radians(-rx)
-                    ry = math.radians(ry)
-                    # Set the new direction vector.
-                    direction = (
-                        x * math.cos(ry) + y * math.sin(rx) * math.sin(math.pi - ry) + z * math.cos(rx) * math.sin(-ry),
-                        y * math.cos(rx) + z * math.sin(rx),
-                        x * math.sin(ry) + y * math.sin(rx) * math.cos(math.pi - ry) + z * math.cos(rx) * math.cos(-ry),
-                    )
-                    # Offset the camera's position.
-                    self.camera.position = tuple(self.camera.position[i] + (self.movement_speed * delta * direction[i]) for i in range(0, 3))
-                    self.camera.reset()
-            # Handles camera rotation.
-            if rotating_camera:
-                # Handles mouse position delta.
-                dx, dy = get_mouse_x() - last_mouse_position[0], get_mouse_y() - last_mouse_position[1]
-                # Only triggers if there is any changes to the mouse position.
-                if dx != 0 and dy != 0:
-                    # Get the window size.
-                    width = glutGet(GLUT_WINDOW_WIDTH)
-                    height = glutGet(GLUT_WINDOW_HEIGHT)
-                    x, y, z = self.camera.rotation
-                    if dy != 0:
-                        x += dy / height * self.rotation_speed
-                    if dx != 0:
-                        y += -dx / width * self.rotation_speed
-                    self.camera.rotation = (x, y, z)
-                    self.camera.reset()
-            # Camera only rotates if the left mouse button is pressed.
-            rotating_camera = (self.rotation_speed != 0) and is_mouse_down(0)
-            # Save the mouse position for the next loops.
-            last_mouse_position = get_mouse_position()
-            # Updates time for the next loops.
-            last_time = current_time
-            time.sleep(delay)
+        remove_listener(self.handle_event)
+        self._held.clear()
+        self._rotating = False
+        self._dx = 0
+        self._dy = 0
+
+    def is_active(self):
+        '''Returns true if the next update may move the camera.'''
+        return self.running and bool(self._held or self._dx or self._dy)
+
+    def _euler_angles(self):
+        rotation = self.camera.rotation
+        if isinstance(rotation, Quaternion) or not isinstance(rotation, (tuple, list)) or len(rotation) != 3:
+            raise TypeError("CameraController needs the rotation of the camera to be euler angles, got {}".format(rotation.__class__.__name__))
+        return rotation
+
+    def handle_event(self, event):
+        '''Update the state of the binded keys and of the mouse from an input event.'''
+        kind, key, x, y = event
+        if kind == KEY_DOWN:
+            if key in (self.key_forward, self.key_backward, self.key_leftward, self.key_rightward, self.key_upward, self.key_downward):
+                self._held.add(key)
+        elif kind == KEY_UP:
+            self._held.discard(key)
+        elif kind == MOUSE_DOWN:
+            if key == 0 and self.rotation_speed != 0:
+                # The first position is only used as the origin of the movement.
+                self._rotating = True
+                self._last_mouse_position = (x, y)
+        elif kind == MOUSE_UP:
+            if key == 0:
+                self._rotating = False
+        elif kind == MOUSE_MOVE:
+            if self._rotating:
+                self._dx += x - self._last_mouse_position[0]
+                self._dy += y - self._last_mouse_position[1]
+                self._last_mouse_position = (x, y)
+
+    def update(self, delta, width, height):
+        '''Move and rotate the camera, called at every step of the update loop.
+        Args:
+            delta (float): the duration of the step, in seconds.
+            width (int): the width of the window.
+            height (int): the height of the window.
+        '''
+        if not self.running:
+            return
+        if self._held and self.movement_speed != 0:
+            self._move(delta)
+        if self._dx or self._dy:
+            self._rotate(self._dx, self._dy, width, height)
+            self._dx = 0
+            self._dy = 0
+
+    def _move(self, delta):
+        held = self._held
+        # The combination of the horizontal movement keybind.
+        combination = tuple(int(k in held) for k in (self.key_forward, self.key_leftward, self.key_backward, self.key_rightward))
+        # The movement direction of the camera.
+        direction = (0, 0, 0)
+        angle = self.DIRECTIONS.get(combination)
+        if angle is not None:
+            # Set the x and z components of the direction based on the movement angle.
+            angle = math.radians(angle)
+            direction = (math.sin(angle), 0, math.cos(angle))
+        if self.key_upward in held and self.key_downward not in held: # Get upwards movement.
+            direction = (direction[0], 1, direction[2])
+        elif self.key_upward not in held and self.key_downward in held: # Get downwards movement.
+            direction = (direction[0], -1, direction[2])
+        # Apply changes if changes were made.
+        if direction != (0, 0, 0):
+            # Normalize the direction vector.
+            direction = Vector.normalize(direction)
+            # Seperate the x, y and z component of the vector.
+            x, y, z = direction
+            # Reverse the y component, this is primarily because the renderer is reversed for y axis.
+            y = -y
+            # Rotate the direction based on the camera's rotation.
+            # Doesn't use rotation through z axis.
+            rx, ry, _ = self._euler_angles()
+            # Convert the angle to radians.
+            rx = math.radians(-rx)
+            ry = math.radians(ry)
+            # Set the new direction vector.
+            direction = (
+                x * math.cos(ry) + y * math.sin(rx) * math.sin(math.pi - ry) + z * math.cos(rx) * math.sin(-ry),
+                y * math.cos(rx) + z * math.sin(rx),
+                x * math.sin(ry) + y * math.sin(rx) * math.cos(math.pi - ry) + z * math.cos(rx) * math.cos(-ry),
+            )
+            # Offset the camera's position.
+            self.camera.position = tuple(self.camera.position[i] + (self.movement_speed * delta * direction[i]) for i in range(0, 3))
 
+    def _rotate(self, dx, dy, width, height):
+        x, y, z = self._euler_angles()
+        x += dy / height * self.rotation_speed
+        y += -dx / width * self.rotation_speed
+        self.camera.rotation = (x, y, z)
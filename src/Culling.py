@@ -0,0 +1,99 @@
+from .Renderable import TransformationMatrix
+import numpy as np
+
+class Frustum:
+    '''The volume seen by the camera, bounded by 6 planes facing inward.
+    Args:
+        matrix (numpy.ndarray): 4x4 array of the transformation from the space of the objects to the clip space.
+    '''
+
+    def __init__(self, matrix):
+        matrix = np.asarray(matrix, dtype=np.float64)
+        # Points are row vectors, each clip coordinate is the dot product with a column.
+        x, y, z, w = matrix[:, 0], matrix[:, 1], matrix[:, 2], matrix[:, 3]
+        # Left, right, bottom, top, near and far planes as a, b, c, d with ax + by + cz + d >= 0 inside.
+        planes = np.stack((w + x, w - x, w + y, w - y, w + z, w - z))
+        self.planes = planes / np.linalg.norm(planes[:, :3], axis=1)[:, None]
+
+    @staticmethod
+    def from_camera(camera, fov, aspect, near, far, model=None):
+        '''Build the frustum of a camera.
+        Args:
+            camera (Camera): the camera.
+            fov (float): vertical field of view in degrees.
+            aspect (float): width / height.
+            near (float): distance to the near plane.
+            far (float): distance to the far plane.
+            model (numpy.ndarray): 4x4 array of the transformation applied to the objects before the camera.
+        '''
+        matrix = np.matmul(camera.matrix.array, TransformationMatrix.perspective(fov, aspect, near, far).array)
+        if model is not None:
+            matrix = np.matmul(model, matrix)
+        return Frustum(matrix)
+
+    def intersects_boxes(self, lows, highs):
+        '''Test many axis aligned boxes at once.
+        A box is only rejected when it lies entirely outside one of the planes, so a few boxes
+        near the corners of the frustum are kept although they are not visible.
+        Args:
+            lows (array like): (n, 3) array of the minimum corners.
+            highs (array like): (n, 3) array of the maximum corners.
+        Returns:
+            numpy.ndarray: (n,) boolean array, true for the boxes that may be visible.
+        '''
+        lows = np.asarray(lows, dtype=np.float64).reshape(-1, 3)
+        highs = np.asarray(highs, dtype=np.float64).reshape(-1, 3)
+        normals = self.planes[:, :3]
+        empty = (lows > highs).any(axis=1)
+        # The corner of each box farthest along the normal of each plane.
+        corners = np.where(normals >= 0, highs[:, None, :], lows[:, None, :])
+        corners[empty] = 0
+        distances = np.einsum('npi,pi->np', corners, normals) + self.planes[:, 3]
+        return (distances >= 0).all(axis=1) & ~empty
+
+    def intersects_box(self, low, high):
+        return bool(self.intersects_boxes(low, high)[0])
+
+    def intersects_spheres(self, centers, radii):
+        '''Test many spheres at once.
+        Args:
+            centers (array like): (n, 3) array of the centers.
+            radii (array like): (n,) array of the radii.
+        Returns:
+            numpy.ndarray: (n,) boolean array, true for the spheres that may be visible.
+        '''
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+        radii = np.asarray(radii, dtype=np.float64).reshape(-1)
+        distances = np.matmul(centers, self.planes[:, :3].T) + self.planes[:, 3]
+        return (distances >= -radii[:, None]).all(axis=1)
+
+    def intersects_sphere(self, center, radius):
+        return bool(self.intersects_spheres(center, radius)[0])
+
+def cull(objects, frustum):
+    '''Find the objects that may be visible.
+    Objects without bounds are always kept.
+    Args:
+        objects (list): the renderables and meshes to test.
+        frustum (Frustum): the volume seen by the camera.
+    Returns:
+        list: the indices of the objects that may be visible, in order.
+    '''
+    kept = []
+    tested = []
+    lows = []
+    highs = []
+    for i, obj in enumerate(objects):
+        get_bounds = getattr(obj, 'get_bounds', None)
+        bounds = get_bounds() if get_bounds else None
+        if bounds is None:
+            kept.append(i)
+        else:
+            tested.append(i)
+            lows.append(bounds[0])
+            highs.append(bounds[1])
+    if tested:
+        visible = frustum.intersects_boxes(lows, highs)
+        kept.extend(i for i, v in zip(tested, visible.tolist()) if v)
+        kept.sort()
+    return kept
@@ -0,0 +1,193 @@
+from .Renderable import TransformationMatrix, TransformationStack
+from collections import deque
+import weakref
+
+# Number of edits kept by default.
+DEFAULT_LIMIT = 100
+
+class TransformationEdit:
+    '''Matrices pushed to or popped from the top of a transformation stack.
+    Args:
+        stack (TransformationStack): the edited stack.
+        matrices (list): the matrices, in the order they are in the stack.
+        pushed (bool): true if the matrices were pushed, false if they were popped.
+    '''
+
+    __slots__ = ('stack', 'matrices', 'versions', 'pushed')
+
+    def __init__(self, stack, matrices, pushed=True):
+        self.stack = stack
+        self.matrices = list(matrices)
+        # Versions of the matrices when the edit was made, a matrix changed since then is live.
+        self.versions = [getattr(m, 'version', None) for m in self.matrices]
+        self.pushed = pushed
+
+    def _on_top(self):
+        count = len(self.matrices)
+        top = self.stack[len(self.stack) - count:]
+        return len(top) == count and all(a is b for a, b in zip(top, self.matrices))
+
+    def _remove(self):
+        if not self._on_top():
+            raise ValueError("the stack changed since the edit, it cannot be reverted")
+        del self.stack[len(self.stack) - len(self.matrices):]
+
+    def undo(self):
+        if self.pushed:
+            self._remove()
+        else:
+            self.stack.extend(self.matrices)
+
+    def redo(self):
+        if self.pushed:
+            self.stack.extend(self.matrices)
+        else:
+            self._remove()
+
+    def bake(self, baked, is_live=None):
+        '''Merge the matrices of a push into the matrix baked just below them, if any.
+        Only the matrices pushed by this edit that did not change since are merged, along with a
+        matrix baked by a previous call right below them; everything else in the stack, such as the
+        matrix of the transform of a renderable or a matrix changed by an animation, stays in place.
+        Args:
+            baked (weakref.WeakSet): the matrices baked by the history, updated with the new ones.
+            is_live (function): returns true for a matrix that may still change and must not be baked.
+        '''
+        if not self.pushed or not self.matrices:
+            return
+        stack = self.stack
+        first = self.matrices[0]
+        for start, matrix in enumerate(stack):
+            if matrix is first:
+                break
+        else:
+            return
+        end = start + len(self.matrices)
+        if not all(a is b for a, b in zip(stack[start:end], self.matrices)) or end > len(stack):
+            return
+        # Split the matrices in runs of static ones, separated by the live ones.
+        runs, run = [], []
+        for index, matrix, version in zip(range(start, end), self.matrices, self.versions):
+            static = isinstance(matrix, TransformationMatrix) and matrix.version == version and not (is_live and is_live(matrix))
+            if static:
+                run.append(index)
+            elif run:
+                runs.append(run)
+                run = []
+        if run:
+            runs.append(run)
+        # Replace from the top so that the indices of the lower runs stay valid.
+        for run in reversed(runs):
+            low, high = run[0], run[-1] + 1
+            if low > 0 and stack[low - 1] in baked:
+                low -= 1
+            matrix = TransformationMatrix(TransformationStack(stack[low:high]).composite().array)
+            baked.add(matrix)
+            stack[low:high] = [matrix]
+
+class CommandHistory:
+    '''Undo and redo log of the edits of the transformation stacks, kept apart from the stacks.
+    Undoing and redoing move an edit from one end of a list to the other and only touch the
+    matrices of that edit, the stacks keep only the matrices in effect. Past limit edits,
+    the oldest is dropped from the log; when it pushed matrices, they are baked into the matrix
+    baked before them, so the matrices nothing can undo anymore take a single place in the stack.
+    Only matrices pushed through the history and not changed since are baked; the other matrices of
+    the stacks, and the matrices is_live returns true for, stay in place and are never merged.
+    Args:
+        limit (int): the most edits that can be undone.
+        is_live (function): returns true for a matrix that may still change, e.g. one moved by an animation.
+    '''
+
+    def __init__(self, limit=DEFAULT_LIMIT, is_live=None):
+        self._undo = deque()
+        self._redo = []
+        self.is_live = is_live
+        # The matrices made by baking, a later bake merges into them.
+        self._baked = weakref.WeakSet()
+        self._limit = DEFAULT_LIMIT
+        self.set_limit(limit)
+
+    def __len__(self):
+        return len(self._undo)
+
+    def get_limit(self):
+        return self._limit
+
+    def set_limit(self, limit):
+        if not isinstance(limit, int):
+            raise TypeError("expected the limit to be an int, got {}".format(limit.__class__.__name__))
+        if limit < 0:
+            raise ValueError("the limit cannot be negative, got {}".format(limit))
+        self._limit = limit
+        self._compact()
+        del self._redo[limit:]
+
+    def _compact(self):
+        while len(self._undo) > self._limit:
+            self._undo.popleft().bake(self._baked, self.is_live)
+
+    def record(self, stack, matrices, pushed=True):
+        '''Log an edit that was just applied to a stack; clears what could be redone.
+        Args:
+            stack (TransformationStack): the edited stack.
+            matrices (list): the matrices pushed or popped, in the order they are in the stack.
+            pushed (bool): true if the matrices were pushed, false if they were popped.
+        '''
+        if not matrices:
+            return
+        self._redo.clear()
+        self._undo.append(TransformationEdit(stack, matrices, pushed))
+        self._compact()
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    def undo(self):
+        '''Revert the last edit.
+        Returns:
+            TransformationEdit: the reverted edit, or None if there is nothing to undo.
+        '''
+        if not self._undo:
+            return None
+        edit = self._undo.pop()
+        try:
+            edit.undo()
+        except ValueError:
+            self._undo.append(edit)
+            raise
+        self._redo.append(edit)
+        return edit
+
+    def redo(self):
+        '''Apply the last reverted edit again.
+        Returns:
+            TransformationEdit: the applied edit, or None if there is nothing to redo.
+        '''
+        if not self._redo:
+            return None
+        edit = self._redo.pop()
+        try:
+            edit.redo()
+        except ValueError:
+            self._redo.append(edit)
+            raise
+        self._undo.append(edit)
+        return edit
+
+    def clear_redo(self):
+        '''Forget the edits that could be redone.'''
+        self._redo.clear()
+
+    def forget(self, stack):
+        '''Forget every edit of a stack, e.g. once its renderable is deleted.'''
+        self._undo = deque(edit for edit in self._undo if edit.stack is not stack)
+        self._redo = [edit for edit in self._redo if edit.stack is not stack]
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+
+    limit = property(get_limit, set_limit)
@@ -0,0 +1,522 @@
+from .Mesh import Mesh, DEFAULT_COLOR, to_rgba
+import numpy as np
+import json
+import os
+import re
+
+# Number of bytes parsed at once, files are never read whole.
+CHUNK_SIZE = 1 << 22
+# Appended to the path of a model to name its cache.
+CACHE_EXTENSION = '.meshcache'
+
+_CACHE_MAGIC = b'SPGLMESH'
+_CACHE_VERSION = 1
+# Arrays in the cache start at a multiple of this many bytes.
+_CACHE_ALIGNMENT = 64
+# Texture and normal indices of OBJ faces, as in 'f 1/2/3 4/5/6 7/8/9'.
+_OBJ_SLASHES = re.compile(rb'/\S*')
+
+def _fan(counts, indices):
+    '''Split polygons into fans of triangles.
+    Args:
+        counts (numpy.ndarray): the number of vertices of each polygon.
+        indices (numpy.ndarray): the vertex indices of every polygon, one after the other.
+    Returns:
+        numpy.ndarray: (t, 3) array of vertex indices.
+    '''
+    counts = np.asarray(counts, dtype=np.int64)
+    starts = np.cumsum(counts) - counts
+    fans = np.maximum(counts - 2, 0)
+    if len(counts) and (counts == counts[0]).all():
+        # Every polygon has the same number of vertices, no need to repeat the starts.
+        if fans[0] == 0:
+            return np.empty((0, 3), dtype=indices.dtype)
+        polygons = indices.reshape(-1, counts[0])
+        corners = np.arange(1, counts[0] - 1)
+        return np.stack((np.repeat(polygons[:, :1], fans[0], axis=1), polygons[:, corners], polygons[:, corners + 1]), axis=2).reshape(-1, 3)
+    first = np.repeat(starts, fans)
+    corner = np.arange(len(first)) - np.repeat(np.cumsum(fans) - fans, fans) + 1
+    return np.stack((indices[first], indices[first + corner], indices[first + corner + 1]), axis=1)
+
+def _segments(counts, indices):
+    '''Split polylines into segments, the arguments are the same as _fan.'''
+    counts = np.asarray(counts, dtype=np.int64)
+    starts = np.cumsum(counts) - counts
+    pieces = np.maximum(counts - 1, 0)
+    first = np.repeat(starts, pieces) + np.arange(pieces.sum()) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    return np.stack((indices[first], indices[first + 1]), axis=1)
+
+def _to_indices(indices, count):
+    '''Returns vertex indices as uint32, after checking they refer to one of count vertices.'''
+    if indices.size and (indices.min() < 0 or indices.max() >= count):
+        raise ValueError("vertex index {} is out of range, the model has {} vertices".format(
+            indices.min() if indices.min() < 0 else indices.max(), count))
+    return indices.astype(np.uint32)
+
+def _concatenate(chunks, width, dtype):
+    if not chunks:
+        return np.empty((0, width), dtype=dtype)
+    return np.concatenate(chunks).astype(dtype, copy=False).reshape(-1, width)
+
+def _count_tokens(data):
+    '''Returns the number of words on each line of a text, every line must end with a new line.
+    Args:
+        data (numpy.ndarray): the bytes of the text as uint8.
+    '''
+    space = (data == 32) | (data == 9) | (data == 10) | (data == 13)
+    starts = ~space
+    starts[1:] &= space[:-1]
+    words = np.cumsum(starts)[data == 10]
+    return np.diff(words, prepend=0)
+
+def _obj_statements(data, tag):
+    '''Returns the bytes of the statements of a chunk with a tag, the tag removed.
+    Args:
+        data (numpy.ndarray): the bytes of whole lines as uint8, ending with a new line.
+        tag (bytes): a one letter tag, such as b'v'.
+    Returns:
+        tuple: the bytes as uint8, and the mask of the lines of the chunk having the tag.
+    '''
+    newline = data == 10
+    starts = np.flatnonzero(newline[:-1]) + 1
+    starts = np.concatenate(([0], starts))
+    second = data[np.minimum(starts + 1, len(data) - 1)]
+    mask = (data[starts] == ord(tag)) & ((second == 32) | (second == 9))
+    if not mask.any():
+        return data[:0], mask
+    # Index of the line of every byte, a new line belongs to the line it ends.
+    line = np.cumsum(newline) - newline
+    keep = mask[line]
+    keep[starts[mask]] = False
+    keep[starts[mask] + 1] = False
+    return data[keep], mask
+
+def _obj_indices(data):
+    '''Parse the vertex references of OBJ faces or lines.
+    Args:
+        data (numpy.ndarray): the bytes of the statements without their tag, see _obj_statements.
+    Returns:
+        tuple: the number of vertices of each statement, and their indices one after the other as written in the file.
+    '''
+    counts = _count_tokens(data)
+    text = data.tobytes()
+    if b'/' in text:
+        # Keep the first number of every 'v/vt/vn' reference, parsing them all is faster
+        # than removing the others when every reference has the same form.
+        text = text.replace(b'//', b'/0/')
+        parts = text.split(None, 1)[0].count(b'/') + 1
+        values = np.fromstring(text.replace(b'/', b' '), dtype=np.int64, sep=' ')
+        if len(values) == parts * counts.sum():
+            return counts, values[::parts]
+        text = _OBJ_SLASHES.sub(b'', text)
+    return counts, np.fromstring(text, dtype=np.int64, sep=' ')
+
+def read_obj(path, chunk_size=CHUNK_SIZE):
+    '''Read the vertices, faces and lines of a Wavefront OBJ file.
+    Faces with more than 3 vertices are split into triangles; texture coordinates, normals,
+    groups and materials are ignored. Colors written after the position of a vertex are kept.
+    Args:
+        path (str): the path of the file.
+        chunk_size (int): the number of bytes parsed at once.
+    Returns:
+        dict: the 'vertices', 'triangles' and 'lines' arrays, and 'colors' if the vertices have colors.
+    '''
+    vertices, colors, triangles, lines = [], [], [], []
+    # Number of vertices in the previous chunks.
+    count = 0
+    with open(path, 'rb') as f:
+        while True:
+            # Read whole lines only.
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            chunk += f.readline()
+            if not chunk.endswith(b'\n'):
+                chunk += b'\n'
+            data = np.frombuffer(chunk, dtype=np.uint8)
+            text, is_vertex = _obj_statements(data, b'v')
+            if len(text):
+                columns = _count_tokens(text)
+                values = np.fromstring(text.tobytes(), sep=' ')
+                if len(values) != columns.sum() or columns.min() < 3:
+                    raise ValueError("invalid vertex in '{}'".format(path))
+                # The 4th value is the weight of rational curves, only the 6 values vertices have colors.
+                starts = np.cumsum(columns) - columns
+                xyz = values[starts[:, None] + np.arange(3)]
+                rgb = None
+                if (columns >= 6).any():
+                    rgb = np.full((len(columns), 3), np.nan)
+                    has_color = columns >= 6
+                    rgb[has_color] = values[starts[has_color, None] + np.arange(3, 6)]
+                if rgb is not None and not colors and count:
+                    colors.append(np.full((count, 3), np.nan))
+                if rgb is not None or colors:
+                    colors.append(rgb if rgb is not None else np.full((len(xyz), 3), np.nan))
+                vertices.append(xyz.astype(np.float32))
+            for tag, output, split in ((b'f', triangles, _fan), (b'l', lines, _segments)):
+                text, mask = _obj_statements(data, tag)
+                if not len(text):
+                    continue
+                counts, indices = _obj_indices(text)
+                if counts.sum() != len(indices):
+                    raise ValueError("invalid {} in '{}'".format('face' if split is _fan else 'line', path))
+                negative = indices < 0
+                if negative.any():
+                    # Negative indices count back from the last vertex read before the statement.
+                    before = (np.cumsum(is_vertex) - is_vertex)[mask]
+                    base = np.repeat(count + before, counts)
+                    indices[negative] += base[negative] + 1
+                output.append(split(counts, indices - 1))
+            count += int(is_vertex.sum())
+    retval = {
+        'vertices': _concatenate(vertices, 3, np.float32),
+        'triangles': _to_indices(_concatenate(triangles, 3, np.int64), count),
+        'lines': _to_indices(_concatenate(lines, 2, np.int64), count),
+    }
+    if colors:
+        rgb = _concatenate(colors, 3, np.float64)
+        if len(rgb) < count:
+            rgb = np.concatenate((rgb, np.full((count - len(rgb), 3), np.nan)))
+        retval['colors'] = _rgba(rgb)
+    return retval
+
+def _rgba(rgb, alpha=None):
+    '''Returns (n, 4) float32 colors, the missing (nan) colors are set to DEFAULT_COLOR.'''
+    colors = np.empty((len(rgb), 4), dtype=np.float32)
+    colors[:, :3] = rgb
+    colors[:, 3] = 1.0 if alpha is None else alpha
+    missing = np.isnan(colors).any(axis=1)
+    colors[missing] = DEFAULT_COLOR
+    return colors
+
+# Types of the PLY properties.
+_PLY_TYPES = {
+    'char': 'i1', 'uchar': 'u1', 'short': 'i2', 'ushort': 'u2', 'int': 'i4', 'uint': 'u4', 'float': 'f4', 'double': 'f8',
+    'int8': 'i1', 'uint8': 'u1', 'int16': 'i2', 'uint16': 'u2', 'int32': 'i4', 'uint32': 'u4', 'float32': 'f4', 'float64': 'f8',
+}
+
+def _ply_header(f, path):
+    '''Read the header of a PLY file.
+    Returns:
+        tuple: the format, and the list of elements as (name, count, properties).
+            A property is (name, type), or (name, count type, item type) for lists.
+    '''
+    if f.readline().strip() != b'ply':
+        raise ValueError("'{}' is not a PLY file".format(path))
+    fmt = None
+    elements = []
+    for line in iter(f.readline, b''):
+        words = line.decode('ascii', 'replace').split()
+        if not words or words[0] in ('comment', 'obj_info'):
+            continue
+        if words[0] == 'end_header':
+            break
+        if words[0] == 'format':
+            fmt = words[1]
+        elif words[0] == 'element':
+            elements.append((words[1], int(words[2]), []))
+        elif words[0] == 'property':
+            try:
+                if words[1] == 'list':
+                    elements[-1][2].append((words[4], _PLY_TYPES[words[2]], _PLY_TYPES[words[3]]))
+                else:
+                    elements[-1][2].append((words[2], _PLY_TYPES[words[1]]))
+            except (KeyError, IndexError):
+                raise ValueError("invalid property in '{}': {}".format(path, line.strip()))
+    else:
+        raise ValueError("the header of '{}' has no end".format(path))
+    if fmt not in ('ascii', 'binary_little_endian', 'binary_big_endian'):
+        raise ValueError("unknown PLY format in '{}': {}".format(path, fmt))
+    return fmt, elements
+
+def _ply_record(f, properties, order):
+    '''Returns the dtype of the binary record at the position of f, lists take the length of this record.'''
+    start = f.tell()
+    fields = []
+    for prop in properties:
+        if len(prop) == 3:
+            count_type, item_type = np.dtype(order + prop[1]), np.dtype(order + prop[2])
+            data = f.read(count_type.itemsize)
+            if len(data) < count_type.itemsize:
+                raise ValueError("unexpected end of file")
+            n = int(np.frombuffer(data, count_type)[0])
+            f.seek(n * item_type.itemsize, 1)
+            fields.append(('_' + prop[0], count_type))
+            fields.append((prop[0], item_type, (n,)))
+        else:
+            fields.append((prop[0], np.dtype(order + prop[1])))
+    f.seek(start)
+    return np.dtype(fields)
+
+def _ply_binary(f, count, properties, order, chunk_size):
+    '''Read the records of an element of a binary PLY file in chunks.
+    Records with lists are read in runs of records whose lists have the same lengths.
+    '''
+    lists = [prop[0] for prop in properties if len(prop) == 3]
+    dtype = None if lists else _ply_record(f, properties, order)
+    while count:
+        if lists:
+            dtype = _ply_record(f, properties, order)
+        rows = min(count, max(1, chunk_size // dtype.itemsize))
+        start = f.tell()
+        buffer = f.read(rows * dtype.itemsize)
+        data = np.frombuffer(buffer, dtype, len(buffer) // dtype.itemsize)
+        if lists:
+            same = np.ones(len(data), dtype=bool)
+            for name in lists:
+                same &= data['_' + name] == dtype[name].shape[0]
+            if not same.all():
+                # Stop at the first record with other lengths, the next chunk starts from it.
+                data = data[:np.argmin(same)]
+            f.seek(start + len(data) * dtype.itemsize)
+        elif len(data) < rows:
+            raise ValueError("unexpected end of file")
+        if len(data) == 0:
+            raise ValueError("unexpected end of file")
+        count -= len(data)
+        yield data
+
+def _ply_ascii(f, count, properties, chunk_size):
+    '''Read the records of an element of an ascii PLY file in chunks, as lists of values per property.'''
+    while count:
+        block = []
+        size = 0
+        while count and size < chunk_size:
+            line = f.readline()
+            if not line:
+                raise ValueError("unexpected end of file")
+            if line.strip():
+                block.append(line)
+                size += len(line)
+                count -= 1
+        if not any(len(prop) == 3 for prop in properties):
+            values = np.fromstring(b''.join(block).decode('ascii'), sep=' ').reshape(len(block), len(properties))
+            yield {prop[0]: values[:, i] for i, prop in enumerate(properties)}
+            continue
+        records = {prop[0]: [] for prop in properties}
+        for line in block:
+            words = line.split()
+            i = 0
+            for prop in properties:
+                if len(prop) == 3:
+                    n = int(words[i])
+                    records[prop[0]].append(words[i + 1:i + 1 + n])
+                    i += n + 1
+                else:
+                    records[prop[0]].append(words[i])
+                    i += 1
+        yield records
+
+def read_ply(path, chunk_size=CHUNK_SIZE):
+    '''Read the vertices, faces and edges of a PLY file, ascii or binary.
+    Faces with more than 3 vertices are split into triangles; the red, green, blue and alpha
+    properties of the vertices are kept as their colors.
+    Args:
+        path (str): the path of the file.
+        chunk_size (int): the number of bytes parsed at once.
+    Returns:
+        dict: the 'vertices', 'triangles' and 'lines' arrays, and 'colors' if the vertices have colors.
+    '''
+    vertices, colors, triangles, lines = [], [], [], []
+    count = 0
+    with open(path, 'rb') as f:
+        fmt, elements = _ply_header(f, path)
+        order = '>' if fmt == 'binary_big_endian' else '<'
+        for name, n, properties in elements:
+            names = [prop[0] for prop in properties]
+            if fmt == 'ascii':
+                chunks = _ply_ascii(f, n, properties, chunk_size)
+            else:
+                chunks = _ply_binary(f, n, properties, order, chunk_size)
+            for data in chunks:
+                if name == 'vertex':
+                    vertices.append(np.stack([np.asarray(data[axis], dtype=np.float32) for axis in 'xyz'], axis=1))
+                    if 'red' in names:
+                        channels = []
+                        for channel in ('red', 'green', 'blue', 'alpha'):
+                            if channel not in names:
+                                continue
+                            kind = np.dtype(dict(properties)[channel])
+                            values = np.asarray(data[channel], dtype=np.float32)
+                            if kind.kind in 'iu':
+                                # Integer colors go from 0 to the largest value of their type.
+                                values /= np.iinfo(kind).max
+                            channels.append(values)
+                        colors.append(np.stack(channels, axis=1))
+                elif name == 'face':
+                    key = 'vertex_indices' if 'vertex_indices' in names else 'vertex_index'
+                    items = data[key]
+                    if isinstance(items, np.ndarray):
+                        counts = np.full(len(items), items.shape[1] if items.ndim > 1 else 0)
+                        indices = items.ravel()
+                    else:
+                        counts = [len(item) for item in items]
+                        indices = np.array([i for item in items for i in item], dtype=np.int64)
+                    triangles.append(_fan(counts, np.asarray(indices, dtype=np.int64)))
+                elif name == 'edge':
+                    lines.append(np.stack([np.asarray(data[key], dtype=np.int64) for key in ('vertex1', 'vertex2')], axis=1))
+                if name == 'vertex':
+                    count += len(vertices[-1])
+    retval = {
+        'vertices': _concatenate(vertices, 3, np.float32),
+        'triangles': _to_indices(_concatenate(triangles, 3, np.int64), count),
+        'lines': _to_indices(_concatenate(lines, 2, np.int64), count),
+    }
+    if colors:
+        rgba = np.concatenate(colors)
+        retval['colors'] = _rgba(rgba[:, :3], rgba[:, 3] if rgba.shape[1] > 3 else None)
+    return retval
+
+# Layout of a triangle of a binary STL file.
+_STL_TRIANGLE = np.dtype([('normal', '<f4', 3), ('vertices', '<f4', (3, 3)), ('attribute', '<u2')])
+
+def read_stl(path, chunk_size=CHUNK_SIZE):
+    '''Read the triangles of a STL file, ascii or binary.
+    STL stores the corners of every triangle separately, the corners at the same position are merged into one vertex.
+    Args:
+        path (str): the path of the file.
+        chunk_size (int): the number of bytes parsed at once.
+    Returns:
+        dict: the 'vertices', 'triangles' and 'lines' arrays.
+    '''
+    corners = []
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.read(84)
+        n = int(np.frombuffer(header[80:84], '<u4')[0]) if len(header) == 84 else -1
+        if size == 84 + n * _STL_TRIANGLE.itemsize:
+            rows = max(1, chunk_size // _STL_TRIANGLE.itemsize)
+            while n:
+                data = np.fromfile(f, _STL_TRIANGLE, min(n, rows))
+                corners.append(data['vertices'].reshape(-1, 3))
+                n -= len(data)
+        elif header.lstrip().startswith(b'solid'):
+            f.seek(0)
+            while True:
+                block = f.readlines(chunk_size)
+                if not block:
+                    break
+                block = [line.lstrip() for line in block]
+                text = b''.join(line[6:] for line in block if line.startswith(b'vertex'))
+                corners.append(np.fromstring(text.decode('ascii'), sep=' ').reshape(-1, 3))
+        else:
+            raise ValueError("'{}' is not a STL file".format(path))
+    corners = _concatenate(corners, 3, np.float32)
+    if len(corners) % 3:
+        raise ValueError("'{}' has a triangle without 3 vertices".format(path))
+    # Compare the positions as bytes, sorting raw 12 byte records is much faster than sorting rows.
+    corners = np.ascontiguousarray(corners)
+    _, first, inverse = np.unique(corners.view('V12').ravel(), return_index=True, return_inverse=True)
+    return {
+        'vertices': corners[first],
+        'triangles': inverse.astype(np.uint32).reshape(-1, 3),
+        'lines': np.empty((0, 2), dtype=np.uint32),
+    }
+
+# The readers of each file extension.
+READERS = {
+    '.obj': read_obj,
+    '.ply': read_ply,
+    '.stl': read_stl,
+}
+
+def _source_key(path):
+    '''Returns the size and modification time of a file, the cache of a model is only valid for the same key.'''
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def write_cache(path, arrays, source=None):
+    '''Write arrays into a cache file which read_cache can memory map.
+    The file is written next to its final path first, then moved, so an interrupted write leaves no partial cache.
+    Args:
+        path (str): the path of the cache.
+        arrays (dict): the numpy arrays, keyed by name.
+        source (list): the key of the source of the arrays, see read_cache.
+    '''
+    header = {'version': _CACHE_VERSION, 'source': source, 'arrays': {}}
+    offset = 0
+    for name, array in arrays.items():
+        header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += -(-array.nbytes // _CACHE_ALIGNMENT) * _CACHE_ALIGNMENT
+    data = json.dumps(header).encode('utf-8')
+    # The arrays start after the magic, the length of the header and the header.
+    start = -(-(len(_CACHE_MAGIC) + 4 + len(data)) // _CACHE_ALIGNMENT) * _CACHE_ALIGNMENT
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(_CACHE_MAGIC)
+        f.write(np.uint32(len(data)).astype('<u4').tobytes())
+        f.write(data)
+        for name, array in arrays.items():
+            f.seek(start + header['arrays'][name]['offset'])
+            np.ascontiguousarray(array).tofile(f)
+        f.truncate(start + offset)
+    os.replace(temporary, path)
+
+def read_cache(path, source=None):
+    '''Memory map the arrays of a cache file.
+    The arrays are mapped copy on write: they can be modified, but the cache file is never changed.
+    Args:
+        path (str): the path of the cache.
+        source (list): if not None, the cache is only used if it was written with the same source key.
+    Returns:
+        dict: the arrays keyed by name, or None if the cache does not exist or is outdated.
+    '''
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(_CACHE_MAGIC)) != _CACHE_MAGIC:
+                return None
+            length = int(np.frombuffer(f.read(4), '<u4')[0])
+            header = json.loads(f.read(length).decode('utf-8'))
+    except (OSError, ValueError, IndexError):
+        return None
+    if header.get('version') != _CACHE_VERSION or (source is not None and header.get('source') != source):
+        return None
+    start = -(-(len(_CACHE_MAGIC) + 4 + length) // _CACHE_ALIGNMENT) * _CACHE_ALIGNMENT
+    arrays = {}
+    for name, info in header['arrays'].items():
+        shape = tuple(info['shape'])
+        if 0 in shape:
+            # Empty arrays cannot be mapped.
+            arrays[name] = np.empty(shape, dtype=info['dtype'])
+        else:
+            arrays[name] = np.memmap(path, dtype=info['dtype'], mode='c', offset=start + info['offset'], shape=shape)
+    return arrays
+
+def get_cache_path(path):
+    '''Returns the path of the cache of a model.'''
+    return path + CACHE_EXTENSION
+
+def load_mesh(path, color=DEFAULT_COLOR, cache=True, cache_path=None, chunk_size=CHUNK_SIZE):
+    '''Load a model from an OBJ, PLY or STL file as a mesh.
+    The file is parsed in chunks straight into numpy arrays. The first load writes the arrays
+    into a cache, later loads memory map the cache instead of parsing the file again, as long
+    as the size and modification time of the file are the same. The cache is skipped if it cannot be written.
+    Args:
+        path (str): the path of the model.
+        color (tuple): the color of the vertices which have no color in the file.
+        cache (bool): whether to use the cache.
+        cache_path (str): the path of the cache, defaults to the path of the model followed by CACHE_EXTENSION.
+        chunk_size (int): the number of bytes parsed at once.
+    Returns:
+        Mesh: the mesh of the model; it can be rendered as is or attached to a Renderable.
+    '''
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise ValueError("unsupported model format '{}', expected one of {}".format(extension, ', '.join(sorted(READERS))))
+    arrays = None
+    if cache:
+        cache_path = cache_path or get_cache_path(path)
+        source = _source_key(path)
+        arrays = read_cache(cache_path, source)
+    if arrays is None:
+        arrays = READERS[extension](path, chunk_size)
+        if cache:
+            try:
+                write_cache(cache_path, arrays, source)
+            except OSError:
+                pass
+    colors = arrays.get('colors')
+    if colors is None:
+        colors = np.empty((len(arrays['vertices']), 4), dtype=np.float32)
+        colors[...] = to_rgba(color)
+    return Mesh.from_arrays(arrays['vertices'], colors, arrays['triangles'], arrays['lines'])
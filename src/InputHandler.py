@@ -1,15 +1,44 @@
 from OpenGL.GLUT import *
 
+# Input events, as tuples of (event type, key or button, x, y).
+KEY_DOWN = 'key_down'
+KEY_UP = 'key_up'
+MOUSE_DOWN = 'mouse_down'
+MOUSE_UP = 'mouse_up'
+MOUSE_MOVE = 'mouse_move'
+
+# Functions called with every input event, as it arrives.
+_listeners = []
+
+def add_listener(callback):
+    '''Call a function with every input event from now on, from the thread running the window.
+    Nothing is ever dropped, the listener keeps the state it needs from the events.
+    Args:
+        callback (function): called with the event tuple.
+    '''
+    _listeners.append(callback)
+
+def remove_listener(callback):
+    '''Stop calling a function added by add_listener.'''
+    if callback in _listeners:
+        _listeners.remove(callback)
+
+def _post(event):
+    for callback in list(_listeners):
+        callback(event)
+
 # Keyboard handler
 _pressed_key = {}
 
 def key_up(key, x, y):
     '''Called when a keyboard key is released.'''
     _pressed_key[key] = False
+    _post((KEY_UP, key, x, y))
 
 def key_down(key, x, y):
     '''Called when a keyboard key is pressed.'''
     _pressed_key[key] = True
+    _post((KEY_DOWN, key, x, y))
 
 def is_key_down(key):
     '''Returns true if the key is pressed; otherwise false.'''
@@ -42,16 +71,19 @@ def mouse(key, state, x, y):
     _pressed_mouse[key] = False if state else True
     global _mouse_position
     _mouse_position = (x, y)
+    _post((MOUSE_UP if state else MOUSE_DOWN, key, x, y))
 
 def mouse_active_drag(x, y):
     '''Called when the mouse is moved while being pressed.'''
     global _mouse_position
     _mouse_position = (x, y)
+    _post((MOUSE_MOVE, None, x, y))
 
 def mouse_passive_drag(x, y):
     '''Called when the mouse is moved while no button is being pressed.'''
     global _mouse_position
     _mouse_position = (x, y)
+    _post((MOUSE_MOVE, None, x, y))
 
 def is_mouse_down(button):
     '''Returns true if the button is pressed; otherwise false'''
@@ -0,0 +1,310 @@
+from OpenGL.GL import *
+from .Mesh import Mesh, geometry_cache, EMPTY_BOUNDS, is_empty_bounds, to_rgba, _STRIDE, _POSITION_OFFSET
+from .Renderable import TransformationMatrix
+import numpy as np
+import ctypes
+import weakref
+
+# Layout of an instance: the 16 values of its matrix followed by r, g, b, a as float32.
+_INSTANCE_STRIDE = 20 * 4
+_COLOR_OFFSET = 16 * 4
+# Attribute locations of the rows of the matrix and of the color, 0 is left to gl_Vertex.
+_MATRIX_LOCATION = 1
+_COLOR_LOCATION = 5
+
+_VERTEX_SHADER = '''
+#version 120
+attribute vec4 instance_row0;
+attribute vec4 instance_row1;
+attribute vec4 instance_row2;
+attribute vec4 instance_row3;
+attribute vec4 instance_color;
+varying vec4 color;
+void main() {
+    // The rows of a TransformationMatrix are the columns of the OpenGL matrix.
+    mat4 model = mat4(instance_row0, instance_row1, instance_row2, instance_row3);
+    gl_Position = gl_ModelViewProjectionMatrix * (model * gl_Vertex);
+    color = gl_Color * instance_color;
+}
+'''
+
+_FRAGMENT_SHADER = '''
+#version 120
+varying vec4 color;
+void main() {
+    gl_FragColor = color;
+}
+'''
+
+class InstanceRenderer:
+    '''Draws instanced meshes with glDrawElementsInstanced.
+    The shader program is created in the current context the first time it is needed;
+    if instancing or shaders are not supported, is_enabled returns False.
+    '''
+
+    def __init__(self):
+        # Set to False to always draw the instances through the batched CPU path.
+        self.enabled = True
+        self._program = None
+        self._supported = None
+
+    def is_enabled(self):
+        '''Returns true if instancing is enabled and supported by the current context.'''
+        if not self.enabled or not geometry_cache.is_enabled():
+            return False
+        if self._supported is None:
+            self._supported = bool(glDrawElementsInstanced) and bool(glVertexAttribDivisor) and bool(glCreateShader)
+            if self._supported:
+                try:
+                    self._program = self._compile()
+                except Exception:
+                    self._supported = False
+        return self._supported
+
+    def _compile(self):
+        program = glCreateProgram()
+        for kind, source in ((GL_VERTEX_SHADER, _VERTEX_SHADER), (GL_FRAGMENT_SHADER, _FRAGMENT_SHADER)):
+            shader = glCreateShader(kind)
+            glShaderSource(shader, source)
+            glCompileShader(shader)
+            if not glGetShaderiv(shader, GL_COMPILE_STATUS):
+                raise RuntimeError("unable to compile the instancing shader: {}".format(glGetShaderInfoLog(shader)))
+            glAttachShader(program, shader)
+            glDeleteShader(shader)
+        for i in range(0, 4):
+            glBindAttribLocation(program, _MATRIX_LOCATION + i, 'instance_row' + str(i))
+        glBindAttribLocation(program, _COLOR_LOCATION, 'instance_color')
+        glLinkProgram(program)
+        if not glGetProgramiv(program, GL_LINK_STATUS):
+            raise RuntimeError("unable to link the instancing shader: {}".format(glGetProgramInfoLog(program)))
+        return program
+
+    def draw(self, instanced):
+        '''Draw every instance of an InstancedMesh with one call for the triangles and one for the lines.'''
+        mesh = instanced.mesh
+        glUseProgram(self._program)
+        glEnableClientState(GL_COLOR_ARRAY)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        geometry_cache.upload(mesh).bind()
+        glColorPointer(4, GL_FLOAT, _STRIDE, ctypes.c_void_p(0))
+        glVertexPointer(3, GL_FLOAT, _STRIDE, ctypes.c_void_p(_POSITION_OFFSET))
+        geometry_cache.upload(instanced, InstanceBuffer).bind()
+        locations = [_MATRIX_LOCATION + i for i in range(0, 4)] + [_COLOR_LOCATION]
+        for i, location in enumerate(locations):
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(location, 4, GL_FLOAT, GL_FALSE, _INSTANCE_STRIDE, ctypes.c_void_p(i * 16))
+            glVertexAttribDivisor(location, 1)
+        count = len(instanced)
+        if len(mesh.triangles):
+            glDrawElementsInstanced(GL_TRIANGLES, mesh.triangles.size, GL_UNSIGNED_INT, ctypes.c_void_p(0), count)
+        if len(mesh.lines):
+            glDrawElementsInstanced(GL_LINES, mesh.lines.size, GL_UNSIGNED_INT, ctypes.c_void_p(mesh.triangles.nbytes), count)
+        for location in locations:
+            glVertexAttribDivisor(location, 0)
+            glDisableVertexAttribArray(location)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glDisableClientState(GL_COLOR_ARRAY)
+        glUseProgram(0)
+
+    def release(self):
+        '''Forget the shader program, call this before the OpenGL context is destroyed.'''
+        if self._program:
+            glDeleteProgram(self._program)
+        self._program = None
+        self._supported = None
+
+class InstanceBuffer:
+    '''The matrices and colors of the instances of an InstancedMesh uploaded to the GPU.'''
+
+    def __init__(self):
+        self.buffer = glGenBuffers(1)
+        self.version = None
+        self.size = 0
+
+    def upload(self, instanced):
+        data = instanced.get_instance_data()
+        glBindBuffer(GL_ARRAY_BUFFER, self.buffer)
+        glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, GL_DYNAMIC_DRAW)
+        self.version = instanced.version
+        self.size = data.nbytes
+
+    def bind(self):
+        glBindBuffer(GL_ARRAY_BUFFER, self.buffer)
+
+    def delete(self):
+        glDeleteBuffers(1, [self.buffer])
+
+# The renderer used by every instanced mesh.
+instance_renderer = InstanceRenderer()
+
+def _to_matrices(matrices):
+    '''Convert a list of TransformationMatrix or of 4x4 arrays into a (n, 4, 4) float32 array.'''
+    if isinstance(matrices, np.ndarray):
+        return np.array(matrices, dtype=np.float32).reshape(-1, 4, 4)
+    return np.array([m.array if isinstance(m, TransformationMatrix) else m for m in matrices], dtype=np.float32).reshape(-1, 4, 4)
+
+def _to_colors(colors, count):
+    '''Convert a single color or a list of colors into a (count, 4) float32 array.'''
+    if colors is None:
+        return np.ones((count, 4), dtype=np.float32)
+    colors = np.asarray(colors, dtype=np.float32)
+    if colors.ndim == 1:
+        return np.tile(to_rgba(colors.tolist()), (count, 1)).astype(np.float32)
+    if colors.shape[1] == 3:
+        colors = np.hstack((colors, np.ones((len(colors), 1), dtype=np.float32)))
+    if len(colors) != count:
+        raise ValueError("expected {} colors, got {}".format(count, len(colors)))
+    return np.array(colors, dtype=np.float32)
+
+class InstancedMesh:
+    '''A mesh drawn many times, each instance with its own transformation and color.
+    The color of an instance multiplies the colors of the mesh, white keeps them unchanged.
+    Where instancing is supported, the mesh and 20 floats per instance are kept on the GPU and
+    all the instances are drawn with a single call; otherwise the instances are baked into
+    a single mesh on the CPU, drawn with a single call as well.
+    Args:
+        mesh (Mesh): the shared mesh.
+        matrices (array like): (n, 4, 4) array of the transformation of each instance, or a list of TransformationMatrix.
+        colors (array like): (n, 4) array of the color of each instance, or a single color for every instance.
+    '''
+
+    def __init__(self, mesh, matrices=(), colors=None):
+        if not isinstance(mesh, Mesh):
+            raise TypeError("expected a Mesh, got {}".format(mesh.__class__.__name__))
+        self.mesh = mesh
+        # Incremented every time an instance changes.
+        self.version = 0
+        self._watchers = None
+        self._data = None
+        self._baked = None
+        self._baked_key = None
+        self._bounds = None
+        self._bounds_key = None
+        self.set_instances(matrices, colors)
+        mesh.watch(self)
+
+    def __len__(self):
+        return len(self.matrices)
+
+    def set_instances(self, matrices, colors=None):
+        '''Replace every instance, the arguments are the same as the constructor.'''
+        self.matrices = _to_matrices(matrices)
+        self.colors = _to_colors(colors, len(self.matrices))
+        self.mark_dirty()
+
+    def add(self, matrix, color=None):
+        '''Add an instance.
+        Args:
+            matrix (TransformationMatrix): the transformation of the instance.
+            color (tuple): the color of the instance, defaults to white.
+        Returns:
+            int: the index of the instance.
+        '''
+        self.matrices = np.concatenate((self.matrices, _to_matrices([matrix])))
+        self.colors = np.concatenate((self.colors, _to_colors(color, 1) if color is not None else np.ones((1, 4), dtype=np.float32)))
+        self.mark_dirty()
+        return len(self.matrices) - 1
+
+    def remove(self, index):
+        '''Remove an instance, the following instances move down by one.'''
+        self.matrices = np.delete(self.matrices, index, axis=0)
+        self.colors = np.delete(self.colors, index, axis=0)
+        self.mark_dirty()
+
+    def set_matrix(self, index, matrix):
+        self.matrices[index] = matrix.array if isinstance(matrix, TransformationMatrix) else matrix
+        self.mark_dirty()
+
+    def set_color(self, index, color):
+        self.colors[index] = to_rgba(color)
+        self.mark_dirty()
+
+    def mark_dirty(self):
+        '''Mark the instances as changed, call this after modifying matrices or colors in place.'''
+        self.version += 1
+        self._data = None
+        self.mark_bounds_dirty()
+
+    def mark_bounds_dirty(self, obj=None):
+        '''Notify the watchers that the bounds of the instances may have changed.'''
+        if self._watchers:
+            for watcher in list(self._watchers):
+                watcher.mark_bounds_dirty(self)
+
+    def watch(self, watcher):
+        '''Call watcher.mark_bounds_dirty(self) whenever the instances or the mesh change.'''
+        if self._watchers is None:
+            self._watchers = weakref.WeakSet()
+        self._watchers.add(watcher)
+
+    def get_instance_data(self):
+        '''Returns the instances as a contiguous (n, 20) float32 array of the matrix values followed by the color.'''
+        if self._data is None:
+            self._data = np.ascontiguousarray(np.hstack((self.matrices.reshape(-1, 16), self.colors)), dtype=np.float32)
+        return self._data
+
+    def get_bounds_key(self):
+        return (id(self), self.version, id(self.mesh), self.mesh.version)
+
+    def get_bounds(self):
+        '''Returns the axis aligned box enclosing every instance, as its minimum and maximum corners.'''
+        key = self.get_bounds_key()
+        if key != self._bounds_key:
+            bounds = self.mesh.bounds
+            if len(self.matrices) == 0 or is_empty_bounds(bounds):
+                self._bounds = EMPTY_BOUNDS
+            else:
+                # Transform the 8 corners of the box of the mesh by every matrix at once.
+                low, high = bounds
+                corners = np.ones((8, 4))
+                corners[:, 0] = [low[0], high[0]] * 4
+                corners[:, 1] = [low[1], low[1], high[1], high[1]] * 2
+                corners[:, 2] = [low[2]] * 4 + [high[2]] * 4
+                points = np.einsum('ci,nij->ncj', corners, self.matrices.astype(np.float64))[:, :, :3]
+                self._bounds = (points.min(axis=(0, 1)), points.max(axis=(0, 1)))
+            self._bounds_key = key
+        return self._bounds
+
+    def bake(self):
+        '''Returns a single mesh holding every instance, transformed and colored.
+        The mesh is kept until the instances or the shared mesh change.
+        '''
+        key = (self.version, self.mesh.version)
+        if key != self._baked_key:
+            mesh = self.mesh
+            count = len(self.matrices)
+            size = len(mesh.vertices)
+            points = np.ones((size, 4))
+            points[:, :3] = mesh.vertices
+            vertices = np.einsum('vi,nij->nvj', points, self.matrices.astype(np.float64))[:, :, :3]
+            colors = mesh.colors[None, :, :] * self.colors[:, None, :]
+            offsets = (np.arange(count, dtype=np.uint32) * size)[:, None, None]
+            triangles = mesh.triangles[None, :, :] + offsets
+            lines = mesh.lines[None, :, :] + offsets
+            if self._baked is None:
+                self._baked = Mesh(vertices, colors.reshape(-1, 4), triangles, lines)
+            else:
+                self._baked.update(vertices, colors.reshape(-1, 4), triangles, lines)
+            self._baked_key = key
+        return self._baked
+
+    def instance_of(self, triangle):
+        '''Returns the index of the instance holding a triangle of the baked mesh, as returned by picking.'''
+        return triangle // max(len(self.mesh.triangles), 1)
+
+    def meshes(self, matrix=None):
+        '''List the meshes of this object, see Renderable.meshes; the instances are baked into one mesh.'''
+        return [(matrix if matrix is not None else np.identity(4, dtype=np.float32), self.bake())]
+
+    def render(self):
+        '''Render this object using OpenGL'''
+        if len(self.matrices) == 0 or len(self.mesh.vertices) == 0:
+            return
+        if instance_renderer.is_enabled():
+            instance_renderer.draw(self)
+        else:
+            self.bake().render()
+
+    bounds = property(get_bounds)
@@ -0,0 +1,143 @@
+from .Mesh import Mesh, is_empty_bounds
+import numpy as np
+import math
+import weakref
+
+# Longest a segment of a tessellated shape may be on screen, in pixels, before a finer level is used.
+SEGMENT_PIXELS = 6.0
+# A level changes only once the projected size is this fraction past the size where it would change,
+# so objects near a threshold do not switch back and forth between two levels.
+HYSTERESIS = 0.2
+
+def projected_size(center, radius, matrix, height):
+    '''Returns the height in pixels of a sphere once projected on screen.
+    Args:
+        center (array like): x, y and z of the center of the sphere.
+        radius (float): the radius of the sphere.
+        matrix (numpy.ndarray): 4x4 array of the transformation from the space of the sphere to clip space.
+        height (int): the height of the viewport in pixels.
+    Returns:
+        float: the projected diameter, infinite if the center of the sphere is behind the camera.
+    '''
+    matrix = np.asarray(matrix, dtype=np.float64)
+    w = float(np.dot(center, matrix[:3, 3]) + matrix[3, 3])
+    # Length of the vertical axis of the screen in the space of the sphere, scaled by the projection.
+    scale = float(np.linalg.norm(matrix[:3, 1]))
+    if w <= 0:
+        return math.inf
+    return radius * scale * height / w
+
+def segment_sizes(segments, pixels=SEGMENT_PIXELS):
+    '''Returns the projected size from which each level of a tessellated shape is used.
+    A level is used once the segments of the next coarser level would be longer than pixels on screen.
+    Args:
+        segments (list): the number of segments around the shape at each level, from the finest to the coarsest.
+        pixels (float): the longest a segment may be on screen, in pixels.
+    Returns:
+        list: the smallest projected size in pixels of each level, the last one is 0.
+    '''
+    return [count * pixels / math.pi for count in segments[1:]] + [0.0]
+
+class LODChain:
+    '''A shape stored at several levels of detail, only one of them is drawn at a time.
+    The level is picked by select_level from the projected size of the finest level, done every frame
+    by the render loop through Renderable.select_level. All the levels should enclose about the same volume;
+    the bounds of the chain are the bounds of the finest level.
+    Args:
+        levels (list): the meshes of the levels, from the finest to the coarsest.
+        sizes (list): the smallest projected size in pixels of each level, decreasing; the last one is usually 0.
+        hysteresis (float): see HYSTERESIS.
+    '''
+
+    def __init__(self, levels, sizes, hysteresis=HYSTERESIS):
+        if len(levels) == 0:
+            raise ValueError("trying to build a chain with no level")
+        if len(sizes) != len(levels):
+            raise ValueError("expected {} sizes, got {}".format(len(levels), len(sizes)))
+        for mesh in levels:
+            if not isinstance(mesh, Mesh):
+                raise TypeError("expected a level to be a Mesh, got {}".format(mesh.__class__.__name__))
+        if any(a < b for a, b in zip(sizes, sizes[1:])):
+            raise ValueError("the sizes of the levels must be decreasing")
+        self.levels = list(levels)
+        self.sizes = [float(s) for s in sizes]
+        self.hysteresis = hysteresis
+        # Index of the level drawn, the finest until a level is selected.
+        self.level = 0
+        self._sphere = None
+        self._sphere_version = None
+        self._watchers = None
+        for mesh in self.levels:
+            mesh.watch(self)
+
+    def get_mesh(self):
+        '''Returns the mesh of the selected level.'''
+        return self.levels[self.level]
+
+    def get_bounding_sphere(self):
+        '''Returns the center and the radius of the sphere enclosing the finest level, or None if it is empty.'''
+        mesh = self.levels[0]
+        if self._sphere_version != mesh.version:
+            bounds = mesh.bounds
+            if is_empty_bounds(bounds):
+                self._sphere = None
+            else:
+                self._sphere = (bounds[0] + bounds[1]) / 2, float(np.linalg.norm(bounds[1] - bounds[0]) / 2)
+            self._sphere_version = mesh.version
+        return self._sphere
+
+    def choose_level(self, size):
+        '''Returns the level to draw at a projected size, starting from the selected level.'''
+        level = self.level
+        while level > 0 and size >= self.sizes[level - 1] * (1 + self.hysteresis):
+            level -= 1
+        while level < len(self.levels) - 1 and size < self.sizes[level] * (1 - self.hysteresis):
+            level += 1
+        return level
+
+    def select_level(self, matrix, height):
+        '''Select the level to draw.
+        Args:
+            matrix (numpy.ndarray): 4x4 array of the transformation from the space of the chain to clip space;
+                if None, the finest level is selected.
+            height (int): the height of the viewport in pixels.
+        Returns:
+            int: the selected level.
+        '''
+        sphere = self.get_bounding_sphere()
+        if matrix is None or sphere is None:
+            self.level = 0
+        else:
+            self.level = self.choose_level(projected_size(sphere[0], sphere[1], matrix, height))
+        return self.level
+
+    def mark_bounds_dirty(self, obj=None):
+        '''Called by the levels when their geometry changes.'''
+        if self._watchers:
+            for watcher in list(self._watchers):
+                watcher.mark_bounds_dirty(self)
+
+    def watch(self, watcher):
+        '''Call watcher.mark_bounds_dirty(self) whenever a level changes.'''
+        if self._watchers is None:
+            self._watchers = weakref.WeakSet()
+        self._watchers.add(watcher)
+
+    def get_bounds_key(self):
+        return tuple((id(mesh), mesh.version) for mesh in self.levels)
+
+    def get_bounds(self):
+        '''Returns the axis aligned box enclosing the finest level, as its minimum and maximum corners.'''
+        return self.levels[0].bounds
+
+    def meshes(self, matrix=None):
+        '''List the meshes of this object, see Renderable.meshes; only the selected level is listed.'''
+        return [(matrix if matrix is not None else np.identity(4, dtype=np.float32), self.get_mesh())]
+
+    def render(self):
+        '''Render the selected level using OpenGL'''
+        self.get_mesh().render()
+
+    mesh = property(get_mesh)
+    bounds = property(get_bounds)
+    bounding_sphere = property(get_bounding_sphere)
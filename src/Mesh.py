@@ -0,0 +1,296 @@
+from OpenGL.GL import *
+import numpy as np
+import ctypes
+import weakref
+
+# Color used for vertices that have no color, the initial color of OpenGL.
+DEFAULT_COLOR = (1.0, 1.0, 1.0, 1.0)
+# Layout of an interleaved vertex: r, g, b, a, x, y, z as float32.
+_STRIDE = 7 * 4
+_POSITION_OFFSET = 4 * 4
+
+def transform_points(points, transformer):
+    '''Transform a (n, 3) array of points with a transformation matrix.
+    Args:
+        points (numpy.ndarray): (n, 3) array of x, y and z.
+        transformer (TransformationMatrix): the transformation to apply.
+    Returns:
+        numpy.ndarray: (n, 3) array of the transformed points.
+    '''
+    matrix = transformer.array.astype(np.float64)
+    return np.matmul(points, matrix[:3, :3]) + matrix[3, :3]
+
+# Box enclosing nothing, its minimum corner is above its maximum corner.
+EMPTY_BOUNDS = (np.full(3, np.inf), np.full(3, -np.inf))
+
+def is_empty_bounds(bounds):
+    '''Returns true if a box encloses nothing.'''
+    return bool(bounds[0][0] > bounds[1][0] or bounds[0][1] > bounds[1][1] or bounds[0][2] > bounds[1][2])
+
+def merge_bounds(boxes):
+    '''Returns the axis aligned box enclosing a list of boxes.'''
+    boxes = [b for b in boxes if not is_empty_bounds(b)]
+    if not boxes:
+        return EMPTY_BOUNDS
+    return np.min([b[0] for b in boxes], axis=0), np.max([b[1] for b in boxes], axis=0)
+
+def transform_bounds(bounds, matrix):
+    '''Returns the axis aligned box enclosing a transformed box.
+    Args:
+        bounds (tuple): the minimum and maximum corners, as numpy arrays of x, y and z.
+        matrix (numpy.ndarray): 4x4 array of the transformation.
+    Returns:
+        tuple: the minimum and maximum corners of the transformed box.
+    '''
+    if is_empty_bounds(bounds):
+        return EMPTY_BOUNDS
+    low, high = bounds
+    matrix = np.asarray(matrix, dtype=np.float64)
+    # Each axis of the matrix stretches the box independently, pick the smallest and largest end of each.
+    a = low[:, None] * matrix[:3, :3]
+    b = high[:, None] * matrix[:3, :3]
+    return np.minimum(a, b).sum(axis=0) + matrix[3, :3], np.maximum(a, b).sum(axis=0) + matrix[3, :3]
+
+def to_rgba(color):
+    '''Returns a color as a tuple of 4 floats, the alpha defaults to 1.'''
+    if len(color) == 3:
+        return (color[0], color[1], color[2], 1.0)
+    return tuple(color)
+
+class Mesh:
+    '''Indexed geometry stored in numpy arrays.
+    All the triangles are drawn with a single glDrawElements call, and so are the lines.
+    Args:
+        vertices (array like): (n, 3) array of x, y and z.
+        colors (array like): (n, 4) array of r, g, b and a, or a single color for every vertex.
+        triangles (array like): (t, 3) array of vertex indices.
+        lines (array like): (l, 2) array of vertex indices.
+    '''
+
+    def __init__(self, vertices, colors=None, triangles=None, lines=None):
+        # Incremented every time the geometry changes.
+        self.version = 0
+        self._bounds = None
+        self._bounds_version = None
+        # The objects notified when the geometry changes.
+        self._watchers = None
+        self.update(vertices, colors, triangles, lines)
+
+    def update(self, vertices, colors=None, triangles=None, lines=None):
+        '''Replace the geometry of this mesh, the arguments are the same as the constructor.'''
+        self.vertices = np.array(vertices, dtype=np.float32).reshape(-1, 3)
+        if colors is None:
+            colors = DEFAULT_COLOR
+        colors = np.asarray(colors, dtype=np.float32)
+        if colors.ndim == 1:
+            colors = np.tile(to_rgba(colors), (len(self.vertices), 1)).astype(np.float32)
+        self.colors = np.array(colors, dtype=np.float32).reshape(-1, 4)
+        if len(self.colors) != len(self.vertices):
+            raise ValueError("expected {} colors, got {}".format(len(self.vertices), len(self.colors)))
+        self.triangles = np.array(triangles if triangles is not None else (), dtype=np.uint32).reshape(-1, 3)
+        self.lines = np.array(lines if lines is not None else (), dtype=np.uint32).reshape(-1, 2)
+        self.mark_dirty()
+
+    @staticmethod
+    def from_arrays(vertices, colors, triangles, lines):
+        '''Create a mesh using the given arrays as they are, without copying them.
+        Memory mapped arrays stay mapped, so only the pages that are used get read.
+        Args:
+            vertices (numpy.ndarray): (n, 3) float32 array.
+            colors (numpy.ndarray): (n, 4) float32 array.
+            triangles (numpy.ndarray): (t, 3) uint32 array.
+            lines (numpy.ndarray): (l, 2) uint32 array.
+        Returns:
+            Mesh: the mesh sharing the arrays.
+        '''
+        for name, array, dtype, width in (('vertices', vertices, np.float32, 3), ('colors', colors, np.float32, 4),
+                                          ('triangles', triangles, np.uint32, 3), ('lines', lines, np.uint32, 2)):
+            if not isinstance(array, np.ndarray):
+                raise TypeError("expected {} to be a numpy array, got {}".format(name, array.__class__.__name__))
+            if array.dtype != dtype or array.ndim != 2 or array.shape[1] != width:
+                raise ValueError("expected {} to be a (n, {}) {} array, got a {} {} array".format(
+                    name, width, np.dtype(dtype).name, array.shape, array.dtype.name))
+        if len(colors) != len(vertices):
+            raise ValueError("expected {} colors, got {}".format(len(vertices), len(colors)))
+        mesh = Mesh(())
+        mesh.vertices, mesh.colors, mesh.triangles, mesh.lines = vertices, colors, triangles, lines
+        mesh.mark_dirty()
+        return mesh
+
+    def get_interleaved(self):
+        '''Returns the vertices as a contiguous (n, 7) float32 array of r, g, b, a, x, y and z.'''
+        if self._interleaved is None:
+            self._interleaved = np.ascontiguousarray(np.hstack((self.colors, self.vertices)), dtype=np.float32)
+        return self._interleaved
+
+    def get_indices(self):
+        '''Returns the triangle indices followed by the line indices as a single uint32 array.'''
+        return np.concatenate((self.triangles.ravel(), self.lines.ravel()))
+
+    def get_bounds(self):
+        '''Returns the axis aligned box enclosing the vertices as its minimum and maximum corners.
+        The box is computed again only when the geometry changes; it is EMPTY_BOUNDS if there is no vertex.
+        '''
+        if self._bounds_version != self.version:
+            if len(self.vertices):
+                self._bounds = (self.vertices.min(axis=0).astype(np.float64), self.vertices.max(axis=0).astype(np.float64))
+            else:
+                self._bounds = EMPTY_BOUNDS
+            self._bounds_version = self.version
+        return self._bounds
+
+    def mark_dirty(self):
+        '''Mark the geometry as changed, call this after modifying the arrays of the mesh.'''
+        self.version += 1
+        self._interleaved = None
+        if self._watchers:
+            for watcher in list(self._watchers):
+                watcher.mark_bounds_dirty(self)
+
+    def watch(self, watcher):
+        '''Call watcher.mark_bounds_dirty(self) whenever the geometry changes.'''
+        if self._watchers is None:
+            self._watchers = weakref.WeakSet()
+        self._watchers.add(watcher)
+
+    def render(self):
+        '''Render this object using OpenGL'''
+        if len(self.vertices) == 0:
+            return
+        glEnableClientState(GL_COLOR_ARRAY)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        if geometry_cache.is_enabled():
+            # Draw from the buffers kept on the GPU.
+            geometry_cache.upload(self).bind()
+            glColorPointer(4, GL_FLOAT, _STRIDE, ctypes.c_void_p(0))
+            glVertexPointer(3, GL_FLOAT, _STRIDE, ctypes.c_void_p(_POSITION_OFFSET))
+            if len(self.triangles):
+                glDrawElements(GL_TRIANGLES, self.triangles.size, GL_UNSIGNED_INT, ctypes.c_void_p(0))
+            if len(self.lines):
+                glDrawElements(GL_LINES, self.lines.size, GL_UNSIGNED_INT, ctypes.c_void_p(self.triangles.nbytes))
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+        else:
+            # Draw from client side arrays.
+            address = self.interleaved.ctypes.data
+            glColorPointer(4, GL_FLOAT, _STRIDE, ctypes.c_void_p(address))
+            glVertexPointer(3, GL_FLOAT, _STRIDE, ctypes.c_void_p(address + _POSITION_OFFSET))
+            if len(self.triangles):
+                glDrawElements(GL_TRIANGLES, self.triangles.size, GL_UNSIGNED_INT, self.triangles)
+            if len(self.lines):
+                glDrawElements(GL_LINES, self.lines.size, GL_UNSIGNED_INT, self.lines)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glDisableClientState(GL_COLOR_ARRAY)
+
+    def applyTransformation(self, transformer):
+        from .Renderable import TransformationMatrix
+        if isinstance(transformer, TransformationMatrix):
+            self.vertices[...] = transform_points(self.vertices, transformer)
+            self.mark_dirty()
+        else:
+            raise TypeError("trying to transform a {} with {}".format(self.__class__.__name__, transformer.__class__.__name__))
+
+    interleaved = property(get_interleaved)
+    bounds = property(get_bounds)
+
+class GeometryBuffers:
+    '''The vertex and index buffers of a mesh uploaded to the GPU.'''
+
+    def __init__(self):
+        self.vertex_buffer, self.index_buffer = glGenBuffers(2)
+        self.version = None
+        self.size = 0
+
+    def upload(self, mesh):
+        '''Upload the geometry of a mesh into the buffers.'''
+        vertices = mesh.interleaved
+        indices = mesh.get_indices()
+        glBindBuffer(GL_ARRAY_BUFFER, self.vertex_buffer)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+        self.version = mesh.version
+        self.size = vertices.nbytes + indices.nbytes
+
+    def bind(self):
+        glBindBuffer(GL_ARRAY_BUFFER, self.vertex_buffer)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
+
+    def delete(self):
+        glDeleteBuffers(2, [self.vertex_buffer, self.index_buffer])
+
+class GeometryCache:
+    '''Keeps the geometry of meshes on the GPU across frames.
+    A mesh is only uploaded again when its version changes; the buffers are
+    released once the mesh is garbage collected.
+    '''
+
+    def __init__(self):
+        # Set to False to always draw from client side arrays.
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self._buffers = {}
+        # Keys of collected meshes, their buffers are deleted on the GL thread.
+        self._released = []
+        self._supported = None
+
+    def is_enabled(self):
+        '''Returns true if the cache is enabled and buffer objects are supported by the current context.'''
+        if self._supported is None:
+            self._supported = bool(glGenBuffers)
+        return self.enabled and self._supported
+
+    def upload(self, mesh, buffers_class=None):
+        '''Returns the buffers holding the geometry of a mesh, uploading it only if it changed.
+        Args:
+            mesh (Mesh): the mesh to upload.
+            buffers_class (class): the class of the buffers to create, defaults to GeometryBuffers.
+                It is created without arguments, and must have the methods and attributes of GeometryBuffers.
+        Returns:
+            GeometryBuffers: the buffers of the mesh.
+        '''
+        self.collect()
+        key = id(mesh)
+        buffers = self._buffers.get(key)
+        if buffers is not None and buffers.version == mesh.version:
+            self.hits += 1
+            return buffers
+        self.misses += 1
+        if buffers is None:
+            buffers = (buffers_class or GeometryBuffers)()
+            self._buffers[key] = buffers
+            weakref.finalize(mesh, self._released.append, key)
+        buffers.upload(mesh)
+        return buffers
+
+    def collect(self):
+        '''Delete the buffers of meshes that no longer exist.'''
+        while self._released:
+            buffers = self._buffers.pop(self._released.pop(), None)
+            if buffers is not None:
+                buffers.delete()
+
+    def clear(self):
+        '''Delete every buffer and reset the counters.'''
+        self.collect()
+        for buffers in self._buffers.values():
+            buffers.delete()
+        self._buffers.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        '''Returns the cache counters.
+        Returns:
+            dict: the number of hits, misses, cached meshes and the size of the cached geometry in bytes.
+        '''
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._buffers),
+            'bytes': sum(b.size for b in self._buffers.values()),
+        }
+
+# The cache used by every mesh.
+geometry_cache = GeometryCache()
@@ -0,0 +1,247 @@
+from OpenGL.GL import *
+import numpy as np
+import ctypes
+import os
+import struct
+import zlib
+
+# Backends able to render without a window.
+BACKENDS = ('osmesa', 'egl', 'cpu')
+
+def default_backend():
+    '''Returns the backend matching the PyOpenGL platform.
+    The platform is chosen by PyOpenGL when it is first imported, so PYOPENGL_PLATFORM
+    has to be set to 'osmesa' or 'egl' before importing this toolkit to render with OpenGL.
+    '''
+    platform = os.environ.get('PYOPENGL_PLATFORM', '').lower()
+    if platform in ('osmesa', 'egl'):
+        return platform
+    return 'cpu'
+
+class OSMesaContext:
+    '''An OpenGL context rendering into memory through OSMesa.'''
+
+    def __init__(self, width, height):
+        from OpenGL import osmesa
+        self.osmesa = osmesa
+        self.width = width
+        self.height = height
+        self.context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+        if not self.context:
+            raise RuntimeError("unable to create an OSMesa context")
+        self.buffer = (ctypes.c_ubyte * (width * height * 4))()
+        if not osmesa.OSMesaMakeCurrent(self.context, self.buffer, GL_UNSIGNED_BYTE, width, height):
+            raise RuntimeError("unable to make the OSMesa context current")
+
+    def destroy(self):
+        self.osmesa.OSMesaDestroyContext(self.context)
+
+class EGLContext:
+    '''An OpenGL context rendering into an EGL pbuffer.
+    With Mesa, setting EGL_PLATFORM=surfaceless allows it to run without any display server.
+    '''
+
+    def __init__(self, width, height):
+        from OpenGL import EGL
+        self.EGL = EGL
+        self.width = width
+        self.height = height
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor)):
+            raise RuntimeError("unable to initialize the EGL display")
+        attributes = (EGL.EGLint * 13)(
+            EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+            EGL.EGL_RED_SIZE, 8,
+            EGL.EGL_GREEN_SIZE, 8,
+            EGL.EGL_BLUE_SIZE, 8,
+            EGL.EGL_DEPTH_SIZE, 24,
+            EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+            EGL.EGL_NONE,
+        )
+        config = EGL.EGLConfig()
+        count = EGL.EGLint()
+        if not EGL.eglChooseConfig(self.display, attributes, ctypes.pointer(config), 1, ctypes.pointer(count)) or count.value == 0:
+            raise RuntimeError("no EGL configuration supports offscreen rendering")
+        size = (EGL.EGLint * 5)(EGL.EGL_WIDTH, width, EGL.EGL_HEIGHT, height, EGL.EGL_NONE)
+        self.surface = EGL.eglCreatePbufferSurface(self.display, config, size)
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, None)
+        if not EGL.eglMakeCurrent(self.display, self.surface, self.surface, self.context):
+            raise RuntimeError("unable to make the EGL context current")
+
+    def destroy(self):
+        EGL = self.EGL
+        EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+        EGL.eglDestroyContext(self.display, self.context)
+        EGL.eglDestroySurface(self.display, self.surface)
+        EGL.eglTerminate(self.display)
+
+def create_context(width, height, backend):
+    '''Create an offscreen OpenGL context and make it current.
+    Args:
+        backend (str): 'osmesa' or 'egl'.
+    '''
+    if backend == 'osmesa':
+        return OSMesaContext(width, height)
+    elif backend == 'egl':
+        return EGLContext(width, height)
+    raise ValueError("unknown OpenGL offscreen backend: {}".format(backend))
+
+def read_pixels(width, height):
+    '''Read the pixels of the current OpenGL framebuffer.
+    Returns:
+        numpy.ndarray: (height, width, 4) uint8 array, the first row is the top of the image.
+    '''
+    glPixelStorei(GL_PACK_ALIGNMENT, 1)
+    data = glReadPixels(0, 0, width, height, GL_RGBA, GL_UNSIGNED_BYTE)
+    pixels = np.frombuffer(data, dtype=np.uint8).reshape(height, width, 4)
+    return np.ascontiguousarray(pixels[::-1])
+
+def save_image(pixels, path):
+    '''Save pixels as a PNG image.
+    Args:
+        pixels (numpy.ndarray): (height, width, 4) uint8 array, the first row is the top of the image.
+        path (str): the path of the image.
+    '''
+    height, width, _ = pixels.shape
+    # Every scanline starts with the filter type, 0 means no filter.
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = pixels.reshape(height, width * 4)
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)))
+        f.write(chunk(b'IEND', b''))
+
+class SoftwareRenderer:
+    '''Renders meshes on the CPU, used when no OpenGL context can be created.
+    It follows the state set up by the toolkit: depth test, back face culling,
+    smooth shading and alpha blending. Triangles crossing the near plane are skipped.
+    '''
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.clear()
+
+    def clear(self, color=(0.0, 0.0, 0.0, 1.0)):
+        self.color = np.empty((self.height, self.width, 4), dtype=np.float32)
+        self.color[...] = color
+        self.depth = np.full((self.height, self.width), np.inf, dtype=np.float32)
+
+    def _project(self, vertices, matrix):
+        '''Returns the window x and y (top down), depth and 1 / w of the vertices.'''
+        points = np.ones((len(vertices), 4))
+        points[:, :3] = vertices
+        clip = np.matmul(points, matrix.astype(np.float64))
+        w = clip[:, 3]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inverse_w = 1 / w
+            x = (clip[:, 0] * inverse_w + 1) * 0.5 * self.width
+            y = (1 - clip[:, 1] * inverse_w) * 0.5 * self.height
+            z = (clip[:, 2] * inverse_w + 1) * 0.5
+        return x, y, z, inverse_w
+
+    def draw(self, mesh, matrix):
+        '''Draw a mesh.
+        Args:
+            mesh (Mesh): the mesh to draw.
+            matrix (numpy.ndarray): 4x4 array of the model, view and projection transformation.
+        '''
+        if len(mesh.vertices) == 0:
+            return
+        x, y, z, inverse_w = self._project(mesh.vertices, matrix)
+        # A vertex just in front of the camera can project to an infinite or undefined position.
+        visible = (inverse_w > 0) & np.isfinite(x) & np.isfinite(y)
+        if len(mesh.triangles):
+            self._draw_triangles(mesh, x, y, z, inverse_w, visible)
+        if len(mesh.lines):
+            self._draw_lines(mesh, x, y, z, visible)
+
+    def _draw_triangles(self, mesh, x, y, z, inverse_w, visible):
+        triangles = mesh.triangles
+        # Skip the triangles behind the camera and those facing away.
+        keep = visible[triangles].all(axis=1)
+        a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+        area = (x[b] - x[a]) * (y[c] - y[a]) - (x[c] - x[a]) * (y[b] - y[a])
+        # The y axis points down, so the counter clockwise front faces have a negative area.
+        keep &= area < 0
+        for a, b, c in triangles[keep].tolist():
+            x0 = max(int(min(x[a], x[b], x[c])), 0)
+            x1 = min(int(max(x[a], x[b], x[c])) + 1, self.width)
+            y0 = max(int(min(y[a], y[b], y[c])), 0)
+            y1 = min(int(max(y[a], y[b], y[c])) + 1, self.height)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            px, py = np.meshgrid(np.arange(x0, x1) + 0.5, np.arange(y0, y1) + 0.5)
+            area = (x[b] - x[a]) * (y[c] - y[a]) - (x[c] - x[a]) * (y[b] - y[a])
+            wa = ((x[b] - px) * (y[c] - py) - (x[c] - px) * (y[b] - py)) / area
+            wb = ((x[c] - px) * (y[a] - py) - (x[a] - px) * (y[c] - py)) / area
+            wc = 1 - wa - wb
+            inside = (wa >= 0) & (wb >= 0) & (wc >= 0)
+            if not inside.any():
+                continue
+            depth = wa * z[a] + wb * z[b] + wc * z[c]
+            target = self.depth[y0:y1, x0:x1]
+            inside &= (depth < target) & (depth >= 0) & (depth <= 1)
+            if not inside.any():
+                continue
+            # Perspective correct interpolation of the colors.
+            pa, pb, pc = wa * inverse_w[a], wb * inverse_w[b], wc * inverse_w[c]
+            total = pa + pb + pc
+            color = (pa[..., None] * mesh.colors[a] + pb[..., None] * mesh.colors[b] + pc[..., None] * mesh.colors[c]) / total[..., None]
+            self._blend(y0, y1, x0, x1, inside, color, depth)
+
+    def _clip_segment(self, xa, ya, xb, yb):
+        '''Returns the range of t for which the segment from a to b is in the viewport, or None.'''
+        t0, t1 = 0.0, 1.0
+        dx, dy = xb - xa, yb - ya
+        for p, q in ((-dx, xa), (dx, self.width - xa), (-dy, ya), (dy, self.height - ya)):
+            if p == 0:
+                if q < 0:
+                    return None
+            else:
+                r = q / p
+                if p < 0:
+                    t0 = max(t0, r)
+                else:
+                    t1 = min(t1, r)
+        if t0 > t1:
+            return None
+        return t0, t1
+
+    def _draw_lines(self, mesh, x, y, z, visible):
+        # A vertex just in front of the camera projects very far away, only the part on screen is rasterized.
+        for a, b in mesh.lines[visible[mesh.lines].all(axis=1)].tolist():
+            clipped = self._clip_segment(x[a], y[a], x[b], y[b])
+            if clipped is None:
+                continue
+            t0, t1 = clipped
+            steps = int(max(abs(x[b] - x[a]), abs(y[b] - y[a])) * (t1 - t0)) + 1
+            t = np.linspace(t0, t1, steps + 1)
+            px = (x[a] + (x[b] - x[a]) * t).astype(np.int64)
+            py = (y[a] + (y[b] - y[a]) * t).astype(np.int64)
+            pz = z[a] + (z[b] - z[a]) * t
+            color = mesh.colors[a] + (mesh.colors[b] - mesh.colors[a]) * t[:, None]
+            inside = (px >= 0) & (px < self.width) & (py >= 0) & (py < self.height) & (pz >= 0) & (pz <= 1)
+            px, py, pz, color = px[inside], py[inside], pz[inside], color[inside]
+            passed = pz < self.depth[py, px]
+            px, py, pz, color = px[passed], py[passed], pz[passed], color[passed]
+            alpha = color[:, 3:]
+            self.color[py, px] = color * alpha + self.color[py, px] * (1 - alpha)
+            self.depth[py, px] = pz
+
+    def _blend(self, y0, y1, x0, x1, mask, color, depth):
+        '''Blend the masked pixels of a region with the source alpha, and write their depth.'''
+        region = self.color[y0:y1, x0:x1]
+        source = color[mask]
+        alpha = source[:, 3:]
+        region[mask] = source * alpha + region[mask] * (1 - alpha)
+        self.depth[y0:y1, x0:x1][mask] = depth[mask]
+
+    def pixels(self):
+        '''Returns the rendered image as a (height, width, 4) uint8 array, the first row is the top of the image.'''
+        return (np.clip(self.color, 0, 1) * 255 + 0.5).astype(np.uint8)
@@ -0,0 +1,246 @@
+from .Mesh import Mesh, is_empty_bounds
+from .SpatialIndex import morton_codes
+import numpy as np
+import weakref
+
+# Number of triangles grouped under a single box, the boxes are tested before the triangles.
+CHUNK_SIZE = 64
+
+class Hit:
+    '''What a ray hit first.
+    Args:
+        renderable: the renderable that was hit, as listed in the picked objects.
+        mesh (Mesh): the mesh holding the triangle.
+        triangle (int): the index of the triangle in mesh.triangles.
+        distance (float): where the ray hit, 0 is its origin and 1 its end.
+        point (numpy.ndarray): the point that was hit, in the space of the picked objects.
+    '''
+
+    def __init__(self, renderable, mesh, triangle, distance, point):
+        self.renderable = renderable
+        self.mesh = mesh
+        self.triangle = triangle
+        self.distance = distance
+        self.point = point
+
+    def __repr__(self):
+        return 'Hit({}, triangle={}, distance={})'.format(self.renderable.__class__.__name__, self.triangle, self.distance)
+
+def ray_from_window(x, y, width, height, matrix):
+    '''Build the ray going through a pixel of the window, from the near plane to the far plane.
+    Args:
+        x (int), y (int): the window coordinates, from the top left corner as given by GLUT.
+        width (int), height (int): the size of the window.
+        matrix (numpy.ndarray): 4x4 array of the transformation from the space of the objects to the clip space.
+    Returns:
+        tuple: the origin of the ray on the near plane, and the vector from it to the far plane.
+    '''
+    inverse = np.linalg.inv(np.asarray(matrix, dtype=np.float64))
+    nx = 2 * (x + 0.5) / width - 1
+    ny = 1 - 2 * (y + 0.5) / height
+    near = np.matmul((nx, ny, -1.0, 1.0), inverse)
+    far = np.matmul((nx, ny, 1.0, 1.0), inverse)
+    near = near[:3] / near[3]
+    far = far[:3] / far[3]
+    return near, far - near
+
+def _slabs(lows, highs, origin, direction, max_distance):
+    '''intersect_boxes with the corners given as (3, n) arrays, one row per axis.'''
+    near = np.zeros(lows.shape[1])
+    far = np.full(lows.shape[1], float(max_distance))
+    with np.errstate(divide='ignore', over='ignore', invalid='ignore'):
+        for axis in range(0, 3):
+            # A tiny direction instead of 0 sends the slabs the ray is parallel to either to infinity or to nothing.
+            inverse = 1 / (direction[axis] if direction[axis] != 0 else 1e-300)
+            t0 = (lows[axis] - origin[axis]) * inverse
+            t1 = (highs[axis] - origin[axis]) * inverse
+            if inverse < 0:
+                t0, t1 = t1, t0
+            np.maximum(near, t0, out=near)
+            np.minimum(far, t1, out=far)
+    return near <= far, near
+
+def intersect_boxes(lows, highs, origin, direction, max_distance=1.0):
+    '''Test a ray against many axis aligned boxes at once.
+    Args:
+        lows (numpy.ndarray): (n, 3) array of the minimum corners.
+        highs (numpy.ndarray): (n, 3) array of the maximum corners.
+        origin (array like): the start of the ray.
+        direction (array like): the vector from the start to the end of the ray.
+        max_distance (float): boxes entered after this distance are not crossed.
+    Returns:
+        tuple: (n,) boolean array of the boxes crossed by the ray, and the distance at which it enters them.
+    '''
+    return _slabs(np.asarray(lows, dtype=np.float64).T, np.asarray(highs, dtype=np.float64).T,
+        np.asarray(origin, dtype=np.float64), np.asarray(direction, dtype=np.float64), max_distance)
+
+def _children(indices, count):
+    '''The indices of the items grouped under the given groups.'''
+    children = (indices[:, None] * CHUNK_SIZE + np.arange(CHUNK_SIZE)).ravel()
+    return children[children < count]
+
+class _Triangles:
+    '''The triangles of a mesh prepared for ray tests.
+    Neighbouring triangles are grouped in chunks of CHUNK_SIZE, the chunks in groups of CHUNK_SIZE
+    chunks and so on; a ray only goes down into the groups it crosses.
+    '''
+
+    def __init__(self, mesh):
+        self.version = mesh.version
+        vertices = mesh.vertices.astype(np.float64)
+        triangles = mesh.triangles.astype(np.int64)
+        a, b, c = vertices[triangles[:, 0]], vertices[triangles[:, 1]], vertices[triangles[:, 2]]
+        order = np.argsort(morton_codes((a + b + c) / 3), kind='stable')
+        a, b, c = a[order], b[order], c[order]
+        # The index in mesh.triangles of each sorted triangle.
+        self.order = order
+        self.origin = a
+        self.edge1 = b - a
+        self.edge2 = c - a
+        # Boxes of every level as (3, n) arrays, from the chunks of triangles up to the fewest groups.
+        self.levels = []
+        lows = np.minimum(np.minimum(a, b), c)
+        highs = np.maximum(np.maximum(a, b), c)
+        while True:
+            starts = np.arange(0, len(lows), CHUNK_SIZE)
+            lows = np.minimum.reduceat(lows, starts)
+            highs = np.maximum.reduceat(highs, starts)
+            self.levels.insert(0, (np.ascontiguousarray(lows.T), np.ascontiguousarray(highs.T)))
+            if len(lows) <= CHUNK_SIZE:
+                break
+
+    def intersect(self, origin, direction, max_distance, front=1.0):
+        '''Find the nearest triangle hit by a ray (Moller-Trumbore).
+        Args:
+            front (float): 1 to only hit the counter clockwise faces, -1 for the clockwise ones, 0 for both.
+        Returns:
+            tuple: the distance and the index of the triangle in mesh.triangles, or None.
+        '''
+        indices = None
+        for lows, highs in self.levels:
+            if indices is None:
+                crossed, _ = _slabs(lows, highs, origin, direction, max_distance)
+                indices = np.flatnonzero(crossed)
+            else:
+                indices = _children(indices, lows.shape[1])
+                crossed, _ = _slabs(lows[:, indices], highs[:, indices], origin, direction, max_distance)
+                indices = indices[crossed]
+            if len(indices) == 0:
+                return None
+        indices = _children(indices, len(self.order))
+        v0, e1, e2 = self.origin[indices], self.edge1[indices], self.edge2[indices]
+        p = np.cross(direction, e2)
+        determinant = np.einsum('ij,ij->i', e1, p)
+        if front:
+            valid = determinant * front > 1e-12
+        else:
+            valid = np.abs(determinant) > 1e-12
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inverse = 1 / determinant
+            s = origin - v0
+            u = np.einsum('ij,ij->i', s, p) * inverse
+            q = np.cross(s, e1)
+            v = np.matmul(q, direction) * inverse
+            t = np.einsum('ij,ij->i', e2, q) * inverse
+            valid &= (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0) & (t <= max_distance)
+        if not valid.any():
+            return None
+        candidates = np.flatnonzero(valid)
+        nearest = candidates[np.argmin(t[candidates])]
+        return float(t[nearest]), int(self.order[indices[nearest]])
+
+# Prepared triangles of the picked meshes, rebuilt when a mesh changes.
+_triangles = weakref.WeakKeyDictionary()
+
+def intersect_mesh(mesh, origin, direction, max_distance=1.0, front=1.0):
+    '''Find the nearest triangle of a mesh hit by a ray.
+    The triangles are prepared once and kept until the mesh changes.
+    Args:
+        mesh (Mesh): the mesh to test.
+        origin (array like): the start of the ray.
+        direction (array like): the vector from the start to the end of the ray.
+        max_distance (float): only hits before this distance are returned.
+        front (float): 1 to only hit the counter clockwise faces, -1 for the clockwise ones, 0 for both.
+    Returns:
+        tuple: the distance and the index of the triangle in mesh.triangles, or None.
+    '''
+    if len(mesh.triangles) == 0:
+        return None
+    triangles = _triangles.get(mesh)
+    if triangles is None or triangles.version != mesh.version:
+        triangles = _triangles[mesh] = _Triangles(mesh)
+    return triangles.intersect(np.asarray(origin, dtype=np.float64), np.asarray(direction, dtype=np.float64), max_distance, front)
+
+def intersect_renderable(obj, origin, direction, max_distance=1.0):
+    '''Find the nearest front facing triangle of a renderable or a mesh hit by a ray.
+    Returns:
+        Hit: the hit, or None.
+    '''
+    if isinstance(obj, Mesh):
+        pairs = [(None, obj)]
+    elif hasattr(obj, 'meshes'):
+        pairs = obj.meshes()
+    else:
+        return None
+    origin = np.asarray(origin, dtype=np.float64)
+    direction = np.asarray(direction, dtype=np.float64)
+    best = None
+    for matrix, mesh in pairs:
+        if len(mesh.triangles) == 0:
+            continue
+        if matrix is None:
+            local_origin, local_direction, front = origin, direction, 1.0
+        else:
+            # Bring the ray into the space of the mesh, distances along the ray stay the same.
+            matrix = np.asarray(matrix, dtype=np.float64)
+            inverse = np.linalg.inv(matrix)
+            local_origin = np.matmul(np.append(origin, 1.0), inverse)[:3]
+            local_direction = np.matmul(direction, inverse[:3, :3])
+            # Reflections turn the clockwise faces into the front faces.
+            front = 1.0 if np.linalg.det(matrix[:3, :3]) >= 0 else -1.0
+        result = intersect_mesh(mesh, local_origin, local_direction, max_distance, front)
+        if result is not None:
+            distance, triangle = result
+            max_distance = distance
+            best = Hit(obj, mesh, triangle, distance, origin + direction * distance)
+    return best
+
+def pick(objects, origin, direction, index=None):
+    '''Find the object hit first by a ray.
+    Args:
+        objects (list): the renderables to test.
+        origin (array like): the start of the ray.
+        direction (array like): the vector from the start to the end of the ray.
+        index (SpatialIndex.BoundingVolumeHierarchy): an index over objects, used to only test the objects along the ray.
+    Returns:
+        Hit: the nearest hit, or None.
+    '''
+    origin = np.asarray(origin, dtype=np.float64)
+    direction = np.asarray(direction, dtype=np.float64)
+    if index is not None:
+        candidates = index.query_ray(origin, direction, 1.0)
+        candidates.extend((0.0, obj) for obj in index.get_unbounded())
+    else:
+        candidates = []
+        tested, lows, highs = [], [], []
+        for obj in objects:
+            bounds = obj.get_bounds() if hasattr(obj, 'get_bounds') else None
+            if bounds is None:
+                candidates.append((0.0, obj))
+            elif not is_empty_bounds(bounds):
+                tested.append(obj)
+                lows.append(bounds[0])
+                highs.append(bounds[1])
+        if tested:
+            crossed, near = intersect_boxes(np.array(lows), np.array(highs), origin, direction)
+            candidates.extend((float(near[i]), tested[i]) for i in np.flatnonzero(crossed).tolist())
+    candidates.sort(key=lambda c: c[0])
+    best = None
+    for entry, obj in candidates:
+        if best is not None and entry > best.distance:
+            # Every remaining object starts behind the nearest hit.
+            break
+        hit = intersect_renderable(obj, origin, direction, best.distance if best else 1.0)
+        if hit is not None:
+            best = hit
+    return best
@@ -0,0 +1,159 @@
+from OpenGL.GL import glFinish
+from collections import deque
+import json
+import csv
+import io
+import time
+import weakref
+
+class FrameProfiler:
+    '''Records the timings of the render loop, frame by frame.
+    Profiling is opt-in; while disabled the render loop only checks the enabled flag.
+    Timings are in seconds. Unless synchronize is set, they measure the time
+    spent issuing the OpenGL calls, not the time the GPU takes to execute them.
+    Args:
+        capacity (int): the number of frames to keep, older frames are discarded.
+    '''
+
+    # The phases of a frame, in order.
+    PHASES = ('update', 'pre_render', 'scene', 'post_render', 'swap')
+
+    def __init__(self, capacity=600):
+        self.enabled = False
+        # Call glFinish at the end of every phase so the timings include the GPU work.
+        self.synchronize = False
+        # Ring buffer of the recorded frames.
+        self.frames = deque(maxlen=capacity)
+        # Draw cost of each renderable, keyed by the renderable; the cost goes away with the renderable.
+        self.draw_costs = weakref.WeakKeyDictionary()
+        self.frame_count = 0
+        self._current = None
+        self._begin = 0
+        self._last = 0
+
+    def enable(self, synchronize=False):
+        self.synchronize = synchronize
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        self._current = None
+
+    def is_recording(self):
+        '''Returns true between begin_frame and end_frame.'''
+        return self._current is not None
+
+    def begin_frame(self):
+        '''Start recording a frame.'''
+        self.frame_count += 1
+        self._current = {'frame': self.frame_count, 'start': time.time()}
+        self._last = time.perf_counter()
+        self._begin = self._last
+
+    def lap(self, phase):
+        '''Record the time spent since the previous phase as the time of phase.'''
+        if self._current is None:
+            return
+        if self.synchronize:
+            glFinish()
+        now = time.perf_counter()
+        self._current[phase] = now - self._last
+        self._last = now
+
+    def draw(self, obj, index=None):
+        '''Render an object and record the time it took.
+        Args:
+            obj (Renderable): the object to render.
+            index (int): the index of the object in the list of renderables, used to label it in the reports.
+        '''
+        start = time.perf_counter()
+        obj.render()
+        if self.synchronize:
+            glFinish()
+        elapsed = time.perf_counter() - start
+        try:
+            cost = self.draw_costs.get(obj)
+        except TypeError:
+            # The object can not be referenced weakly, its cost is not recorded.
+            return
+        if cost is None:
+            cost = self.draw_costs[obj] = {
+                'label': obj.__class__.__name__ if index is None else '{}[{}]'.format(obj.__class__.__name__, index),
+                'count': 0,
+                'total': 0.0,
+                'last': 0.0,
+            }
+        cost['count'] += 1
+        cost['total'] += elapsed
+        cost['last'] = elapsed
+
+    def end_frame(self):
+        '''Finish recording the current frame.'''
+        if self._current is None:
+            return
+        self._current['total'] = time.perf_counter() - self._begin
+        self.frames.append(self._current)
+        self._current = None
+
+    def reset(self):
+        '''Discard every recorded timing.'''
+        self.frames.clear()
+        self.draw_costs.clear()
+        self.frame_count = 0
+
+    def percentiles(self, phase='total', percents=(50, 95, 99)):
+        '''Returns the percentiles of the time of a phase over the recorded frames.
+        Args:
+            phase (str): 'total' or one of PHASES.
+            percents (tuple): the percentiles to compute.
+        Returns:
+            dict: the time of the phase, keyed by 'p<percent>'.
+        '''
+        values = sorted(f[phase] for f in self.frames if phase in f)
+        retval = {}
+        for p in percents:
+            key = 'p' + str(p)
+            if values:
+                # Nearest rank percentile.
+                index = min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))
+                retval[key] = values[index]
+            else:
+                retval[key] = None
+        return retval
+
+    def summary(self):
+        '''Returns the percentiles of every phase and the draw cost of every renderable.'''
+        retval = {
+            'frames': len(self.frames),
+            'phases': {},
+            'draws': sorted(self.draw_costs.values(), key=lambda c: c['total'], reverse=True),
+        }
+        for phase in self.PHASES + ('total',):
+            retval['phases'][phase] = self.percentiles(phase)
+        return retval
+
+    def to_json(self, path=None):
+        '''Dump the recorded frames and the summary as JSON.
+        Args:
+            path (str): the file to write to; if None, the JSON is returned as a string.
+        '''
+        data = json.dumps({'summary': self.summary(), 'frames': list(self.frames)}, indent=2)
+        if path is None:
+            return data
+        with open(path, 'w') as f:
+            f.write(data)
+
+    def to_csv(self, path=None):
+        '''Dump the recorded frames as CSV, one row per frame.
+        Args:
+            path (str): the file to write to; if None, the CSV is returned as a string.
+        '''
+        out = io.StringIO()
+        writer = csv.DictWriter(out, ('frame', 'start') + self.PHASES + ('total',))
+        writer.writeheader()
+        for frame in self.frames:
+            writer.writerow(frame)
+        if path is None:
+            return out.getvalue()
+        with open(path, 'w', newline='') as f:
+            f.write(out.getvalue())
@@ -0,0 +1,120 @@
+from collections import deque
+import time
+
+# Redraw as often as possible.
+CONTINUOUS = 'continuous'
+# Redraw at a target frame rate.
+CAPPED = 'capped'
+# Redraw only when something changed, at most at the target frame rate.
+ON_DEMAND = 'on_demand'
+MODES = (CONTINUOUS, CAPPED, ON_DEMAND)
+
+class RenderPolicy:
+    '''Decides when the window is redrawn, and measures the frame rate actually achieved.
+    With CAPPED and ON_DEMAND the render loop is driven by a timer ticking at the target frame
+    rate instead of the idle callback, so the process sleeps between frames. With ON_DEMAND a tick
+    only redraws if the scene changed or a redraw was requested.
+    Args:
+        mode (str): CONTINUOUS, CAPPED or ON_DEMAND.
+        fps (float): the target frame rate of CAPPED and ON_DEMAND.
+    '''
+
+    def __init__(self, mode=CONTINUOUS, fps=60.0):
+        self.mode = CONTINUOUS
+        self.fps = 60.0
+        self.set_mode(mode, fps)
+        self._requested = True
+        # Whether the last tick skipped drawing, and whether a redraw followed skipped ticks.
+        self._idle = False
+        self._woke = False
+        # Time of the next tick, ticks are scheduled from it to keep a steady rate.
+        self._next_tick = None
+        # Times of the frames drawn during the last second.
+        self._frames = deque()
+        self.frame_count = 0
+
+    def set_mode(self, mode, fps=None):
+        '''Change the policy.
+        Args:
+            mode (str): CONTINUOUS, CAPPED or ON_DEMAND.
+            fps (float): the target frame rate, unchanged if None.
+        '''
+        if mode not in MODES:
+            raise ValueError("unknown render policy '{}', expected one of {}".format(mode, ', '.join(MODES)))
+        if fps is not None:
+            if not isinstance(fps, (int, float)):
+                raise TypeError("expected the frame rate to be a number, got {}".format(fps.__class__.__name__))
+            if fps <= 0:
+                raise ValueError("the frame rate must be positive, got {}".format(fps))
+            self.fps = float(fps)
+        self.mode = mode
+        self._next_tick = None
+        self._requested = True
+
+    def request_redraw(self):
+        '''Redraw at the next tick, even if the scene did not change.'''
+        self._requested = True
+
+    def next_delay(self, now=None):
+        '''Returns the time in seconds until the next tick.
+        Ticks are spaced from the time they were due rather than from the time they ran, so timer
+        latency does not lower the frame rate; after falling behind by a whole frame the schedule restarts.
+        '''
+        if now is None:
+            now = time.perf_counter()
+        interval = 1 / self.fps
+        if self._next_tick is None or now - self._next_tick > interval:
+            self._next_tick = now
+        self._next_tick += interval
+        return max(0.0, self._next_tick - now)
+
+    def should_redraw(self, changed):
+        '''Returns true if a tick has to redraw.
+        Args:
+            changed (bool): whether the scene may have changed since the last frame.
+        '''
+        if self.mode != ON_DEMAND or changed or self._requested:
+            self._requested = False
+            self._woke = self._woke or self._idle
+            self._idle = False
+            return True
+        self._idle = True
+        return False
+
+    def woke_up(self):
+        '''Returns true once after a redraw that follows ticks which drew nothing.
+        The time spent idle is not simulated time, the render loop restarts its clock then.
+        '''
+        woke = self._woke
+        self._woke = False
+        return woke
+
+    def frame_drawn(self, now=None):
+        '''Record a frame, called by the render loop after every frame.'''
+        if now is None:
+            now = time.perf_counter()
+        self.frame_count += 1
+        self._frames.append(now)
+        self._forget(now)
+
+    def _forget(self, now):
+        while self._frames and now - self._frames[0] > 1.0:
+            self._frames.popleft()
+
+    def get_effective_fps(self, now=None):
+        '''Returns the number of frames drawn during the last second.'''
+        if now is None:
+            now = time.perf_counter()
+        self._forget(now)
+        return float(len(self._frames))
+
+    def report(self):
+        '''Returns the policy, the target frame rate, the effective frame rate and the number of frames drawn.'''
+        return {
+            'mode': self.mode,
+            'target_fps': None if self.mode == CONTINUOUS else self.fps,
+            'fps': self.get_effective_fps(),
+            'frames': self.frame_count,
+        }
+
+    effective_fps = property(get_effective_fps)
@@ -1,32 +1,70 @@
 from OpenGL.GL import *
+import numpy as np
 import math
+import weakref
+from .Mesh import Mesh, GeometryCache, geometry_cache, DEFAULT_COLOR, EMPTY_BOUNDS, transform_points, transform_bounds, merge_bounds, to_rgba
 from functools import reduce
 import threading
 import time
+from collections import deque
+from abc import ABC, abstractmethod
 
 class Vector:
-    '''Constains the x, y and z information'''
+    '''Constains the x, y and z information.
+    The coordinates are stored in slots, a vector takes about half the memory of one storing a tuple
+    in a __dict__. A vector can be used as a sequence of 3 values, so it converts directly to a tuple or
+    a numpy array; to store many points, use a VectorArray instead.
+    '''
+
+    __slots__ = ('x', 'y', 'z')
 
     def __init__(self, x, y, z = 0):
-        self.vector = (x, y, z)
+        self.x = x
+        self.y = y
+        self.z = z
 
     def set_x(self, val):
-        self.vector = (val, self.vector[1], self.vector[2])
+        self.x = val
 
     def get_x(self):
-        return self.vector[0]
+        return self.x
 
     def set_y(self, val):
-        self.vector = (self.vector[0], val, self.vector[2])
+        self.y = val
 
     def get_y(self):
-        return self.vector[1]
+        return self.y
 
     def set_z(self, val):
-        self.vector = (self.vector[0], self.vector[1], val)
+        self.z = val
 
     def get_z(self):
-        return self.vector[2]
+        return self.z
+
+    def get_vector(self):
+        return (self.x, self.y, self.z)
+
+    def set_vector(self, vector):
+        self.x, self.y, self.z = vector
+
+    def __len__(self):
+        return 3
+
+    def __iter__(self):
+        yield self.x
+        yield self.y
+        yield self.z
+
+    def __getitem__(self, index):
+        return (self.x, self.y, self.z)[index]
+
+    def equals(self, other):
+        '''Returns true if other has the same coordinates.
+        Vectors compare and hash by identity, so that they can key dicts and sets while being modified.
+        Args:
+            other (Vector or list or tuple): the vector to compare with.
+        '''
+        return len(other) == 3 and self.x == other[0] and self.y == other[1] and self.z == other[2]
 
     def __str__(self):
         return '(' + str(self.x) + ', ' + str(self.y) + ', ' + str(self.z) + ')'
@@ -39,7 +77,7 @@ class Vector:
             normalized vector.
         '''
         if isinstance(self, Vector):
-            x, y, z = self.vector
+            x, y, z = self.x, self.y, self.z
         elif (isinstance(self, tuple) or (isinstance(self, list))) and len(self) == 3:
             x, y, z = self
         else:
@@ -60,209 +98,795 @@ class Vector:
             float: length of the vector.
         '''
         if isinstance(self, Vector):
-            x, y, z = self.vector
+            x, y, z = self.x, self.y, self.z
         elif (isinstance(self, tuple) or (isinstance(self, list))) and len(self) == 3:
             x, y, z = self
         else:
             raise TypeError("unable to get the vector length of type: {}".format(self.__class__.__name__))
         return (x**2 + y**2 + z**2)**0.5
 
-    x = property(get_x, set_x)
-    y = property(get_y, set_y)
-    z = property(get_z, set_z)
+    vector = property(get_vector, set_vector)
 
-class Line:
+def to_points(points):
+    '''Convert points to a (n, 3) float64 array.
+    Args:
+        points: a VectorArray, a numpy array, or a list of Vector or tuple or list of x, y and z.
+    Returns:
+        numpy.ndarray: (n, 3) array of x, y and z; a VectorArray or float64 array is not copied.
+    '''
+    if isinstance(points, VectorArray):
+        return points.array
+    if isinstance(points, np.ndarray):
+        if points.ndim == 0 or points.shape[-1] != 3:
+            raise ValueError("expected an array of points, got an array of shape {}".format(points.shape))
+        return np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    retval = []
+    for p in points:
+        if isinstance(p, Vector):
+            retval.append((p.x, p.y, p.z))
+        elif (isinstance(p, tuple) or isinstance(p, list) or isinstance(p, np.ndarray)) and len(p) == 3:
+            retval.append(p)
+        else:
+            raise TypeError("type {} not supported as a vertex".format(p.__class__.__name__))
+    return np.array(retval, dtype=np.float64).reshape(-1, 3)
 
-    def __init__(self, p1, p2, color=None):
-        # Accepts both Vertex and tuple.
-        self.vertices = [p1, p2]
+class VectorArray:
+    '''A list of vectors stored in a single (n, 3) float64 numpy array.
+    It takes 24 bytes per vector, and can be passed directly to Line, Tri, Quad, their from_points
+    constructor and Builder without converting each vector. Indexing with an integer returns a Vector
+    holding a copy of the values; indexing with a slice or an index array returns a VectorArray.
+    Args:
+        points: the points, see to_points; a float64 array is used without copying it.
+    '''
+
+    __slots__ = ('array',)
+
+    def __init__(self, points=()):
+        self.array = to_points(points)
+
+    def __len__(self):
+        return len(self.array)
+
+    def __iter__(self):
+        for x, y, z in self.array.tolist():
+            yield Vector(x, y, z)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return Vector(*self.array[index].tolist())
+        return VectorArray(self.array[index])
+
+    def __setitem__(self, index, value):
+        if isinstance(index, (int, np.integer)):
+            self.array[index] = tuple(value)
+        else:
+            self.array[index] = to_points(value)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.array if dtype is None else self.array.astype(dtype)
+
+    def __str__(self):
+        return '[' + ', '.join(str(tuple(p)) for p in self.array.tolist()) + ']'
+
+    def lengths(self):
+        '''Returns the length of every vector as a (n,) array.'''
+        return np.linalg.norm(self.array, axis=1)
+
+    def normalize(self):
+        '''Returns a VectorArray of the vectors scaled to a length of 1.'''
+        return VectorArray(self.array / self.lengths()[:, None])
+
+    def applyTransformation(self, transformer):
+        if isinstance(transformer, TransformationMatrix):
+            self.array[...] = transform_points(self.array, transformer)
+        else:
+            raise TypeError("trying to transform a {} with {}".format(self.__class__.__name__, transformer.__class__.__name__))
+
+class _VertexView(Vector):
+    '''A vertex of a primitive, setting its coordinates changes the primitive.'''
+
+    __slots__ = ('_primitive', '_index')
+
+    def __init__(self, primitive, index):
+        self._primitive = primitive
+        self._index = index
+
+    def _get(self, axis):
+        return float(self._primitive.points[self._index, axis])
+
+    def _set(self, axis, value):
+        self._primitive.points[self._index, axis] = value
+        self._primitive.mark_dirty()
+
+    def set_vector(self, vector):
+        self._primitive.points[self._index] = tuple(vector)
+        self._primitive.mark_dirty()
+
+    x = property(lambda self: self._get(0), lambda self, value: self._set(0, value))
+    y = property(lambda self: self._get(1), lambda self, value: self._set(1, value))
+    z = property(lambda self: self._get(2), lambda self, value: self._set(2, value))
+
+class PrimitiveVertices(VectorArray):
+    '''The vertices of a primitive, as returned by Primitive.vertices.
+    Reading goes to the vertex array of the primitive, so the values are always current. Setting a
+    vertex, or a coordinate of a vector returned by indexing or iterating, changes the primitive and
+    marks it as changed. Slices are read only copies.
+    '''
+
+    __slots__ = ('_primitive',)
+
+    def __init__(self, primitive):
+        self._primitive = primitive
+
+    def get_array(self):
+        return self._primitive.points
+
+    def _index(self, index):
+        size = self._primitive.size
+        if not -size <= index < size:
+            raise IndexError("vertex index {} out of range".format(index))
+        return int(index) % size
+
+    def __iter__(self):
+        for i in range(0, self._primitive.size):
+            yield _VertexView(self._primitive, i)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return _VertexView(self._primitive, self._index(index))
+        points = self.array[index].copy()
+        points.flags.writeable = False
+        return VectorArray(points)
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self._primitive.mark_dirty()
+
+    def applyTransformation(self, transformer):
+        self._primitive.applyTransformation(transformer)
+
+    array = property(get_array)
+
+class VertexArray:
+    '''Struct-of-arrays storage for vertex positions.
+    All the positions live in a single (n, 3) numpy array, primitives only
+    keep an offset into it, so transforming every vertex is one batched operation.
+    '''
+
+    def __init__(self, capacity=16):
+        self._positions = np.zeros((max(capacity, 1), 3), dtype=np.float64)
+        self.count = 0
+        # Incremented every time a position changes.
+        self.version = 0
+        # The renderables using this array, notified when it changes.
+        self._renderables = None
+
+    def get_positions(self):
+        return self._positions[:self.count]
+
+    def append(self, points):
+        '''Append points to the array.
+        Args:
+            points (array like): a (n, 3) array of x, y and z.
+        Returns:
+            int: the offset of the first appended point.
+        '''
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        offset = self.count
+        needed = offset + len(points)
+        if needed > len(self._positions):
+            # Grow the storage geometrically to keep appends amortized.
+            grown = np.zeros((max(needed, len(self._positions) * 2), 3), dtype=np.float64)
+            grown[:offset] = self._positions[:offset]
+            self._positions = grown
+        self._positions[offset:needed] = points
+        self.count = needed
+        self.mark_dirty()
+        return offset
+
+    def mark_dirty(self):
+        '''Mark the positions as changed.'''
+        self.version += 1
+        if self._renderables:
+            for renderable in list(self._renderables):
+                renderable.mark_bounds_dirty()
+
+    def watch(self, renderable):
+        '''Notify a renderable whenever the positions change.'''
+        if self._renderables is None:
+            self._renderables = weakref.WeakSet()
+        self._renderables.add(renderable)
+
+    def applyTransformation(self, transformer):
+        if isinstance(transformer, TransformationMatrix):
+            positions = self.positions
+            positions[...] = transform_points(positions, transformer)
+            self.mark_dirty()
+        else:
+            raise TypeError("trying to transform a {} with {}".format(self.__class__.__name__, transformer.__class__.__name__))
+
+    def __len__(self):
+        return self.count
+
+    positions = property(get_positions)
+
+class Primitive:
+    '''Base class of Line, Tri and Quad.
+    The vertices are stored in a VertexArray; once the primitive is attached
+    to a Renderable it shares the vertex array of the renderable.
+    '''
+
+    # Number of vertices of the primitive.
+    size = 0
+    # Vertex indices of the triangles and lines making up the primitive, used when compiling to a Mesh.
+    triangle_indices = ()
+    back_triangle_indices = ()
+    line_indices = ()
+
+    def __init__(self, vertices, color=None, twoface=False):
+        # Accepts Vector, tuple, VectorArray and numpy arrays.
+        points = to_points(vertices)
+        if len(points) != self.size:
+            raise ValueError("expected {} vertices, got {}".format(self.size, len(points)))
+        self._version = 0
+        self.store = VertexArray(self.size)
+        self.offset = self.store.append(points)
         if color == None:
-            self.color = []
+            self._color = []
         else:
-            self.color = color
-        for i in range(0, 2):
-            if isinstance(self.vertices[i], tuple): # Convert tuples to vertex.
-                self.vertices[i] = Vector(*self.vertices[i])
-            elif not isinstance(self.vertices[i], Vector): # Handles unsupported type.
-                raise TypeError("type {} not supported as a vertex".format(self.vertices[i].__class__.__name__))
+            self._color = color
+        self._two_face = twoface
+
+    def get_version(self):
+        '''Changes every time the vertices, color or faces of this primitive changes.'''
+        return self._version + self.store.version
+
+    def mark_dirty(self):
+        '''Mark this primitive, and the renderable it is attached to, as changed.
+        Call this after modifying the color list in place.
+        '''
+        self._version += 1
+        self.store.mark_dirty()
+
+    def get_color(self):
+        return self._color
+
+    def set_color(self, color):
+        self._color = color
+        self.mark_dirty()
+
+    def get_two_face(self):
+        return self._two_face
+
+    def set_two_face(self, twoface):
+        self._two_face = twoface
+        self.mark_dirty()
+
+    def get_points(self):
+        '''A (size, 3) view of the vertices of this primitive inside its vertex array.'''
+        return self.store.positions[self.offset:self.offset + self.size]
+
+    @classmethod
+    def from_points(cls, points, color=None, twoface=False):
+        '''Create a primitive from all its vertices at once.
+        Args:
+            points: the vertices, see to_points; a VectorArray or a (size, 3) array is used without converting each vertex.
+        '''
+        primitive = cls.__new__(cls)
+        Primitive.__init__(primitive, points, color, twoface)
+        return primitive
+
+    def get_vertices(self):
+        '''Returns the vertices as a PrimitiveVertices, changing them changes this primitive.'''
+        return PrimitiveVertices(self)
+
+    def set_vertices(self, vertices):
+        points = to_points(vertices)
+        if len(points) != self.size:
+            raise ValueError("expected {} vertices, got {}".format(self.size, len(points)))
+        self.points[...] = points
+        self.mark_dirty()
+
+    def bind(self, store):
+        '''Move the vertices of this primitive into another vertex array.
+        Args:
+            store (VertexArray): the vertex array to store the vertices in.
+        '''
+        points = self.points
+        # Carry the version of the old vertex array so that the version keeps increasing.
+        self._version += self.store.version + 1
+        self.offset = store.append(points)
+        self.store = store
 
     def __str__(self):
-        return '(' + str(self.vertices[0]) + ', ' + str(self.vertices[1]) + ')'
+        return '(' + ', '.join(str(v) for v in self.vertices) + ')'
+
+    def applyTransformation(self, transformer):
+        if isinstance(transformer, TransformationMatrix):
+            points = self.points
+            points[...] = transform_points(points, transformer)
+            self.mark_dirty()
+        else:
+            raise TypeError("trying to transform a {} with {}".format(self.__class__.__name__, transformer.__class__.__name__))
+
+    points = property(get_points)
+    vertices = property(get_vertices, set_vertices)
+    color = property(get_color, set_color)
+    two_face = property(get_two_face, set_two_face)
+    version = property(get_version)
+
+class Line(Primitive):
+
+    size = 2
+    line_indices = ((0, 1),)
+
+    def __init__(self, p1, p2, color=None):
+        super().__init__((p1, p2), color)
 
     def render(self):
         '''Render this object using OpenGL'''
+        points = self.points.tolist()
         # Render line.
         glBegin(GL_LINES)
         if len(self.color) > 0:
             glColor(*self.color[0])
-        glVertex(*self.vertices[0].vector)
+        glVertex(*points[0])
         if len(self.color) > 1:
             glColor(*self.color[1])
-        glVertex(*self.vertices[1].vector)
+        glVertex(*points[1])
         glEnd()
 
-    def applyTransformation(self, transformer):
-        if isinstance(transformer, TransformationMatrix):
-            new = []
-            for p in self.vertices:
-                new.append(transformer * p)
-            self.vertices = new
-        else:
-            raise TypeError("trying to transform a {} with {}".format(self.__class__.__name__, transformer.__class__.__name__))
+class Tri(Primitive):
 
-class Tri:
+    size = 3
+    triangle_indices = ((0, 1, 2),)
+    back_triangle_indices = ((2, 1, 0),)
 
     def __init__(self, p1, p2, p3, color=None, twoface=False):
-        # Accepts both Vertex and tuple.
-        self.vertices = [p1, p2, p3]
-        if color == None:
-            self.color = []
-        else:
-            self.color = color
-        self.two_face = twoface
-        for i in range(0, 3):
-            if isinstance(self.vertices[i], tuple): # Convert tuples to vertex.
-                self.vertices[i] = Vector(*self.vertices[i])
-            elif not isinstance(self.vertices[i], Vector): # Handles unsupported type.
-                raise TypeError("type {} not supported as a vertex".format(self.vertices[i].__class__.__name__))
-
-    def __str__(self):
-        return '(' + str(self.vertices[0]) + ', ' + str(self.vertices[1]) + ', ' + str(self.vertices[2]) + ')'
+        super().__init__((p1, p2, p3), color, twoface)
 
     def render(self):
         '''Render this object using OpenGL'''
+        points = self.points.tolist()
         # Render front face.
         glBegin(GL_TRIANGLES)
         if len(self.color) > 0:
             glColor(*self.color[0])
-        glVertex(*self.vertices[0].vector)
+        glVertex(*points[0])
         if len(self.color) > 1:
             glColor(*self.color[1])
-        glVertex(*self.vertices[1].vector)
+        glVertex(*points[1])
         if len(self.color) > 2:
             glColor(*self.color[2])
-        glVertex(*self.vertices[2].vector)
+        glVertex(*points[2])
         glEnd()
         if self.two_face:
             # Render back face.
             glBegin(GL_TRIANGLES)
             if len(self.color) > 3:
                 glColor(*self.color[2])
-            glVertex(*self.vertices[2].vector)
+            glVertex(*points[2])
             if len(self.color) > 2:
                 glColor(*self.color[1])
-            glVertex(*self.vertices[1].vector)
+            glVertex(*points[1])
             if len(self.color) > 1:
                 glColor(*self.color[0])
-            glVertex(*self.vertices[0].vector)
+            glVertex(*points[0])
             glEnd()
 
-    def applyTransformation(self, transformer):
-        if isinstance(transformer, TransformationMatrix):
-            new = []
-            for p in self.vertices:
-                new.append(transformer * p)
-            self.vertices = new
-        else:
-            raise TypeError("trying to transform a {} with {}".format(self.__class__.__name__, transformer.__class__.__name__))
+class Quad(Primitive):
 
-class Quad:
+    size = 4
+    triangle_indices = ((0, 1, 2), (0, 2, 3))
+    back_triangle_indices = ((3, 2, 1), (3, 1, 0))
 
     def __init__(self, p1, p2, p3, p4, color=None, twoface=False):
-        # Accepts both Vertex and tuple.
-        self.vertices = [p1, p2, p3, p4]
-        if color == None:
-            self.color = []
-        else:
-            self.color = color
-        self.two_face = twoface
-        for i in range(0, 4):
-            if isinstance(self.vertices[i], tuple): # Convert tuples to vertex.
-                self.vertices[i] = Vector(*self.vertices[i])
-            elif not isinstance(self.vertices[i], Vector): # Handles unsupported type.
-                raise TypeError("type {} not supported as a vertex".format(self.vertices[i].__class__.__name__))
-
-    def __str__(self):
-        return '(' + str(self.vertices[0]) + ', ' + str(self.vertices[1]) + ', ' + str(self.vertices[2]) + ', ' + str(self.vertices[3]) + ')'
+        super().__init__((p1, p2, p3, p4), color, twoface)
 
     def render(self):
         '''Render this object using OpenGL'''
+        points = self.points.tolist()
         # Render front face.
         glBegin(GL_QUADS)
         if len(self.color) > 0:
             glColor(*self.color[0])
-        glVertex(*self.vertices[0].vector)
+        glVertex(*points[0])
         if len(self.color) > 1:
             glColor(*self.color[1])
-        glVertex(*self.vertices[1].vector)
+        glVertex(*points[1])
         if len(self.color) > 2:
             glColor(*self.color[2])
-        glVertex(*self.vertices[2].vector)
+        glVertex(*points[2])
         if len(self.color) > 3:
             glColor(*self.color[3])
-        glVertex(*self.vertices[3].vector)
+        glVertex(*points[3])
         glEnd()
         if self.two_face:
             # Render back face.
             glBegin(GL_QUADS)
             if len(self.color) > 3:
                 glColor(*self.color[3])
-            glVertex(*self.vertices[3].vector)
+            glVertex(*points[3])
             if len(self.color) > 2:
                 glColor(*self.color[2])
-            glVertex(*self.vertices[2].vector)
+            glVertex(*points[2])
             if len(self.color) > 1:
                 glColor(*self.color[1])
-            glVertex(*self.vertices[1].vector)
+            glVertex(*points[1])
             if len(self.color) > 0:
                 glColor(*self.color[0])
-            glVertex(*self.vertices[0].vector)
+            glVertex(*points[0])
             glEnd()
 
-    def applyTransformation(self, transformer):
-        if isinstance(transformer, TransformationMatrix):
-            new = []
-            for p in self.vertices:
-                new.append(transformer * p)
-            self.vertices = new
-        else:
-            raise TypeError("trying to transform a {} with {}".format(self.__class__.__name__, transformer.__class__.__name__))
-
 class Renderable:
 
     def __init__(self, *childs):
         self.childs = []
-        if childs:
-            self.childs.extend(childs)
+        # Vertices of all the primitives attached to this object.
+        self.vertex_array = VertexArray()
+        self._version = 0
+        # The compiled primitives and the attached objects that are not primitives.
+        self._mesh = None
+        self._mesh_version = None
+        self._others = []
+        # Cached bounding box and the state it was computed from.
+        self._bounds = None
+        self._bounds_key = None
+        # The objects notified when the bounds of this object may have changed.
+        self._watchers = None
+        self.vertex_array.watch(self)
+        for child in childs:
+            self._attach(child)
         self.transform = Transform()
         self.transformation = [self.transform.matrix]
 
+    def get_transformation(self):
+        return self._transformation
+
+    def set_transformation(self, transformation):
+        if not isinstance(transformation, TransformationStack):
+            transformation = TransformationStack(transformation)
+        self._transformation = transformation
+        transformation.watch(self)
+        self.mark_bounds_dirty()
+
+    def get_version(self):
+        '''Changes every time an object is attached or an attached primitive changes.'''
+        return self._version + self.vertex_array.version
+
+    def mark_dirty(self):
+        '''Mark this object as changed.
+        Call this after modifying the list of attached objects directly.
+        '''
+        self._version += 1
+        self.mark_bounds_dirty()
+
+    def mark_bounds_dirty(self, obj=None):
+        '''Notify the watchers that the bounds of this object may have changed.
+        Called when the geometry or the transformations of this object, or of an attached object, change.
+        '''
+        if self._watchers:
+            for watcher in list(self._watchers):
+                watcher.mark_bounds_dirty(self)
+
+    def watch(self, watcher):
+        '''Call watcher.mark_bounds_dirty(self) whenever the bounds of this object may have changed.'''
+        if self._watchers is None:
+            self._watchers = weakref.WeakSet()
+        self._watchers.add(watcher)
+
+    def compile(self):
+        '''Compile the primitives attached to this object into a single Mesh.
+        The same mesh is updated in place when this object changes, so its
+        geometry stays on the GPU as long as nothing changes.
+        Returns:
+            Mesh: the compiled primitives.
+        '''
+        version = self.version
+        if self._mesh_version != version:
+            primitives = []
+            self._others = []
+            for obj in self.childs:
+                if isinstance(obj, Primitive):
+                    primitives.append(obj)
+                else:
+                    self._others.append(obj)
+            self._mesh = compile_primitives(primitives, self._mesh)
+            self._mesh_version = version
+        return self._mesh
+
     def render(self):
         '''Render this object using OpenGL'''
         glPushMatrix()
-        # Apply transformation matrices.
-        for matrix in self.transformation:
-            if isinstance(matrix, TransformationMatrix):
-                glMultMatrixf(matrix.c_values())
-        # Render all objects attached to this object.
-        for obj in self.childs:
+        # Apply all the transformation matrices at once.
+        glMultMatrixf(self._transformation.composite().c_values())
+        # Render all the attached primitives at once.
+        self.compile().render()
+        # Render all other objects attached to this object.
+        for obj in self._others:
             obj.render()
         glPopMatrix()
     
+    def meshes(self, matrix=None):
+        '''List the meshes of this object and of the renderables attached to it.
+        Args:
+            matrix (numpy.ndarray): 4x4 array of the transformation applied before this object.
+        Returns:
+            list: list of (numpy.ndarray, Mesh), each mesh with the 4x4 array of its full transformation.
+        '''
+        composite = self._transformation.composite().array
+        if matrix is not None:
+            composite = np.matmul(composite, matrix)
+        retval = [(composite, self.compile())]
+        for obj in self._others:
+            if isinstance(obj, Mesh):
+                retval.append((composite, obj))
+            elif hasattr(obj, 'meshes'):
+                retval.extend(obj.meshes(composite))
+        return retval
+
+    def select_level(self, matrix, height):
+        '''Select the level of detail of the chains attached to this object and to the renderables attached to it.
+        Args:
+            matrix (numpy.ndarray): 4x4 array of the transformation from the space of the parent to clip space;
+                if None, the finest levels are selected.
+            height (int): the height of the viewport in pixels.
+        '''
+        self.compile()
+        if not self._others:
+            return
+        if matrix is not None:
+            matrix = np.matmul(self._transformation.composite().array, matrix)
+        for obj in self._others:
+            if hasattr(obj, 'select_level'):
+                obj.select_level(matrix, height)
+
+    def get_bounds_key(self):
+        '''Changes every time the geometry or the transformations of this object or of an attached object change.'''
+        self.compile()
+        key = [self.version, id(self._transformation), self._transformation.version]
+        for obj in self._others:
+            if isinstance(obj, Mesh):
+                key.append((id(obj), obj.version))
+            elif hasattr(obj, 'get_bounds_key'):
+                key.append(obj.get_bounds_key())
+        return tuple(key)
+
+    def get_bounds(self):
+        '''Returns the axis aligned box enclosing this object once transformed, as its minimum and maximum corners.
+        The box is cached until the geometry or the transformations change. It is None when an
+        attached object has no known bounds, such objects are never culled.
+        '''
+        key = self.get_bounds_key()
+        if key != self._bounds_key:
+            boxes = [self._mesh.bounds]
+            for obj in self._others:
+                bounds = obj.get_bounds() if hasattr(obj, 'get_bounds') else None
+                if bounds is None:
+                    boxes = None
+                    break
+                boxes.append(bounds)
+            if boxes is None:
+                self._bounds = None
+            else:
+                self._bounds = transform_bounds(merge_bounds(boxes), self._transformation.composite().array)
+            self._bounds_key = key
+        return self._bounds
+
+    def get_bounding_sphere(self):
+        '''Returns the center and the radius of a sphere enclosing this object once transformed, or None if its bounds are unknown or empty.'''
+        bounds = self.bounds
+        if bounds is None or (bounds[0] > bounds[1]).any():
+            return None
+        return (bounds[0] + bounds[1]) / 2, float(np.linalg.norm(bounds[1] - bounds[0]) / 2)
+
     def attach(self, child):
         if not hasattr(child, 'render'):
             raise TypeError("trying to attach '" + child.__repr__() + "' with no method 'render'")
         else:
-            self.childs.append(child)
+            self._attach(child)
+
+    def _attach(self, child):
+        # The constructor accepts any child, as it always did; those without render fail once drawn.
+        if isinstance(child, Primitive):
+            # Keep the vertices of the primitive along with the others.
+            child.bind(self.vertex_array)
+        elif hasattr(child, 'watch'):
+            child.watch(self)
+        self.childs.append(child)
+        self.mark_dirty()
 
     def applyTransformation(self, transformer):
         if isinstance(transformer, TransformationMatrix):
-            for c in self.childs:
-                c.applyTransformation(transformer)
+            apply_transformation(transformer, self)
         else:
             raise TypeError("trying to transform a {} with {}".format(self.__class__.__name__, transformer.__class__.__name__))
 
+    version = property(get_version)
+    transformation = property(get_transformation, set_transformation)
+    bounds = property(get_bounds)
+    bounding_sphere = property(get_bounding_sphere)
+
+def compile_primitives(primitives, mesh=None):
+    '''Compile a list of primitives into a single Mesh.
+    Vertices without a color takes the color of the previous vertex, as they would in immediate mode.
+    Args:
+        primitives (list): list of Line, Tri and Quad.
+        mesh (Mesh): a mesh to update instead of creating a new one.
+    Returns:
+        Mesh: the compiled primitives.
+    '''
+    positions = []
+    colors = []
+    triangles = []
+    lines = []
+    count = 0
+    current = DEFAULT_COLOR
+    for p in primitives:
+        positions.append(p.points)
+        for i in range(0, p.size):
+            if len(p.color) > i:
+                current = to_rgba(p.color[i])
+            colors.append(current)
+        for indices in p.triangle_indices:
+            triangles.append(tuple(count + i for i in indices))
+        if p.two_face:
+            for indices in p.back_triangle_indices:
+                triangles.append(tuple(count + i for i in indices))
+        for indices in p.line_indices:
+            lines.append(tuple(count + i for i in indices))
+        count += p.size
+    if positions:
+        positions = np.concatenate(positions)
+    if mesh is None:
+        return Mesh(positions, colors if colors else None, triangles, lines)
+    mesh.update(positions, colors if colors else None, triangles, lines)
+    return mesh
+
+def _collect_vertex_arrays(obj, stores, others):
+    '''Collect the vertex arrays holding the vertices of obj and its attached objects.
+    Objects that does not store their vertices in a vertex array are put in others.
+    '''
+    if isinstance(obj, Renderable):
+        stores[id(obj.vertex_array)] = obj.vertex_array
+        for child in obj.childs:
+            if not isinstance(child, Primitive):
+                _collect_vertex_arrays(child, stores, others)
+    else:
+        others.append(obj)
+
+def apply_transformation(transformer, *renderables):
+    '''Apply a transformation to the vertices of several renderables in one call.
+    The vertices of all the renderables are transformed with a single batched operation.
+    Args:
+        transformer (TransformationMatrix): the transformation to apply.
+        renderables (*): the renderables to transform.
+    '''
+    if not isinstance(transformer, TransformationMatrix):
+        raise TypeError("trying to transform with {}".format(transformer.__class__.__name__))
+    stores = {}
+    others = []
+    for obj in renderables:
+        _collect_vertex_arrays(obj, stores, others)
+    stores = [s for s in stores.values() if s.count > 0]
+    if len(stores) == 1:
+        stores[0].applyTransformation(transformer)
+    elif stores:
+        # Transform every vertex at once, then scatter them back to their arrays.
+        transformed = transform_points(np.concatenate([s.positions for s in stores]), transformer)
+        offset = 0
+        for s in stores:
+            s.positions[...] = transformed[offset:offset + s.count]
+            s.mark_dirty()
+            offset += s.count
+    for obj in others:
+        obj.applyTransformation(transformer)
+
+# Identity matrix used to reset transformation matrices.
+_IDENTITY = np.identity(4, dtype=np.float32)
+
+class TransformationStack(list):
+    '''A list of transformation matrices applied one after another.
+    The product of the matrices is cached, it is only computed again when the
+    list or one of its matrices changes. Integers in the list are group markers
+    and are ignored.
+    '''
+
+    def __init__(self, matrices=()):
+        super().__init__(matrices)
+        self._composite = TransformationMatrix()
+        self._dirty = True
+        # Incremented every time the list or one of its matrices changes.
+        self.version = 0
+        # The renderables using this stack, notified when it changes.
+        self._renderables = None
+        for matrix in self:
+            self._watch(matrix)
+
+    def _watch(self, matrix):
+        if isinstance(matrix, TransformationMatrix):
+            matrix.watch(self)
+
+    def mark_dirty(self):
+        '''Mark the composite matrix as outdated.'''
+        self._dirty = True
+        self.version += 1
+        if self._renderables:
+            for renderable in list(self._renderables):
+                renderable.mark_bounds_dirty()
+
+    def watch(self, renderable):
+        '''Notify a renderable whenever the composite matrix changes.'''
+        if self._renderables is None:
+            self._renderables = weakref.WeakSet()
+        self._renderables.add(renderable)
+
+    def composite(self):
+        '''Returns the product of all the matrices.
+        Returns:
+            TransformationMatrix: a matrix equivalent to applying every matrix of the stack in order.
+        '''
+        if self._dirty:
+            # Clear the flag first, a matrix changing during the computation marks it again.
+            self._dirty = False
+            result = _IDENTITY
+            for matrix in list(self):
+                if isinstance(matrix, TransformationMatrix):
+                    result = np.matmul(matrix.array, result)
+            self._composite.reset(result)
+        return self._composite
+
+    def append(self, matrix):
+        super().append(matrix)
+        self._watch(matrix)
+        self.mark_dirty()
+
+    def extend(self, matrices):
+        matrices = list(matrices)
+        super().extend(matrices)
+        for matrix in matrices:
+            self._watch(matrix)
+        self.mark_dirty()
+
+    def insert(self, index, matrix):
+        super().insert(index, matrix)
+        self._watch(matrix)
+        self.mark_dirty()
+
+    def pop(self, *args):
+        matrix = super().pop(*args)
+        self.mark_dirty()
+        return matrix
+
+    def remove(self, matrix):
+        super().remove(matrix)
+        self.mark_dirty()
+
+    def clear(self):
+        super().clear()
+        self.mark_dirty()
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+        super().__setitem__(index, value)
+        for matrix in (value if isinstance(index, slice) else (value,)):
+            self._watch(matrix)
+        self.mark_dirty()
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self.mark_dirty()
+
+    def __iadd__(self, matrices):
+        self.extend(matrices)
+        return self
+
 class Transform:
+    '''A position and a rotation.
+    The rotation is either a Quaternion or a tuple of euler angles in degrees;
+    call reset() after changing them.
+    '''
 
     def __init__(self, position=(0, 0, 0), rotation=(0, 0, 0)):
         self.position = position
@@ -270,128 +894,124 @@ class Transform:
         self.matrix = TransformationMatrix()
         self.reset()
 
-    def reset(self):
+    def get_orientation(self):
+        '''Returns the rotation as a Quaternion.'''
+        if isinstance(self.rotation, Quaternion):
+            return self.rotation
+        return Quaternion.from_euler_angles(*self.rotation)
+
+    orientation = property(get_orientation)
+
+    def reset(self, orientation=None):
+        '''Rebuild the matrix from the position and the rotation.
+        Args:
+            orientation (Quaternion): the rotation to use instead of self.rotation.
+        '''
+        if orientation is None:
+            orientation = self.orientation
+        values = orientation.normalize().to_values()
         # Set positional matrix.
         self.positional_matrix = TransformationMatrix.translate(*self.position)
         # Set rotational matrix.
-        self.rotational_matrix = TransformationMatrix.from_euler_angles(*self.rotation)
-        # Set the actual matrix of the camera.
-        self.matrix.set_identity()
-        self.matrix.multiply(self.positional_matrix)
-        self.matrix.multiply(self.rotational_matrix)
+        self.rotational_matrix = TransformationMatrix(*values)
+        # Set the actual matrix, the translation followed by the rotation.
+        array = self.rotational_matrix.array.copy()
+        array[3, :3] = np.matmul(np.asarray(self.position, dtype=np.float32), array[:3, :3])
+        self.matrix.reset(array)
 
 class TransformationMatrix:
+    '''A 4x4 transformation matrix.
+    The values are kept in a contiguous float32 numpy array, laid out in the
+    order OpenGL expects them, so it can be uploaded without any conversion.
+    '''
 
     def __init__(self, *values):
+        self.array = np.identity(4, dtype=np.float32)
+        # Incremented every time the matrix changes.
+        self.version = 0
+        # The stacks containing this matrix, notified when it changes.
+        self._stacks = None
         if values:
             self.reset(*values)
-        else:
-            self.set_identity()
 
     def c_values(self):
-        if self._cached_c_values == None:
-            # Split the list into a list of 4.
-            segments = []
-            c = 0
-            holder = []
-            # Uses values as a list for the pop functionality.
-            values = list(self.values)
-            while c < 4 and values:
-                # If the value is an int, parse it into float before hand.
-                if isinstance(values[0], int):
-                    values[0] = float(values[0])
-                if isinstance(values[0], float):
-                    holder.append(values[0])
-                    values.pop(0)
-                    c += 1
-                    if c == 4:
-                        segments.append(holder)
-                        holder = []
-                        c = 0
-                else: # Handles error for other types.
-                    raise TypeError("float expected, got " + values[0].__class__.__name__)
-            # Construct a C typed array of array.
-            c_segments = []
-            for seg in segments:
-                c_segments.append((ctypes.c_float * len(seg))(*seg))
-            # Save the constructed array for future use.
-            self._cached_c_values = (ctypes.c_float * 4 * 4)(*c_segments)
-        return self._cached_c_values
+        '''Returns the contiguous float32 array of this matrix, glMultMatrixf takes it without copying.'''
+        return self.array
+
+    def get_values(self):
+        return tuple(self.array.ravel().tolist())
 
     def reset(self, *values):
-        '''Accepts 16 float values'''
-        if len(values) == 16:
-            self.values = tuple(values)
-            self._cached_c_values = None
+        '''Accepts 16 float values, or a single numpy array holding 16 values.'''
+        if len(values) == 1 and isinstance(values[0], np.ndarray) and values[0].size == 16:
+            self.array[...] = values[0].reshape(4, 4)
+        elif len(values) == 16:
+            self.array[...] = np.array(values, dtype=np.float32).reshape(4, 4)
         else:
-            raise ValueError("expected 16 float values, got " + len(values))
+            raise ValueError("expected 16 float values, got {}".format(len(values)))
+        self.mark_dirty()
 
     def set_identity(self):
-        self.reset(
-            1, 0, 0, 0,
-            0, 1, 0, 0,
-            0, 0, 1, 0,
-            0, 0, 0, 1
-        )
+        self.array[...] = _IDENTITY
+        self.mark_dirty()
+
+    def mark_dirty(self):
+        '''Mark the matrix as changed and notify the stacks containing it.
+        Call this after modifying the array directly.
+        '''
+        self.version += 1
+        if self._stacks:
+            for stack in list(self._stacks.values()):
+                stack.mark_dirty()
+
+    def watch(self, stack):
+        '''Notify a stack whenever this matrix changes.'''
+        if self._stacks is None:
+            # Keyed by id as stacks are lists, which are not hashable.
+            self._stacks = weakref.WeakValueDictionary()
+        self._stacks[id(stack)] = stack
 
     def __str__(self):
         return '[' + reduce(lambda x, y: str(x) + ', ' + str(y), self.values) + ']'
 
     def multiply(self, other):
         if isinstance(other, TransformationMatrix):
-            values = []
-            for i in range(0, 4):
-                for j in range(0, 4):
-                    values.append(sum(self.values[i * 4 + k] * other.values[j + k * 4] for k in range(0, 4)))
-            self.reset(*values)
+            self.array[...] = np.matmul(self.array, other.array)
+            self.mark_dirty()
         else:
             raise TypeError("unsupported multiplication between: '{}' and '{}'".format(self.__class__.__name__, other.__class__.__name__))
 
     def __mul__(self, other):
         if isinstance(other, int) or isinstance(other, float):
             # Multiplication with scalar
-            return TransformationMatrix(*[x * other for x in self.values])
-        elif isinstance(other, tuple):
-            # Multiplication with vector.
+            return TransformationMatrix(self.array * other)
+        elif isinstance(other, tuple) or isinstance(other, list):
+            # Multiplication with vector, the result is of the same type as the vector.
             count = len(other)
-            if len(other) < 4:
-                other = (*other, *[1 for _ in range(0, 4 - len(other))])
-            result = (
-                sum([self.values[i * 4] * other[i] for i in range(0, 4)]),
-                sum([self.values[1 + i * 4] * other[i] for i in range(0, 4)]),
-                sum([self.values[2 + i * 4] * other[i] for i in range(0, 4)]),
-                sum([self.values[3 + i * 4] * other[i] for i in range(0, 4)]),
-            )
-            return result[:count]
-        elif isinstance(other, list):
-            # Multiplication with list.
-            count = len(other)
-            other = other[:]
-            while len(other) < 4:
-                other.append(1)
-            result = [
-                sum([self.values[i * 4] * other[i] for i in range(0, 4)]),
-                sum([self.values[1 + i * 4] * other[i] for i in range(0, 4)]),
-                sum([self.values[2 + i * 4] * other[i] for i in range(0, 4)]),
-                sum([self.values[3 + i * 4] * other[i] for i in range(0, 4)]),
-            ]
-            return result[:count]
+            point = list(other)
+            while len(point) < 4:
+                point.append(1)
+            result = np.dot(point, self.array).tolist()[:count]
+            if isinstance(other, tuple):
+                return tuple(result)
+            return result
         elif isinstance(other, Vector):
             # Multiplication with Vector.
             point = (other.x, other.y, other.z, 1)
             result = self * point
             new = Vector(*result[:-1])
             return new
+        elif isinstance(other, VectorArray):
+            # Multiplication with every vector at once.
+            return VectorArray(transform_points(other.array, self))
         elif isinstance(other, TransformationMatrix):
             # Multiplication with other matrix.
-            values = []
-            for i in range(0, 4):
-                for j in range(0, 4):
-                    values.append(sum(self.values[i * 4 + k] * other.values[j + k * 4] for k in range(0, 4)))
-            return TransformationMatrix(*values)
+            return TransformationMatrix(np.matmul(self.array, other.array))
         else:
             raise TypeError("unsupported operand type(s) for *: '{}' and '{}'".format(self.__class__.__name__, other.__class__.__name__))
 
+    values = property(get_values)
+
     @staticmethod
     def translate(x, y, z):
         return TransformationMatrix(
@@ -430,11 +1050,25 @@ class TransformationMatrix:
 
     @staticmethod
     def from_euler_angles(x, y, z):
-        matrix = TransformationMatrix()
-        matrix.multiply(TransformationMatrix.rotate(-y, (0, 1, 0)))
-        matrix.multiply(TransformationMatrix.rotate(-x, (1, 0, 0)))
-        matrix.multiply(TransformationMatrix.rotate(-z, (0, 0, 1)))
-        return matrix
+        # Composed as a quaternion, rather than multiplying three rotation matrices.
+        return Quaternion.from_euler_angles(x, y, z).to_matrix()
+
+    @staticmethod
+    def perspective(fov, aspect, near, far):
+        '''The projection matrix set by gluPerspective.
+        Args:
+            fov (float): vertical field of view in degrees.
+            aspect (float): width / height.
+            near (float): distance to the near plane.
+            far (float): distance to the far plane.
+        '''
+        f = 1 / math.tan(math.radians(fov) / 2)
+        return TransformationMatrix(
+            f / aspect, 0.0, 0.0, 0.0,
+            0.0, f, 0.0, 0.0,
+            0.0, 0.0, (far + near) / (near - far), -1.0,
+            0.0, 0.0, 2 * far * near / (near - far), 0.0
+        )
 
     @staticmethod
     def reflect_point(x, y, z):
@@ -484,145 +1118,556 @@ class TransformationMatrix:
 
     @staticmethod
     def rotate(angle, axis, point=None):
+        '''Rotation around an axis, going through point if given.
+        Args:
+            angle (float): the angle in degrees.
+            axis (tuple): len(axis) == 3, the direction of the axis.
+            point (tuple): len(point) == 3, a point on the axis; defaults to the origin.
+        '''
         if len(axis) != 3:
             raise ValueError("invalid axis: {}".format(axis))
-        retval = []
-        if point and point != (0, 0, 0):
-            retval.append(TransformationMatrix.translate(*[-x for x in point]))
-        if axis == (0, 0, 1) or axis == (0, 0, -1):
-            _, _, z = axis
-            if z == 1:
-                angle = math.radians(angle)
-            else:
-                angle = math.radians(-angle)
-            retval.append(TransformationMatrix(
-                math.cos(angle), math.sin(angle), 0.0, 0.0,
-                -math.sin(angle), math.cos(angle), 0.0, 0.0,
-                0.0, 0.0, 1.0, 0.0,
-                0.0, 0.0, 0.0, 1.0
-            ))
-        elif axis == (0, 1, 0) or axis == (0, -1, 0):
-            _, y, _ = axis
-            if y == 1:
-                angle = math.radians(angle)
-            else:
-                angle = math.radians(-angle)
-            retval.append(TransformationMatrix(
-                math.cos(angle), 0.0, -math.sin(angle), 0.0,
-                0.0, 1.0, 0.0, 0.0,
-                math.sin(angle), 0.0, math.cos(angle), 0.0,
-                0.0, 0.0, 0.0, 1.0
-            ))
-        elif axis == (1, 0, 0) or axis == (-1, 0, 0):
-            x, _, _ = axis
-            if x == 1:
-                angle = math.radians(angle)
-            else:
-                angle = math.radians(-angle)
-            retval.append(TransformationMatrix(
-                1.0, 0.0, 0.0, 0.0,
-                0.0, math.cos(angle), math.sin(angle), 0.0,
-                0.0, -math.sin(angle), math.cos(angle), 0.0,
-                0.0, 0.0, 0.0, 1.0
-            ))
+        axis = tuple(axis)
+        if point:
+            point = tuple(point)
+            if point == (0, 0, 0):
+                point = None
         else:
-            x, y, z = axis
-            # Align axis with xz plane.
-            x_angle = math.degrees(math.atan2(y, z))
-            level_xz = TransformationMatrix.rotate(x_angle, (1, 0, 0))
-            # Align new axis with z axis.
-            nx, ny, nz, _ = level_xz * (x, y, z, 1)
-            y_angle = -math.degrees(math.atan2(nx, nz))
-            level_z = TransformationMatrix.rotate(y_angle, (0, 1, 0))
-            # Rotate around the z axis.
-            rotation = TransformationMatrix.rotate(angle, (0, 0, 1))
-            # Reverse alignment of z axis.
-            i_level_z = TransformationMatrix.rotate(-y_angle, (0, 1, 0))
-            # Reverse alignment of xz plane.
-            i_level_xz = TransformationMatrix.rotate(-x_angle, (1, 0, 0))
-            # Append individual transformation matrix to return value.
-            retval.append(level_xz)
-            retval.append(level_z)
-            retval.append(rotation)
-            retval.append(i_level_z)
-            retval.append(i_level_xz)
-        if point and point != (0, 0, 0):
-            retval.append(TransformationMatrix.translate(*point))
-        if len(retval) == 1:
-            return retval[0]
-        elif len(retval) > 1:
-            # Multiply all the matrix and collapse them into a single matrix.
-            collapsed = retval[0]
-            for i in range(1, len(retval)):
-                collapsed *= retval[i]
-            return collapsed
+            point = None
+        return TransformationMatrix(*_rotation_values(angle, axis, point))
 
-class RotateOverTime(threading.Thread):
+def _rotation_values(angle, axis, point):
+    '''The 16 values of a rotation matrix, built directly from the axis and angle (Rodrigues' formula).'''
+    x, y, z = axis
+    length = math.sqrt(x * x + y * y + z * z)
+    if length == 0:
+        # A null axis rotates around the z axis.
+        x, y, z = 0.0, 0.0, 1.0
+    else:
+        x, y, z = x / length, y / length, z / length
+    angle = math.radians(angle)
+    c = math.cos(angle)
+    s = math.sin(angle)
+    t = 1 - c
+    # Each row is the image of a basis vector.
+    m00, m01, m02 = t * x * x + c, t * x * y + s * z, t * x * z - s * y
+    m10, m11, m12 = t * x * y - s * z, t * y * y + c, t * y * z + s * x
+    m20, m21, m22 = t * x * z + s * y, t * y * z - s * x, t * z * z + c
+    if point:
+        # Rotating around point is translating by point - point * rotation after the rotation.
+        px, py, pz = point
+        tx = px - (px * m00 + py * m10 + pz * m20)
+        ty = py - (px * m01 + py * m11 + pz * m21)
+        tz = pz - (px * m02 + py * m12 + pz * m22)
+    else:
+        tx = ty = tz = 0.0
+    return (
+        m00, m01, m02, 0.0,
+        m10, m11, m12, 0.0,
+        m20, m21, m22, 0.0,
+        tx, ty, tz, 1.0
+    )
 
-    def __init__(self, angle, axis, pivot, speed=360, callback=None):
-        super().__init__()
+def rotation_arrays(angles, axes, points=None):
+    '''Build many rotation matrices at once, see TransformationMatrix.rotate.
+    Args:
+        angles (array like): (n,) array of angles in degrees.
+        axes (array like): (n, 3) array of axes.
+        points (array like): (n, 3) array of points on the axes, defaults to the origin.
+    Returns:
+        numpy.ndarray: (n, 4, 4) float32 array of the matrices.
+    '''
+    angles = np.radians(np.asarray(angles, dtype=np.float64))
+    axes = np.array(axes, dtype=np.float64).reshape(-1, 3)
+    length = np.linalg.norm(axes, axis=1)
+    null = length == 0
+    axes[null] = (0.0, 0.0, 1.0)
+    length[null] = 1.0
+    x, y, z = (axes / length[:, None]).T
+    c = np.cos(angles)
+    s = np.sin(angles)
+    t = 1 - c
+    result = np.zeros((len(angles), 4, 4))
+    result[:, 0, 0], result[:, 0, 1], result[:, 0, 2] = t * x * x + c, t * x * y + s * z, t * x * z - s * y
+    result[:, 1, 0], result[:, 1, 1], result[:, 1, 2] = t * x * y - s * z, t * y * y + c, t * y * z + s * x
+    result[:, 2, 0], result[:, 2, 1], result[:, 2, 2] = t * x * z + s * y, t * y * z - s * x, t * z * z + c
+    if points is not None:
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        result[:, 3, :3] = points - np.einsum('ni,nij->nj', points, result[:, :3, :3])
+    result[:, 3, 3] = 1.0
+    return result.astype(np.float32)
+
+class Quaternion:
+    '''A rotation stored as a unit quaternion w + xi + yj + zk.
+    q * p is the rotation p followed by q, the same as the matrix p.to_matrix() * q.to_matrix().
+    '''
+
+    __slots__ = ('w', 'x', 'y', 'z')
+
+    def __init__(self, w=1.0, x=0.0, y=0.0, z=0.0):
+        self.w = float(w)
+        self.x = float(x)
+        self.y = float(y)
+        self.z = float(z)
+
+    def __iter__(self):
+        return iter((self.w, self.x, self.y, self.z))
+
+    def __eq__(self, other):
+        if isinstance(other, Quaternion):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __str__(self):
+        return 'Quaternion({}, {}, {}, {})'.format(self.w, self.x, self.y, self.z)
+
+    __repr__ = __str__
+
+    def __mul__(self, other):
+        if isinstance(other, Quaternion):
+            # Hamilton product.
+            aw, ax, ay, az = self.w, self.x, self.y, self.z
+            bw, bx, by, bz = other.w, other.x, other.y, other.z
+            return Quaternion(
+                aw * bw - ax * bx - ay * by - az * bz,
+                aw * bx + ax * bw + ay * bz - az * by,
+                aw * by - ax * bz + ay * bw + az * bx,
+                aw * bz + ax * by - ay * bx + az * bw
+            )
+        else:
+            raise TypeError("unsupported operand type(s) for *: '{}' and '{}'".format(self.__class__.__name__, other.__class__.__name__))
+
+    def get_length(self):
+        return math.sqrt(self.w * self.w + self.x * self.x + self.y * self.y + self.z * self.z)
+
+    length = property(get_length)
+
+    def normalize(self):
+        '''Returns this quaternion scaled to a length of 1, rounding errors build up when composing many rotations.'''
+        length = self.length
+        if length == 0:
+            return Quaternion()
+        return Quaternion(self.w / length, self.x / length, self.y / length, self.z / length)
+
+    def conjugate(self):
+        '''Returns the inverse rotation.'''
+        return Quaternion(self.w, -self.x, -self.y, -self.z)
+
+    def rotate(self, point):
+        '''Rotate a point.
+        Args:
+            point (tuple or Vector): the point to rotate.
+        Returns:
+            tuple: the rotated x, y and z.
+        '''
+        if isinstance(point, Vector):
+            point = (point.x, point.y, point.z)
+        px, py, pz = point
+        w, x, y, z = self.w, self.x, self.y, self.z
+        # v + 2w(u x v) + 2u x (u x v), with u the vector part.
+        cx, cy, cz = 2 * (y * pz - z * py), 2 * (z * px - x * pz), 2 * (x * py - y * px)
+        return (
+            px + w * cx + y * cz - z * cy,
+            py + w * cy + z * cx - x * cz,
+            pz + w * cz + x * cy - y * cx
+        )
+
+    def to_values(self):
+        '''The 16 values of the rotation matrix of this quaternion, in the layout of TransformationMatrix.'''
+        w, x, y, z = self.w, self.x, self.y, self.z
+        xx, yy, zz = x * x, y * y, z * z
+        xy, xz, yz = x * y, x * z, y * z
+        wx, wy, wz = w * x, w * y, w * z
+        return (
+            1 - 2 * (yy + zz), 2 * (xy + wz), 2 * (xz - wy), 0.0,
+            2 * (xy - wz), 1 - 2 * (xx + zz), 2 * (yz + wx), 0.0,
+            2 * (xz + wy), 2 * (yz - wx), 1 - 2 * (xx + yy), 0.0,
+            0.0, 0.0, 0.0, 1.0
+        )
+
+    def to_matrix(self):
+        '''Returns the rotation as a TransformationMatrix.'''
+        return TransformationMatrix(*self.to_values())
+
+    @staticmethod
+    def from_axis_angle(angle, axis):
+        '''The rotation built by TransformationMatrix.rotate(angle, axis).
+        Args:
+            angle (float): the angle in degrees.
+            axis (tuple): len(axis) == 3, the direction of the axis.
+        '''
+        if len(axis) != 3:
+            raise ValueError("invalid axis: {}".format(axis))
+        x, y, z = axis
+        length = math.sqrt(x * x + y * y + z * z)
+        if length == 0:
+            # A null axis rotates around the z axis.
+            x, y, z, length = 0.0, 0.0, 1.0, 1.0
+        half = math.radians(angle) / 2
+        s = math.sin(half) / length
+        return Quaternion(math.cos(half), x * s, y * s, z * s)
+
+    @staticmethod
+    def from_euler_angles(x, y, z):
+        '''The rotation built by TransformationMatrix.from_euler_angles(x, y, z).'''
+        # Rotate around y, then x, then z; each one is a single sine and cosine.
+        hx, hy, hz = math.radians(-x) / 2, math.radians(-y) / 2, math.radians(-z) / 2
+        cx, sx = math.cos(hx), math.sin(hx)
+        cy, sy = math.cos(hy), math.sin(hy)
+        cz, sz = math.cos(hz), math.sin(hz)
+        # qz * qx * qy expanded.
+        return Quaternion(
+            cz * cx * cy - sz * sx * sy,
+            cz * sx * cy - sz * cx * sy,
+            cz * cx * sy + sz * sx * cy,
+            sz * cx * cy + cz * sx * sy
+        )
+
+    @staticmethod
+    def from_matrix(matrix):
+        '''The rotation of a TransformationMatrix; the matrix must not scale, shear or reflect.'''
+        if not isinstance(matrix, TransformationMatrix):
+            raise TypeError("expected a TransformationMatrix, got {}".format(matrix.__class__.__name__))
+        return Quaternion(*quaternions_from_arrays(matrix.array[None, :3, :3])[0].tolist())
+
+    @staticmethod
+    def nlerp(a, b, t):
+        '''Linear interpolation between two rotations, normalized. Cheaper than slerp but not at constant speed.'''
+        return Quaternion(*nlerp_arrays([tuple(a)], [tuple(b)], [t])[0].tolist())
+
+    @staticmethod
+    def slerp(a, b, t):
+        '''Spherical linear interpolation between two rotations, along the shortest arc at constant speed.'''
+        return Quaternion(*slerp_arrays([tuple(a)], [tuple(b)], [t])[0].tolist())
+
+def quaternion_arrays(quaternions):
+    '''Build the rotation matrices of many quaternions at once, see Quaternion.to_matrix.
+    Args:
+        quaternions (array like): (n, 4) array of w, x, y and z.
+    Returns:
+        numpy.ndarray: (n, 4, 4) float32 array of the matrices.
+    '''
+    w, x, y, z = np.asarray(quaternions, dtype=np.float64).reshape(-1, 4).T
+    result = np.zeros((len(w), 4, 4))
+    result[:, 0, 0], result[:, 0, 1], result[:, 0, 2] = 1 - 2 * (y * y + z * z), 2 * (x * y + w * z), 2 * (x * z - w * y)
+    result[:, 1, 0], result[:, 1, 1], result[:, 1, 2] = 2 * (x * y - w * z), 1 - 2 * (x * x + z * z), 2 * (y * z + w * x)
+    result[:, 2, 0], result[:, 2, 1], result[:, 2, 2] = 2 * (x * z + w * y), 2 * (y * z - w * x), 1 - 2 * (x * x + y * y)
+    result[:, 3, 3] = 1.0
+    return result.astype(np.float32)
+
+def quaternions_from_arrays(rotations):
+    '''Convert many rotation matrices to quaternions at once.
+    Args:
+        rotations (array like): (n, 3, 3) array of the rotational part of matrices, in the layout of TransformationMatrix.
+    Returns:
+        numpy.ndarray: (n, 4) array of w, x, y and z.
+    '''
+    m = np.asarray(rotations, dtype=np.float64).reshape(-1, 3, 3)
+    m00, m01, m02 = m[:, 0, 0], m[:, 0, 1], m[:, 0, 2]
+    m10, m11, m12 = m[:, 1, 0], m[:, 1, 1], m[:, 1, 2]
+    m20, m21, m22 = m[:, 2, 0], m[:, 2, 1], m[:, 2, 2]
+    # Each row holds 4 times the square of a component; the largest one is the most accurate to divide by.
+    squares = np.stack((
+        1 + m00 + m11 + m22,
+        1 + m00 - m11 - m22,
+        1 - m00 + m11 - m22,
+        1 - m00 - m11 + m22,
+    ), axis=1)
+    largest = np.argmax(squares, axis=1)
+    # The matrices are transposed compared to the usual column vector formulas.
+    candidates = np.stack((
+        np.stack((squares[:, 0], m12 - m21, m20 - m02, m01 - m10), axis=1),
+        np.stack((m12 - m21, squares[:, 1], m01 + m10, m20 + m02), axis=1),
+        np.stack((m20 - m02, m01 + m10, squares[:, 2], m12 + m21), axis=1),
+        np.stack((m01 - m10, m20 + m02, m12 + m21, squares[:, 3]), axis=1),
+    ), axis=1)
+    index = np.arange(len(m))
+    result = candidates[index, largest] / (2 * np.sqrt(np.maximum(squares[index, largest], 1e-300)))[:, None]
+    # Keep w positive, q and -q are the same rotation.
+    result[result[:, 0] < 0] *= -1
+    return result
+
+def _interpolation_inputs(a, b, t):
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.array(b, dtype=np.float64).reshape(-1, 4)
+    t = np.asarray(t, dtype=np.float64).reshape(-1)
+    dot = np.einsum('ij,ij->i', a, b)
+    # Go the short way around, q and -q are the same rotation.
+    b[dot < 0] *= -1
+    return a, b, t, np.abs(dot)
+
+def nlerp_arrays(a, b, t):
+    '''Interpolate many rotations at once, linearly then normalized.
+    Args:
+        a (array like): (n, 4) array of the starting quaternions.
+        b (array like): (n, 4) array of the ending quaternions.
+        t (array like): (n,) array of the interpolation factors, between 0 and 1.
+    Returns:
+        numpy.ndarray: (n, 4) array of the interpolated quaternions.
+    '''
+    a, b, t, _ = _interpolation_inputs(a, b, t)
+    result = a + (b - a) * t[:, None]
+    return result / np.linalg.norm(result, axis=1)[:, None]
+
+def slerp_arrays(a, b, t):
+    '''Interpolate many rotations at once, along the shortest arc at constant speed.
+    The arguments and the result are the same as nlerp_arrays.
+    '''
+    a, b, t, dot = _interpolation_inputs(a, b, t)
+    theta = np.arccos(np.clip(dot, -1, 1))
+    sin_theta = np.sin(theta)
+    # Nearly identical rotations fall back to nlerp, the weights of slerp would divide by almost 0.
+    close = sin_theta < 1e-6
+    with np.errstate(divide='ignore', invalid='ignore'):
+        wa = np.where(close, 1 - t, np.sin((1 - t) * theta) / sin_theta)
+        wb = np.where(close, t, np.sin(t * theta) / sin_theta)
+    result = a * wa[:, None] + b * wb[:, None]
+    return result / np.linalg.norm(result, axis=1)[:, None]
+
+class Animation(ABC):
+    '''Base class of the animations advanced by an AnimationScheduler.
+    Animations are advanced by the frame loop, on the OpenGL thread; the callback
+    is called from there once the animation finishes or is stopped.
+    Args:
+        duration (float): the duration of the animation in seconds.
+        callback (function): called with the animation once it finishes.
+    '''
+
+    def __init__(self, duration, callback=None):
         self.running = False
-        self.current = TransformationMatrix()
-        self.target = angle
-        self.axis = axis
-        self.pivot = pivot
-        '''Duration is angle / speed.'''
-        self.duration = abs(angle / speed)
+        self.duration = duration
         self.callback = callback
+        self.start_time = None
+        self.scheduler = None
+        self._done = threading.Event()
+
+    def start(self, scheduler=None):
+        '''Start the animation.
+        Args:
+            scheduler (AnimationScheduler): the scheduler advancing the animation, defaults to animation_scheduler.
+        '''
+        if self.running or self._done.is_set():
+            raise RuntimeError("animations can only be started once")
+        self.running = True
+        self.start_time = time.perf_counter()
+        self.scheduler = scheduler if scheduler is not None else animation_scheduler
+        self.scheduler.add(self)
 
     def stop(self):
+        '''Stop the animation, it jumps to its end on the next frame.'''
         self.running = False
 
-    def run(self):
-        self.running = True
-        identity = [
-            1, 0, 0, 0,
-            0, 1, 0, 0,
-            0, 0, 1, 0,
-            0, 0, 0, 1,
-        ]
-        start_time = time.time()
-        current_time = time.time()
-        delay = 0.01
-        while self.running and (current_time - start_time) < self.duration:
-            current_angle = (current_time - start_time) / self.duration * self.target
-            self.current.reset(*TransformationMatrix.rotate(current_angle, self.axis, self.pivot).values)
-            current_time = time.time()
-            time.sleep(delay)
-        self.current.reset(*TransformationMatrix.rotate(self.target, self.axis, self.pivot).values)
+    def join(self, timeout=None):
+        '''Wait until the animation finishes, must not be called from the frame loop.'''
+        self._done.wait(timeout)
+
+    def is_alive(self):
+        return self.start_time is not None and not self._done.is_set()
+
+    def progress(self, now):
+        '''Returns how far the animation is, from 0 to 1.'''
+        if not self.running or self.duration <= 0:
+            return 1.0
+        return min(1.0, (now - self.start_time) / self.duration)
+
+    def update(self, now):
+        '''Advance the animation to the time now, returns true once it is finished.'''
+        t = self.progress(now)
+        self.apply(t)
+        return t >= 1
+
+    @abstractmethod
+    def apply(self, t):
+        '''Set the state of the animation at progress t, implemented by subclasses.'''
+
+    @classmethod
+    def advance(cls, animations, now, state):
+        '''Advance all the running animations of this class at once.
+        Subclasses may override this to advance many animations in a single batched operation.
+        Args:
+            animations (list): the animations to advance.
+            now (float): the current time.
+            state (dict): kept between calls as long as the list of animations does not change.
+        Returns:
+            list: the animations that finished.
+        '''
+        return [a for a in animations if a.update(now)]
+
+    def finish(self):
+        '''Called by the scheduler once the animation finished.'''
+        self.running = False
+        self._done.set()
         if self.callback:
             self.callback(self)
 
-class TransformOverTime(threading.Thread):
+class AnimationScheduler:
+    '''Advances every running animation once per frame, from a single thread.
+    Animations of the same class are advanced together, in one batch.
+    '''
+
+    def __init__(self):
+        # Animations started since the last update, they may come from any thread.
+        self._pending = deque()
+        # The running animations, grouped by class.
+        self._groups = {}
+        # Batch state of each group, reset when the group changes.
+        self._states = {}
+
+    def add(self, animation):
+        self._pending.append(animation)
+
+    def __len__(self):
+        return len(self._pending) + sum(len(g) for g in self._groups.values())
+
+    def is_active(self):
+        '''Returns true if there is any running animation.'''
+        return bool(self._pending) or bool(self._groups)
+
+    def update(self, now=None):
+        '''Advance every animation.
+        Args:
+            now (float): the current time.perf_counter(), defaults to the time of the call.
+        Returns:
+            bool: true if any animation was advanced.
+        '''
+        while self._pending:
+            animation = self._pending.popleft()
+            self._groups.setdefault(animation.__class__, []).append(animation)
+            self._states[animation.__class__] = {}
+        if not self._groups:
+            return False
+        if now is None:
+            now = time.perf_counter()
+        for cls, group in list(self._groups.items()):
+            finished = cls.advance(group, now, self._states[cls])
+            if finished:
+                done = set(map(id, finished))
+                group[:] = [a for a in group if id(a) not in done]
+                self._states[cls] = {}
+                if not group:
+                    del self._groups[cls]
+                    del self._states[cls]
+                for animation in finished:
+                    animation.finish()
+        return True
+
+    def is_animating(self, matrix):
+        '''Returns true if a running animation changes a matrix.'''
+        if any(getattr(a, 'current', None) is matrix for a in self._pending):
+            return True
+        return any(getattr(a, 'current', None) is matrix for group in self._groups.values() for a in group)
+
+    def stop_all(self):
+        '''Stop every animation, they jump to their end on the next update.'''
+        for animation in list(self._pending):
+            animation.stop()
+        for group in self._groups.values():
+            for animation in group:
+                animation.stop()
+
+# The scheduler used by the animations unless told otherwise.
+animation_scheduler = AnimationScheduler()
+
+class RotateOverTime(Animation):
+
+    def __init__(self, angle, axis, pivot, speed=360, callback=None):
+        '''Duration is angle / speed.'''
+        super().__init__(abs(angle / speed), callback)
+        self.current = TransformationMatrix()
+        self.target = angle
+        self.axis = axis
+        self.pivot = pivot
+
+    def apply(self, t):
+        self.current.reset(TransformationMatrix.rotate(self.target * t, self.axis, self.pivot).array)
+
+    @classmethod
+    def advance(cls, animations, now, state):
+        if 'targets' not in state:
+            state['targets'] = np.array([a.target for a in animations], dtype=np.float64)
+            state['axes'] = np.array([a.axis for a in animations], dtype=np.float64)
+            state['points'] = np.array([a.pivot if a.pivot else (0, 0, 0) for a in animations], dtype=np.float64)
+            state['starts'] = np.array([a.start_time for a in animations])
+            state['durations'] = np.array([a.duration for a in animations])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.clip((now - state['starts']) / state['durations'], 0, 1)
+        t[~np.isfinite(t)] = 1
+        t[~np.fromiter((a.running for a in animations), bool, len(animations))] = 1
+        # Build every rotation at once.
+        matrices = rotation_arrays(state['targets'] * t, state['axes'], state['points'])
+        for a, matrix in zip(animations, matrices):
+            a.current.array[...] = matrix
+            a.current.mark_dirty()
+        return [a for a, done in zip(animations, (t >= 1).tolist()) if done]
+
+def _decompose_transforms(targets):
+    '''Split (n, 4, 4) matrices into a translation, a scale along each axis and a rotation.
+    Matrices that shear or reflect can not be split, they are flagged as linear.
+    '''
+    targets = np.asarray(targets, dtype=np.float64).reshape(-1, 4, 4)
+    linear = targets[:, :3, :3]
+    # Each row is the image of a basis vector, its length is the scale along that axis.
+    scales = np.linalg.norm(linear, axis=2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rotations = linear / scales[:, :, None]
+    orthonormal = np.abs(np.matmul(rotations, rotations.transpose(0, 2, 1)) - np.identity(3)).max(axis=(1, 2)) < 1e-4
+    orthonormal &= np.linalg.det(linear) > 0
+    rotations[~orthonormal] = np.identity(3)
+    return {
+        'targets': targets.astype(np.float32),
+        'translations': targets[:, 3, :3],
+        'scales': scales,
+        'rotations': quaternions_from_arrays(rotations),
+        'linear': ~orthonormal,
+    }
+
+def _interpolate_transforms(parts, t):
+    '''Interpolate the matrices split by _decompose_transforms from the identity, with t an (n,) array.
+    Rotations are interpolated along the shortest arc, the rest linearly.
+    '''
+    count = len(t)
+    identity = np.zeros((count, 4))
+    identity[:, 0] = 1.0
+    matrices = quaternion_arrays(slerp_arrays(identity, parts['rotations'], t)).astype(np.float64)
+    matrices[:, :3, :3] *= (1 + (parts['scales'] - 1) * t[:, None])[:, :, None]
+    matrices[:, 3, :3] = parts['translations'] * t[:, None]
+    linear = parts['linear']
+    if linear.any():
+        # Shears and reflections have no rotation to follow, their values are interpolated instead.
+        matrices[linear] = _IDENTITY + (parts['targets'][linear] - _IDENTITY) * t[linear, None, None]
+    return matrices.astype(np.float32)
+
+class TransformOverTime(Animation):
+    '''Brings a matrix from the identity to its current value over time.
+    The rotation of the matrix is interpolated with slerp, its scale and translation linearly.
+    '''
 
     def __init__(self, target, duration=1, callback=None):
-        super().__init__()
-        self.running = False
+        super().__init__(duration, callback)
         self.current = target
-        self.target = target.values
-        self.duration = duration
-        self.callback = callback
+        self.target = target.array.copy()
+        self._parts = None
 
-    def stop(self):
-        self.running = False
+    def apply(self, t):
+        if self._parts is None:
+            self._parts = _decompose_transforms(self.target)
+        self.current.reset(_interpolate_transforms(self._parts, np.array([t], dtype=np.float64))[0])
 
-    def run(self):
-        self.running = True
-        identity = [
-            1, 0, 0, 0,
-            0, 1, 0, 0,
-            0, 0, 1, 0,
-            0, 0, 0, 1,
-        ]
-        start_time = time.time()
-        current_time = time.time()
-        delay = 0.01
-        while self.running and (current_time - start_time) < self.duration:
-            current = list(identity[i] + (self.target[i] - identity[i]) * (current_time - start_time) / self.duration for i in range(0, 16))
-            self.current.reset(*current)
-            current_time = time.time()
-            time.sleep(delay)
-        self.current.reset(*self.target)
-        if self.callback:
-            self.callback(self)
-        
\ No newline at end of file
+    @classmethod
+    def advance(cls, animations, now, state):
+        if 'parts' not in state:
+            state['parts'] = _decompose_transforms(np.stack([a.target for a in animations]))
+            state['starts'] = np.array([a.start_time for a in animations])
+            state['durations'] = np.array([a.duration for a in animations])
+        parts = state['parts']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.clip((now - state['starts']) / state['durations'], 0, 1)
+        t[~np.isfinite(t)] = 1
+        t[~np.fromiter((a.running for a in animations), bool, len(animations))] = 1
+        done = t >= 1
+        # Interpolate every matrix at once, finished ones are set to their exact target.
+        matrices = _interpolate_transforms(parts, t)
+        matrices[done] = parts['targets'][done]
+        for a, matrix in zip(animations, matrices):
+            a.current.array[...] = matrix
+            a.current.mark_dirty()
+        return [a for a, d in zip(animations, done.tolist()) if d]
@@ -0,0 +1,574 @@
+from .Mesh import is_empty_bounds
+import numpy as np
+import math
+
+class _Node:
+    '''A node of a BoundingVolumeHierarchy, leaves hold an object.'''
+
+    __slots__ = ('low', 'high', 'parent', 'left', 'right', 'height', 'obj', 'order')
+
+    def __init__(self, low, high, obj=None, order=0):
+        self.low = low
+        self.high = high
+        self.parent = None
+        self.left = None
+        self.right = None
+        self.height = 0
+        self.obj = obj
+        self.order = order
+
+    def is_leaf(self):
+        return self.left is None
+
+def _union(a, b):
+    '''Returns the corners of the box enclosing two nodes.'''
+    al, ah, bl, bh = a.low, a.high, b.low, b.high
+    return (
+        (al[0] if al[0] < bl[0] else bl[0], al[1] if al[1] < bl[1] else bl[1], al[2] if al[2] < bl[2] else bl[2]),
+        (ah[0] if ah[0] > bh[0] else bh[0], ah[1] if ah[1] > bh[1] else bh[1], ah[2] if ah[2] > bh[2] else bh[2])
+    )
+
+def _union_area(a, b):
+    '''Surface area of the box enclosing two nodes, without building the box.'''
+    al, ah, bl, bh = a.low, a.high, b.low, b.high
+    dx = (ah[0] if ah[0] > bh[0] else bh[0]) - (al[0] if al[0] < bl[0] else bl[0])
+    dy = (ah[1] if ah[1] > bh[1] else bh[1]) - (al[1] if al[1] < bl[1] else bl[1])
+    dz = (ah[2] if ah[2] > bh[2] else bh[2]) - (al[2] if al[2] < bl[2] else bl[2])
+    return 2 * (dx * dy + dy * dz + dz * dx)
+
+def _area(low, high):
+    '''Surface area of a box, the cost of a node is proportional to it.'''
+    dx, dy, dz = high[0] - low[0], high[1] - low[1], high[2] - low[2]
+    return 2 * (dx * dy + dy * dz + dz * dx)
+
+def _contains(low, high, inner_low, inner_high):
+    return (low[0] <= inner_low[0] and low[1] <= inner_low[1] and low[2] <= inner_low[2] and
+        high[0] >= inner_high[0] and high[1] >= inner_high[1] and high[2] >= inner_high[2])
+
+def _overlaps(low, high, other_low, other_high):
+    return (low[0] <= other_high[0] and low[1] <= other_high[1] and low[2] <= other_high[2] and
+        high[0] >= other_low[0] and high[1] >= other_low[1] and high[2] >= other_low[2])
+
+def _bounds_of(obj):
+    '''Returns the bounds of an object, or None if it has none.'''
+    get_bounds = getattr(obj, 'get_bounds', None)
+    return get_bounds() if get_bounds else None
+
+def morton_codes(points, bits=10):
+    '''Returns the position of points along a Morton curve over their bounding box.
+    Sorting points by their code keeps the points close in space close in the list.
+    Args:
+        points (numpy.ndarray): (n, 3) array of x, y and z.
+        bits (int): the resolution of the curve along each axis.
+    Returns:
+        numpy.ndarray: (n,) uint64 array of the codes.
+    '''
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    if len(points) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    low = points.min(axis=0)
+    extent = points.max(axis=0) - low
+    extent[extent == 0] = 1
+    cells = ((points - low) / extent * ((1 << bits) - 1)).astype(np.uint64)
+    # Interleave the bits of the cell coordinates.
+    codes = np.zeros(len(points), dtype=np.uint64)
+    for bit in range(0, bits):
+        for axis in range(0, 3):
+            codes |= ((cells[:, axis] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(3 * bit + axis)
+    return codes
+
+class BoundingVolumeHierarchy:
+    '''A dynamic tree of axis aligned boxes over renderables, answering spatial queries in logarithmic time.
+    Objects are inserted and removed one at a time, the tree is kept balanced with rotations.
+    The boxes of the leaves are enlarged by a margin, so objects moving a little do not
+    change the tree at all; objects moving further have their ancestors refitted, and
+    are only inserted again once they leave their previous box entirely.
+    The indexed objects notify the tree when their bounds change, refresh() updates them.
+    Objects without bounds are returned by every query, empty objects by none.
+    Args:
+        margin (float): the enlargement of the boxes of the leaves, relative to their size.
+    '''
+
+    def __init__(self, margin=0.1):
+        self.margin = margin
+        self.root = None
+        # Leaves keyed by the id of their object.
+        self._leaves = {}
+        # Indexed objects without bounds and with empty bounds, keyed by id.
+        self._unbounded = {}
+        self._empty = {}
+        # Objects whose bounds changed since the last refresh, keyed by id.
+        self._dirty = {}
+        self._order = 0
+
+    def __len__(self):
+        return len(self._leaves) + len(self._unbounded) + len(self._empty)
+
+    def __contains__(self, obj):
+        key = id(obj)
+        return key in self._leaves or key in self._unbounded or key in self._empty
+
+    def _fatten(self, bounds):
+        (lx, ly, lz), (hx, hy, hz) = bounds[0].tolist(), bounds[1].tolist()
+        margin = max(hx - lx, hy - ly, hz - lz) * self.margin
+        return (lx - margin, ly - margin, lz - margin), (hx + margin, hy + margin, hz + margin)
+
+    def insert(self, obj):
+        '''Add an object to the tree.
+        Args:
+            obj (Renderable): the object to add, objects without a get_bounds method are returned by every query.
+        '''
+        if obj in self:
+            return
+        leaf = self._add(obj)
+        if leaf is not None:
+            self._insert_leaf(leaf)
+
+    def _add(self, obj, order=None):
+        '''Register an object, returns its leaf if it has to be inserted in the tree.
+        Objects are returned by the queries sorted by their order, which defaults to the order of insertion.
+        '''
+        if order is None:
+            self._order += 1
+            order = self._order
+        bounds = _bounds_of(obj)
+        leaf = None
+        if bounds is None:
+            self._unbounded[id(obj)] = (order, obj)
+        elif is_empty_bounds(bounds):
+            self._empty[id(obj)] = (order, obj)
+        else:
+            low, high = self._fatten(bounds)
+            leaf = _Node(low, high, obj, order)
+            self._leaves[id(obj)] = leaf
+        if hasattr(obj, 'watch'):
+            obj.watch(self)
+        return leaf
+
+    def remove(self, obj):
+        '''Remove an object from the tree.'''
+        key = id(obj)
+        self._dirty.pop(key, None)
+        if key in self._unbounded:
+            del self._unbounded[key]
+        elif key in self._empty:
+            del self._empty[key]
+        elif key in self._leaves:
+            self._remove_leaf(self._leaves.pop(key))
+        else:
+            raise ValueError("{} is not in the tree".format(obj))
+
+    def clear(self):
+        self.root = None
+        self._leaves.clear()
+        self._unbounded.clear()
+        self._empty.clear()
+        self._dirty.clear()
+
+    def mark_bounds_dirty(self, obj):
+        '''Called by the indexed objects when their bounds may have changed.'''
+        if obj in self:
+            self._dirty[id(obj)] = obj
+
+    def is_dirty(self):
+        '''Returns true if an object changed since the last refresh.'''
+        return bool(self._dirty)
+
+    def refresh(self):
+        '''Update the objects whose bounds changed since the last refresh.
+        Returns:
+            int: the number of updated objects.
+        '''
+        count = len(self._dirty)
+        while self._dirty:
+            self.update(self._dirty.popitem()[1])
+        return count
+
+    def update(self, obj):
+        '''Update the position of an object in the tree after its bounds changed.
+        Returns:
+            bool: True if the tree changed.
+        '''
+        if obj not in self:
+            raise ValueError("{} is not in the tree".format(obj))
+        key = id(obj)
+        self._dirty.pop(key, None)
+        bounds = _bounds_of(obj)
+        leaf = self._leaves.get(key)
+        if leaf is None or bounds is None or is_empty_bounds(bounds):
+            if bounds is None:
+                unchanged = key in self._unbounded
+            elif is_empty_bounds(bounds):
+                unchanged = key in self._empty
+            else:
+                unchanged = False
+            if unchanged:
+                return False
+            # Moving between the leaves, the objects without bounds and the empty ones.
+            order = leaf.order if leaf is not None else (self._unbounded.get(key) or self._empty[key])[0]
+            self.remove(obj)
+            leaf = self._add(obj, order)
+            if leaf is not None:
+                self._insert_leaf(leaf)
+            return True
+        low, high = bounds
+        if _contains(leaf.low, leaf.high, low, high):
+            return False
+        moved_away = not _overlaps(leaf.low, leaf.high, low, high)
+        leaf.low, leaf.high = self._fatten(bounds)
+        if moved_away:
+            # The object left its previous place, insert it where it now belongs.
+            self._remove_leaf(leaf)
+            self._insert_leaf(leaf)
+        else:
+            self._refit(leaf.parent)
+        return True
+
+    def rebuild(self):
+        '''Rebuild the whole tree from the current bounds of the objects, faster than inserting them one by one.'''
+        entries = [(leaf.order, leaf.obj) for leaf in self._leaves.values()]
+        entries.extend(self._unbounded.values())
+        entries.extend(self._empty.values())
+        objects = [obj for _, obj in sorted(entries, key=lambda v: v[0])]
+        self.clear()
+        self.extend(objects)
+
+    def sync(self, objects):
+        '''Make the tree hold exactly the objects of a list, returned by the queries in the order of the list.
+        Objects missing from the tree are added, objects no longer in the list are removed and the others
+        only get their new order; an object in the list more than once is indexed once, at its first place.
+        Args:
+            objects (list): the objects to index.
+        '''
+        positions = {}
+        for obj in objects:
+            positions.setdefault(id(obj), (len(positions), obj))
+        for key in [k for k in self._leaves if k not in positions]:
+            self.remove(self._leaves[key].obj)
+        for table in (self._unbounded, self._empty):
+            for key in [k for k in table if k not in positions]:
+                self.remove(table[key][1])
+        added = []
+        for key, (order, obj) in positions.items():
+            leaf = self._leaves.get(key)
+            if leaf is not None:
+                leaf.order = order
+            elif key in self._unbounded:
+                self._unbounded[key] = (order, obj)
+            elif key in self._empty:
+                self._empty[key] = (order, obj)
+            else:
+                added.append((order, obj))
+        if added and self.root is None and len(added) == len(positions):
+            # Nothing indexed yet, build the tree bottom up.
+            self._order = -1
+            self.extend(obj for _, obj in added)
+        else:
+            for order, obj in added:
+                leaf = self._add(obj, order)
+                if leaf is not None:
+                    self._insert_leaf(leaf)
+        self._order = len(positions) - 1
+
+    def extend(self, objects):
+        '''Add many objects at once.
+        If the tree is empty it is built bottom up, much faster than inserting the objects one by one.
+        '''
+        objects = [o for o in objects if o not in self]
+        if self.root is not None or self._unbounded or self._empty:
+            for obj in objects:
+                self.insert(obj)
+            return
+        leaves = []
+        seen = set()
+        for obj in objects:
+            if id(obj) in seen:
+                continue
+            seen.add(id(obj))
+            leaf = self._add(obj)
+            if leaf is not None:
+                leaves.append(leaf)
+        if leaves:
+            self.root = self._build(leaves)
+
+    def _build(self, leaves):
+        '''Build a balanced tree over leaves, pairing them along a Morton curve so that neighbours end up together.'''
+        centers = (np.array([leaf.low for leaf in leaves]) + np.array([leaf.high for leaf in leaves])) / 2
+        nodes = [leaves[i] for i in np.argsort(morton_codes(centers), kind='stable').tolist()]
+        while len(nodes) > 1:
+            paired = []
+            for i in range(0, len(nodes) - 1, 2):
+                left, right = nodes[i], nodes[i + 1]
+                node = _Node(*_union(left, right))
+                node.left, node.right = left, right
+                node.height = 1 + max(left.height, right.height)
+                left.parent = right.parent = node
+                paired.append(node)
+            if len(nodes) % 2:
+                paired.append(nodes[-1])
+            nodes = paired
+        nodes[0].parent = None
+        return nodes[0]
+
+    def _insert_leaf(self, leaf):
+        leaf.parent = None
+        if self.root is None:
+            self.root = leaf
+            return
+        # Go down the tree towards the sibling adding the least surface area.
+        node = self.root
+        while node.left is not None:
+            combined = _union_area(node, leaf)
+            # Cost of making the leaf the sibling of this node.
+            cost = 2 * combined
+            # The area every ancestor of a deeper sibling gains.
+            inheritance = 2 * (combined - _area(node.low, node.high))
+            left, right = node.left, node.right
+            cost_left = _union_area(left, leaf) + inheritance
+            if left.left is not None:
+                cost_left -= _area(left.low, left.high)
+            cost_right = _union_area(right, leaf) + inheritance
+            if right.left is not None:
+                cost_right -= _area(right.low, right.high)
+            if cost < cost_left and cost < cost_right:
+                break
+            node = left if cost_left < cost_right else right
+        sibling = node
+        old_parent = sibling.parent
+        parent = _Node(*_union(sibling, leaf))
+        parent.parent = old_parent
+        parent.height = sibling.height + 1
+        parent.left, parent.right = sibling, leaf
+        sibling.parent = leaf.parent = parent
+        if old_parent is None:
+            self.root = parent
+        elif old_parent.left is sibling:
+            old_parent.left = parent
+        else:
+            old_parent.right = parent
+        self._fix_upwards(parent.parent)
+
+    def _remove_leaf(self, leaf):
+        if leaf is self.root:
+            self.root = None
+            return
+        parent = leaf.parent
+        grand_parent = parent.parent
+        sibling = parent.right if parent.left is leaf else parent.left
+        leaf.parent = None
+        if grand_parent is None:
+            self.root = sibling
+            sibling.parent = None
+        else:
+            if grand_parent.left is parent:
+                grand_parent.left = sibling
+            else:
+                grand_parent.right = sibling
+            sibling.parent = grand_parent
+            self._fix_upwards(grand_parent)
+
+    def _fix_upwards(self, node):
+        '''Balance and refit every node from node up to the root.'''
+        while node is not None:
+            node = self._balance(node)
+            node.height = 1 + max(node.left.height, node.right.height)
+            node.low, node.high = _union(node.left, node.right)
+            node = node.parent
+
+    def _refit(self, node):
+        '''Recompute the boxes from node up to the root, stopping once a box does not change.'''
+        while node is not None:
+            low, high = _union(node.left, node.right)
+            if low == node.low and high == node.high:
+                return
+            node.low, node.high = low, high
+            node = node.parent
+
+    def _replace_child(self, old, new):
+        parent = new.parent
+        if parent is None:
+            self.root = new
+        elif parent.left is old:
+            parent.left = new
+        else:
+            parent.right = new
+
+    def _balance(self, a):
+        '''Rotate the higher child of a up if a is unbalanced, returns the node now at the place of a.'''
+        if a.is_leaf() or a.height < 2:
+            return a
+        b, c = a.left, a.right
+        balance = c.height - b.height
+        if balance > 1:
+            f, g = c.left, c.right
+            c.left = a
+            c.parent = a.parent
+            a.parent = c
+            self._replace_child(a, c)
+            if f.height > g.height:
+                c.right, a.right, g.parent = f, g, a
+                kept = f
+            else:
+                c.right, a.right, f.parent = g, f, a
+                kept = g
+            a.low, a.high = _union(b, a.right)
+            a.height = 1 + max(b.height, a.right.height)
+            c.low, c.high = _union(a, kept)
+            c.height = 1 + max(a.height, kept.height)
+            return c
+        if balance < -1:
+            d, e = b.left, b.right
+            b.left = a
+            b.parent = a.parent
+            a.parent = b
+            self._replace_child(a, b)
+            if d.height > e.height:
+                b.right, a.left, e.parent = d, e, a
+                kept = d
+            else:
+                b.right, a.left, d.parent = e, d, a
+                kept = e
+            a.low, a.high = _union(c, a.left)
+            a.height = 1 + max(c.height, a.left.height)
+            b.low, b.high = _union(a, kept)
+            b.height = 1 + max(a.height, kept.height)
+            return b
+        return a
+
+    def _results(self, leaves):
+        '''The objects of the leaves and the objects without bounds, in the order they were inserted.'''
+        found = [(leaf.order, leaf.obj) for leaf in leaves]
+        found.extend(self._unbounded.values())
+        found.sort(key=lambda v: v[0])
+        return [obj for _, obj in found]
+
+    def _collect(self, node, out):
+        '''Append every leaf below node.'''
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.left is None:
+                out.append(node)
+            else:
+                stack.append(node.left)
+                stack.append(node.right)
+
+    def query_box(self, low, high):
+        '''Returns the objects whose box overlaps a box, in the order they were inserted.'''
+        low, high = tuple(low), tuple(high)
+        leaves = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            if _overlaps(node.low, node.high, low, high):
+                if node.left is None:
+                    leaves.append(node)
+                else:
+                    stack.append(node.left)
+                    stack.append(node.right)
+        return self._results(leaves)
+
+    def query_radius(self, center, radius):
+        '''Returns the objects whose box is within radius of a point, in the order they were inserted.'''
+        cx, cy, cz = center
+        squared = radius * radius
+        leaves = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            low, high = node.low, node.high
+            # Squared distance from the point to the box.
+            dx = low[0] - cx if cx < low[0] else (cx - high[0] if cx > high[0] else 0.0)
+            dy = low[1] - cy if cy < low[1] else (cy - high[1] if cy > high[1] else 0.0)
+            dz = low[2] - cz if cz < low[2] else (cz - high[2] if cz > high[2] else 0.0)
+            if dx * dx + dy * dy + dz * dz <= squared:
+                if node.left is None:
+                    leaves.append(node)
+                else:
+                    stack.append(node.left)
+                    stack.append(node.right)
+        return self._results(leaves)
+
+    def query_frustum(self, frustum):
+        '''Returns the objects whose box may be visible, in the order they were inserted.
+        Args:
+            frustum (Culling.Frustum): the volume seen by the camera.
+        '''
+        planes = [tuple(p) for p in frustum.planes.tolist()]
+        leaves = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            low, high = node.low, node.high
+            inside = True
+            for a, b, c, d in planes:
+                # Distance of the farthest and of the nearest corner along the normal of the plane.
+                far = a * (high[0] if a >= 0 else low[0]) + b * (high[1] if b >= 0 else low[1]) + c * (high[2] if c >= 0 else low[2]) + d
+                if far < 0:
+                    break
+                if inside:
+                    near = a * (low[0] if a >= 0 else high[0]) + b * (low[1] if b >= 0 else high[1]) + c * (low[2] if c >= 0 else high[2]) + d
+                    inside = near >= 0
+            else:
+                if inside or node.left is None:
+                    # Entirely inside, everything below is visible.
+                    self._collect(node, leaves)
+                else:
+                    stack.append(node.left)
+                    stack.append(node.right)
+        return self._results(leaves)
+
+    def query_ray(self, origin, direction, max_distance=math.inf):
+        '''Find the objects whose box is crossed by a ray.
+        Args:
+            origin (tuple): the start of the ray.
+            direction (tuple): the direction of the ray, distances are in multiples of its length.
+            max_distance (float): the length of the ray.
+        Returns:
+            list: (distance, object) pairs sorted by the distance at which the ray enters the box.
+                Objects without bounds are not returned.
+        '''
+        ox, oy, oz = origin
+        inverse = tuple(1 / d if d != 0 else math.inf for d in direction)
+        hits = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            low, high = node.low, node.high
+            near, far = 0.0, max_distance
+            for o, i, l, h in ((ox, inverse[0], low[0], high[0]), (oy, inverse[1], low[1], high[1]), (oz, inverse[2], low[2], high[2])):
+                if i == math.inf:
+                    # Parallel to this slab, the origin has to be within it.
+                    if o < l or o > h:
+                        near, far = 1.0, 0.0
+                        break
+                    continue
+                t0 = (l - o) * i
+                t1 = (h - o) * i
+                if t0 > t1:
+                    t0, t1 = t1, t0
+                if t0 > near:
+                    near = t0
+                if t1 < far:
+                    far = t1
+                if near > far:
+                    break
+            if near > far:
+                continue
+            if node.left is None:
+                hits.append((near, node.order, node.obj))
+            else:
+                stack.append(node.left)
+                stack.append(node.right)
+        hits.sort(key=lambda v: (v[0], v[1]))
+        return [(distance, obj) for distance, _, obj in hits]
+
+    def get_unbounded(self):
+        '''Returns the objects without bounds, in the order they were inserted.'''
+        return [obj for _, obj in sorted(self._unbounded.values(), key=lambda v: v[0])]
+
+    def get_depth(self):
+        '''Returns the number of levels of the tree.'''
+        return 0 if self.root is None else self.root.height + 1
+
+    depth = property(get_depth)
@@ -0,0 +1,107 @@
+import threading
+
+# Duration of an update step, in seconds.
+STEP = 1 / 60
+# Most steps run before a frame; past it the late time is dropped rather than caught up.
+MAX_STEPS = 5
+
+class FixedTimestep:
+    '''Advances the simulation of the scene in steps of a fixed duration, independently of the frame rate.
+    Before each frame, the time elapsed since the previous frame is added to an accumulator and
+    the registered updates are called once for every whole step it holds. What is left is less than
+    a step; its fraction of a step, alpha, is passed to the interpolations so that they can draw the
+    state between the last two steps. At most max_steps steps run before a frame, so that a slow frame
+    does not make the next ones slower still.
+    Updates can be added and removed from any thread.
+    Args:
+        step (float): the duration of a step in seconds.
+        max_steps (int): the most steps to run before a frame.
+    '''
+
+    def __init__(self, step=STEP, max_steps=MAX_STEPS):
+        if step <= 0:
+            raise ValueError("the duration of a step must be positive, got {}".format(step))
+        if max_steps < 1:
+            raise ValueError("expected at least one step per frame, got {}".format(max_steps))
+        self.step = step
+        self.max_steps = max_steps
+        # Time not yet simulated, less than a step after every advance.
+        self.accumulator = 0.0
+        # Fraction of a step between the last step and the frame being drawn.
+        self.alpha = 0.0
+        # Simulated time and number of steps run since the loop was created.
+        self.time = 0.0
+        self.step_count = 0
+        # Time dropped because more than max_steps steps were due.
+        self.dropped = 0.0
+        # The updates and the interpolations, replaced rather than modified so that advance never sees them change.
+        self._updates = ()
+        self._interpolations = ()
+        self._lock = threading.Lock()
+
+    def add(self, update, interpolate=None):
+        '''Register an update.
+        Args:
+            update (function): called with the duration of the step, in seconds, at every step.
+            interpolate (function): called with alpha before every frame.
+        '''
+        if not callable(update):
+            raise TypeError("expected the update to be callable, got {}".format(update.__class__.__name__))
+        if interpolate is not None and not callable(interpolate):
+            raise TypeError("expected the interpolation to be callable, got {}".format(interpolate.__class__.__name__))
+        with self._lock:
+            self._updates += ((update, interpolate),)
+            if interpolate is not None:
+                self._interpolations += (interpolate,)
+
+    def remove(self, update):
+        '''Unregister an update, along with its interpolation.'''
+        with self._lock:
+            for i, (func, interpolate) in enumerate(self._updates):
+                if func is update:
+                    self._updates = self._updates[:i] + self._updates[i + 1:]
+                    if interpolate is not None:
+                        self._interpolations = tuple(f for f in self._interpolations if f is not interpolate)
+                    return
+        raise ValueError("{} is not a registered update".format(update))
+
+    def __len__(self):
+        return len(self._updates)
+
+    def is_active(self):
+        '''Returns true if any update is registered.'''
+        return bool(self._updates)
+
+    def advance(self, elapsed, before_step=None):
+        '''Run the steps due after some time elapsed, then call the interpolations.
+        Args:
+            elapsed (float): the time since the previous call, in seconds.
+            before_step (function): called with the duration of the step before the registered updates, at every step.
+        Returns:
+            int: the number of steps run.
+        '''
+        self.accumulator += max(0.0, elapsed)
+        step = self.step
+        steps = 0
+        while self.accumulator >= step and steps < self.max_steps:
+            if before_step:
+                before_step(step)
+            for update, _ in self._updates:
+                update(step)
+            self.accumulator -= step
+            self.time += step
+            steps += 1
+        self.step_count += steps
+        if self.accumulator >= step:
+            late = self.accumulator - self.accumulator % step
+            self.dropped += late
+            self.accumulator -= late
+        self.alpha = self.accumulator / step
+        for interpolate in self._interpolations:
+            interpolate(self.alpha)
+        return steps
+
+    def reset(self):
+        '''Forget the time not yet simulated, e.g. after the loop was paused.'''
+        self.accumulator = 0.0
+        self.alpha = 0.0
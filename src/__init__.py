@@ -3,22 +3,38 @@
 from OpenGL.GL import *
 from OpenGL.GLU import *
 from OpenGL.GLUT import *
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import collections
+import functools
 import threading
 import sys
 import time
 import signal
+import numpy as np
 
 from .Renderable import *
 from . import Builder
 from . import Camera
 from . import InputHandler
+from . import Profiler
+from . import Offscreen
+from . import Culling
+from . import SpatialIndex
+from . import Picking
+from . import Instancing
+from . import Batching
+from . import Importer
+from . import LevelOfDetail
+from . import RenderPolicy
+from . import UpdateLoop
+from . import History
 
 # Global variables.
 # List of renderable to render.
 to_render = []
 # List of transformation.
-transformation = []
-# List of all animators thread.
+transformation = TransformationStack()
+# List of all running animators.
 animators = []
 # The default position of the camera.
 DEFAULT_CAMERA_POSITION = (0, 0, -100)
@@ -43,14 +59,366 @@ FOV, ASPECT_RATIO, NEAR, FAR = 60.0, width / height, 1.0, 2000.0
 camera = Camera.Camera(DEFAULT_CAMERA_POSITION, DEFAULT_CAMERA_ROTATION)
 camera_controller = None
 
+# Frame profiler, disabled by default; call profiler.enable() to record the frame timings.
+profiler = Profiler.FrameProfiler()
+
+# Skip the renderables outside of the view of the camera.
+culling = True
+# Number of renderables drawn and culled during the last frame.
+render_stats = {'drawn': 0, 'culled': 0}
+# Draw the chains of levels of detail at the level matching their size on screen, or always at their finest level.
+level_of_detail = True
+# Spatial index over the renderables, kept up to date by add_renderable, delete_renderable and pop_renderable.
+scene_index = SpatialIndex.BoundingVolumeHierarchy()
+# When the window is redrawn; render_policy.report() gives the policy and the frame rate achieved.
+render_policy = RenderPolicy.RenderPolicy()
+# Fixed timestep simulation run before each frame; the camera controller and the updates added by add_update step with it.
+update_loop = UpdateLoop.FixedTimestep()
+# Undo and redo log of push_matrix and pop_matrix; set history.limit to change how many edits can be undone.
+history = History.CommandHistory(is_live=animation_scheduler.is_animating)
+
 class ActionError(Exception):
     pass
 
+def initialize_renderer():
+    '''Set up the OpenGL state used by the toolkit in the current context.'''
+    glClearColor(*clearColor)
+    glShadeModel(GL_SMOOTH)
+    glEnable(GL_CULL_FACE)
+    glEnable(GL_DEPTH_TEST)
+    glEnable(GL_BLEND)
+    glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+
+# Time of the previous call to update_scene.
+_last_update = None
+# Scene edits submitted while the render loop runs, as (future, function, args, kwargs).
+# Appending to and popping from a deque are atomic, so submitting never waits for the renderer.
+scene_commands = collections.deque()
+# The thread running the render loop, None while no loop is running.
+_render_thread = None
+
+def submit(func, *args, **kwargs):
+    '''Call a function on the render thread, at the start of the next frame.
+    Args:
+        func (function): the function to call, with the remaining arguments.
+    Returns:
+        concurrent.futures.Future: the result of the call, or the exception it raised.
+    '''
+    future = Future()
+    scene_commands.append((future, func, args, kwargs))
+    return future
+
+def apply_commands():
+    '''Apply the submitted scene edits in the order they were submitted.
+    Called at the start of every frame, so a frame never sees a partially applied edit.
+    Edits submitted while applying wait for the next frame.
+    '''
+    for _ in range(len(scene_commands)):
+        future, func, args, kwargs = scene_commands.popleft()
+        if not future.set_running_or_notify_cancel():
+            continue
+        try:
+            future.set_result(func(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+
+def _wait(future):
+    '''Returns the result of a submitted edit once the render thread applied it, raising its exception.'''
+    while True:
+        try:
+            return future.result(0.1)
+        except FutureTimeoutError:
+            if _render_thread is None:
+                # The render loop stopped before applying the edit, nothing else will.
+                apply_commands()
+
+def scene_edit(func):
+    '''Make a function editing the scene safe to call from any thread.
+    Called from another thread while the render loop runs, the call is submitted and the calling
+    thread waits until the render thread applied it at the start of the next frame; the result is
+    returned and exceptions are raised in the calling thread, as for a direct call.
+    Use submit to edit the scene without waiting, it returns a Future instead.
+    '''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _render_thread is not None and threading.current_thread() is not _render_thread:
+            return _wait(submit(func, *args, **kwargs))
+        return func(*args, **kwargs)
+    return wrapper
+
+def add_update(update, interpolate=None):
+    '''Call a function at every step of the update loop, see UpdateLoop.FixedTimestep.
+    Args:
+        update (function): called with the duration of the step, in seconds.
+        interpolate (function): called before every frame with the fraction of a step elapsed since the last step,
+            to draw the state between the last two steps.
+    '''
+    update_loop.add(update, interpolate)
+
+def remove_update(update):
+    '''Stop calling a function added by add_update.'''
+    update_loop.remove(update)
+
+def _update_camera(step):
+    if camera_controller:
+        camera_controller.update(step, width, height)
+
+def update_scene():
+    '''Advance what changes from frame to frame, called once before rendering each frame.'''
+    global _last_update
+    if profiler.enabled:
+        # The frame starts with its update, render_scene keeps recording it.
+        profiler.begin_frame()
+    apply_commands()
+    now = time.perf_counter()
+    if render_policy.woke_up():
+        # Redrawing after an on-demand idle period, which must not be caught up in one go.
+        _last_update = None
+        update_loop.reset()
+    delta = 0.0 if _last_update is None else now - _last_update
+    _last_update = now
+    update_loop.advance(delta, _update_camera)
+    animation_scheduler.update(now)
+    # Move the renderables whose bounds changed in the spatial index.
+    scene_index.refresh()
+    if profiler.enabled:
+        profiler.lap('update')
+
+def set_render_policy(mode, fps=None):
+    '''Change when the window is redrawn.
+    Args:
+        mode (str): 'continuous' to redraw as often as possible, 'capped' to redraw at a target frame rate,
+            'on_demand' to redraw only after the scene changed, at most at the target frame rate.
+        fps (float): the target frame rate, unchanged if None.
+    '''
+    render_policy.set_mode(mode, fps)
+
+def request_redraw():
+    '''Redraw the window at the next tick, for changes the render loop cannot see such as func_preRender drawing something else.'''
+    render_policy.request_redraw()
+
+# State of the scene when the last frame was drawn, see scene_changed.
+_drawn_state = None
+
+def _scene_state():
+    return (id(to_render), len(to_render), transformation.version, camera.matrix.array.tobytes(), width, height, clearColor)
+
+def scene_changed():
+    '''Returns true if the scene may look different from the last frame drawn.
+    Edits waiting to be applied, animations, registered updates, camera motion, renderables moved or edited, renderables
+    added or removed and resizing the window all count as changes.
+    '''
+    if scene_commands or scene_index.is_dirty() or animation_scheduler.is_active() or update_loop.is_active():
+        return True
+    if camera_controller and camera_controller.is_active():
+        return True
+    return _scene_state() != _drawn_state
+
+def frame_drawn():
+    '''Record that a frame was drawn, called by the render loops after every frame.'''
+    global _drawn_state
+    _drawn_state = _scene_state()
+    render_policy.frame_drawn()
+
+# Ids of the renderables of to_render when the spatial index was last synchronized with it.
+_indexed_ids = None
+
+def sync_index():
+    '''Make the spatial index match to_render, also after to_render was modified or replaced directly.'''
+    global _indexed_ids
+    ids = list(map(id, to_render))
+    if ids != _indexed_ids:
+        scene_index.sync(to_render)
+        _indexed_ids = ids
+    scene_index.refresh()
+
+def visible_renderables():
+    '''Returns the renderables in the view of the camera in the order they are rendered, and updates render_stats.
+    A renderable in to_render more than once is only drawn once.
+    '''
+    if culling:
+        frustum = Culling.Frustum.from_camera(camera, FOV, ASPECT_RATIO, NEAR, FAR, transformation.composite().array)
+        sync_index()
+        visible = scene_index.query_frustum(frustum)
+    else:
+        visible = to_render
+    render_stats['drawn'] = len(visible)
+    render_stats['culled'] = len(to_render) - len(visible)
+    return visible
+
+def scene_matrix():
+    '''Returns the 4x4 array of the transformation from the space of the renderables to clip space.'''
+    matrix = np.matmul(camera.matrix.array, TransformationMatrix.perspective(FOV, ASPECT_RATIO, NEAR, FAR).array)
+    return np.matmul(transformation.composite().array, matrix)
+
+def select_levels(objects):
+    '''Select the level of detail of the chains among the renderables about to be drawn.'''
+    matrix = scene_matrix() if level_of_detail else None
+    for obj in objects:
+        if hasattr(obj, 'select_level'):
+            obj.select_level(matrix, height)
+
+def pick(x=None, y=None):
+    '''Find the renderable under a point of the window.
+    Args:
+        x (int), y (int): the window coordinates; defaults to the position of the mouse.
+    Returns:
+        Picking.Hit: the nearest renderable and triangle under the point, or None.
+    '''
+    if x is None or y is None:
+        x, y = InputHandler.get_mouse_position()
+    origin, direction = Picking.ray_from_window(x, y, width, height, scene_matrix())
+    sync_index()
+    return Picking.pick(to_render, origin, direction, scene_index)
+
+def select_at(x=None, y=None):
+    '''Select the renderable under a point of the window, the selection is kept if there is nothing there.
+    Args:
+        x (int), y (int): the window coordinates; defaults to the position of the mouse.
+    Returns:
+        Picking.Hit: the hit, or None.
+    '''
+    global selection
+    hit = pick(x, y)
+    if hit is not None:
+        for i, obj in enumerate(to_render):
+            if obj is hit.renderable:
+                selection = i
+                break
+    return hit
+
+def render_scene():
+    '''Render the scene into the current OpenGL context, without swapping the buffers.'''
+    profiling = profiler.enabled
+    if profiling and not profiler.is_recording():
+        profiler.begin_frame()
+    # Set matrix mode
+    glMatrixMode(GL_PROJECTION)
+    glLoadIdentity()
+    gluPerspective(FOV, ASPECT_RATIO, NEAR, FAR)
+    glMatrixMode(GL_MODELVIEW)
+    # Clear the window
+    glClear(GL_COLOR_BUFFER_BIT|GL_DEPTH_BUFFER_BIT)
+    # Reset Camera
+    glPushMatrix()
+    glMultMatrixf(camera.matrix.c_values())
+    if func_preRender:
+        func_preRender()
+    if profiling:
+        profiler.lap('pre_render')
+    # Render all renderables
+    glPushMatrix()
+    glMultMatrixf(transformation.composite().c_values())
+    visible = visible_renderables()
+    select_levels(visible)
+    if profiling:
+        indices = {id(obj): i for i, obj in enumerate(to_render)}
+        for obj in visible:
+            profiler.draw(obj, indices[id(obj)])
+    else:
+        for obj in visible:
+            obj.render()
+    glPopMatrix()
+    if profiling:
+        profiler.lap('scene')
+    if func_postRender:
+        func_postRender()
+    if profiling:
+        profiler.lap('post_render')
+    glPopMatrix()
+
+def render_software(renderer):
+    '''Render the scene on the CPU.
+    func_preRender and func_postRender are not called as they issue OpenGL calls.
+    Args:
+        renderer (Offscreen.SoftwareRenderer): the renderer to draw with.
+    '''
+    profiling = profiler.enabled
+    if profiling:
+        if not profiler.is_recording():
+            profiler.begin_frame()
+        profiler.lap('pre_render')
+    renderer.clear(clearColor)
+    # The view and projection applied after the transformation of each object.
+    view = scene_matrix()
+    visible = visible_renderables()
+    select_levels(visible)
+    for obj in visible:
+        if isinstance(obj, Mesh):
+            renderer.draw(obj, view)
+        elif hasattr(obj, 'meshes'):
+            for matrix, mesh in obj.meshes():
+                renderer.draw(mesh, np.matmul(matrix, view))
+    if profiling:
+        profiler.lap('scene')
+        profiler.lap('post_render')
+
+def StartHeadless(frames=1, path=None, backend=None, on_frame=None):
+    '''Render the scene without creating a window, then return.
+    Uses an OSMesa or EGL context when PyOpenGL was set up for one, otherwise
+    falls back to rendering on the CPU. The image is width x height pixels.
+    Args:
+        frames (int): the number of frames to render.
+        path (str): if given, the last frame is saved to this path as a PNG image.
+        backend (str): 'osmesa', 'egl' or 'cpu'; defaults to the one matching PYOPENGL_PLATFORM.
+        on_frame (function): called with the index and the pixels of every frame.
+    Returns:
+        numpy.ndarray: (height, width, 4) uint8 pixels of the last frame, the first row is the top of the image.
+    '''
+    global ASPECT_RATIO, _render_thread
+    if backend is None:
+        backend = Offscreen.default_backend()
+    if backend not in Offscreen.BACKENDS:
+        raise ValueError("unknown offscreen backend: {}".format(backend))
+    ASPECT_RATIO = width / height
+    pixels = None
+    _render_thread = threading.current_thread()
+    if backend == 'cpu':
+        try:
+            renderer = Offscreen.SoftwareRenderer(width, height)
+            for i in range(0, frames):
+                update_scene()
+                render_software(renderer)
+                pixels = renderer.pixels()
+                frame_drawn()
+                if profiler.enabled:
+                    profiler.lap('swap')
+                    profiler.end_frame()
+                if on_frame:
+                    on_frame(i, pixels)
+        finally:
+            _render_thread = None
+    else:
+        context = Offscreen.create_context(width, height, backend)
+        try:
+            initialize_renderer()
+            glViewport(0, 0, width, height)
+            for i in range(0, frames):
+                update_scene()
+                render_scene()
+                glFinish()
+                frame_drawn()
+                if profiler.enabled:
+                    profiler.lap('swap')
+                    profiler.end_frame()
+                if on_frame or i == frames - 1:
+                    pixels = Offscreen.read_pixels(width, height)
+                if on_frame:
+                    on_frame(i, pixels)
+        finally:
+            _render_thread = None
+            geometry_cache.clear()
+            Instancing.instance_renderer.release()
+            context.destroy()
+    if path and pixels is not None:
+        Offscreen.save_image(pixels, path)
+    return pixels
+
 def Start(argv):
     global title, running
     global width, height
     global FOV, ASPECT_RATIO, NEAR, FAR
-    global func_main
+    global func_main, _render_thread
     FOV, ASPECT_RATIO, NEAR, FAR = 60.0, width / height, 1.0, 2000.0
     
     # Initialize window.
@@ -84,55 +452,46 @@ def Start(argv):
         height = h
         ASPECT_RATIO = w / h
         glViewport(0, 0, w, h)
+        request_redraw()
         
     def idle():
         global offset, running
-        if running:
+        if not running:
+            exitprog()
+        elif render_policy.mode == RenderPolicy.CONTINUOUS:
             glutPostRedisplay()
         else:
+            # Leave the loop to the timer, so the process sleeps between frames.
+            glutIdleFunc(None)
+            glutTimerFunc(0, tick, 0)
+
+    def tick(value):
+        # Called by the timer at the target frame rate, while the policy is not continuous.
+        if not running:
             exitprog()
+        elif render_policy.mode == RenderPolicy.CONTINUOUS:
+            glutIdleFunc(idle)
+        else:
+            if render_policy.should_redraw(scene_changed()):
+                glutPostRedisplay()
+            glutTimerFunc(int(render_policy.next_delay() * 1000), tick, 0)
 
     def render():
-        global camera
-        global FOV, ASPECT_RATIO, NEAR, FAR
-        global func_preRender, func_postRender
         try:
-            # Set matrix mode
-            glMatrixMode(GL_PROJECTION)
-            glLoadIdentity()
-            gluPerspective(FOV, ASPECT_RATIO, NEAR, FAR)
-            glMatrixMode(GL_MODELVIEW)
-            # Clear the window
-            glClear(GL_COLOR_BUFFER_BIT|GL_DEPTH_BUFFER_BIT)
-            # Reset Camera
-            glPushMatrix()
-            glMultMatrixf(camera.matrix.c_values())
-            if func_preRender:
-                func_preRender()
-            # Render all renderables
-            glPushMatrix()
-            for matrix in transformation:
-                if isinstance(matrix, TransformationMatrix):
-                    glMultMatrixf(matrix.c_values())
-            for obj in to_render:
-                obj.render()
-            glPopMatrix()
-            if func_postRender:
-                func_postRender()
-            glPopMatrix()
+            update_scene()
+            render_scene()
             glutSwapBuffers()
+            frame_drawn()
+            if profiler.enabled:
+                profiler.lap('swap')
+                profiler.end_frame()
         except Exception as e:
             running = False
             print(e)
             exitprog()
 
     # Initialize renderer
-    glClearColor(*clearColor)
-    glShadeModel(GL_SMOOTH)
-    glEnable(GL_CULL_FACE)
-    glEnable(GL_DEPTH_TEST)
-    glEnable(GL_BLEND)
-    glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+    initialize_renderer()
     # Set binding
     glutDisplayFunc(render)
     glutReshapeFunc(resize)
@@ -142,7 +501,9 @@ def Start(argv):
     # Start camera
     if camera_controller:
         camera_controller.start()
-    # Initialize keyboard input handler
+    # From now on, the scene edits of the other threads are applied at the start of each frame.
+    _render_thread = threading.current_thread()
+    # Run the user program, it edits the scene through scene_edit and add_update while the loop draws.
     inputThread = threading.Thread(None, func_main)
     inputThread.start()
     # Run the main loop
@@ -277,22 +638,23 @@ def start_animation(animator):
     animator.callback = remove_animation
     animator.start()
 
+@scene_edit
 def push_matrix(transMatrix):
     '''Push a transformation matrix to current renderable.'''
-    global selection, transformation, transformation_history
+    global selection, transformation
+    trans = transformation
     if selection > -1:
-        renderable = to_render[selection]
-        if isinstance(transMatrix, TransformationMatrix):
-            renderable.transformation.append(transMatrix)
-        elif isinstance(transMatrix, list) or isinstance(transMatrix, tuple):
-            renderable.transformation.extend(transMatrix)
+        trans = to_render[selection].transformation
+    if isinstance(transMatrix, TransformationMatrix):
+        matrices = [transMatrix]
+    elif isinstance(transMatrix, list) or isinstance(transMatrix, tuple):
+        matrices = list(transMatrix)
     else:
-        if isinstance(transMatrix, TransformationMatrix):
-            transformation.append(transMatrix)
-        elif isinstance(transMatrix, list) or isinstance(transMatrix, tuple):
-            transformation.extend(transMatrix)
-    transformation_history.clear()
+        return
+    trans.extend(matrices)
+    history.record(trans, matrices)
 
+@scene_edit
 def pop_matrix():
     '''Pop a transformation matrix from current renderable.'''
     global selection, transformation
@@ -301,16 +663,13 @@ def pop_matrix():
         renderable = to_render[selection]
         trans = renderable.transformation
     if trans:
-        val = trans.pop()
-        retval = [val]
-        if isinstance(val, int):
-            retval = []
-            for _ in range(0, val):
-                retval.insert(0, trans.pop())
+        retval = [trans.pop()]
+        history.record(trans, retval, pushed=False)
         return retval
     else:
         raise ValueError("no action to undo")
 
+@scene_edit
 def add_renderable(renderable):
     '''Add a new renderable to render
     Args:
@@ -318,50 +677,59 @@ def add_renderable(renderable):
     '''
     global to_render, selection
     to_render.append(renderable)
+    scene_index.insert(renderable)
     selection = len(to_render) - 1
-    transformation_history.clear()
+    history.clear_redo()
+
+def _unindex(renderable):
+    '''Remove a renderable from the spatial index and its edits from the history once it is no longer rendered.'''
+    if not any(obj is renderable for obj in to_render):
+        if renderable in scene_index:
+            scene_index.remove(renderable)
+        if hasattr(renderable, 'transformation'):
+            history.forget(renderable.transformation)
 
+@scene_edit
 def delete_renderable():
     '''Remove the selected renderable and select the top most renderable.
     Currently, the selected renderable is always the top most in the stack.
     '''
-    global to_render, selection, transformation_history
+    global to_render, selection
     if selection > -1:
+        renderable = to_render[selection]
         to_render = to_render[:selection] + to_render[selection+1:]
+        _unindex(renderable)
         if selection >= len(to_render):
             selection = len(to_render) - 1
-        transformation_history.clear()
+        history.clear_redo()
 
+@scene_edit
 def pop_renderable():
     '''Remove top most renderable'''
-    global to_render, selection, transformation_history
+    global to_render, selection
     if to_render:
+        renderable = to_render[-1]
         to_render = to_render[:-1]
+        _unindex(renderable)
         if selection >= len(to_render):
             selection = len(to_render) - 1
-        transformation_history.clear()
+        history.clear_redo()
 
-transformation_history = []
+@scene_edit
 def undo():
-    '''Undo a transformation'''
-    global tansformation_history, transformation
-    matrix = pop_matrix()
-    transformation_history.append((to_render[selection], matrix))
+    '''Undo the last push_matrix or pop_matrix, whichever renderable it edited.
+    Raises:
+        ValueError: if there is nothing to undo, or the stack was changed without push_matrix or pop_matrix.
+    '''
+    if history.undo() is None:
+        raise ValueError("no action to undo")
 
+@scene_edit
 def redo():
-    '''Redo a transformation'''
-    global tansformation_history, transformation
-    if transformation_history:
-        renderable, matrix = transformation_history.pop()
-        if renderable and renderable in to_render:
-            renderable.transformation.extend(matrix)
-            if len(matrix) > 1:
-                renderable.transformation.append(len(matrix))
-        elif renderable == None:
-            transformation.extend(matrix)
-            if len(matrix) > 1:
-                transformation.append(len(matrix))
-        else:
-            raise ActionError("no action to redo")
-    else:
+    '''Redo the last undone transformation.'''
+    try:
+        edit = history.redo()
+    except ValueError as e:
+        raise ActionError(str(e))
+    if edit is None:
         raise ActionError("no action to redo")
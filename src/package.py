@@ -9,4 +9,8 @@ package_dir={
 }
 python_requires="~= 3.6.2"
 entry_points={
-}
\ No newline at end of file
+}
+install_requires=[
+    "PyOpenGL",
+    "numpy",
+]
@@ -0,0 +1,29 @@
+import os
+import sys
+import pytest
+
+# Let the tests run from a checkout without installing the toolkit.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import SimplePyToolKit as toolkit
+except ImportError:
+    import src as toolkit
+
+@pytest.fixture
+def scene():
+    '''Returns the toolkit with an empty scene, and empties it again after the test.'''
+    def reset():
+        toolkit.to_render = []
+        toolkit.selection = -1
+        toolkit.scene_index.clear()
+        toolkit.history.clear()
+        toolkit.transformation.clear()
+        toolkit.scene_commands.clear()
+        toolkit.width, toolkit.height = 600, 600
+        toolkit.ASPECT_RATIO = 1.0
+        toolkit.camera.position = toolkit.DEFAULT_CAMERA_POSITION
+        toolkit.camera.rotation = toolkit.DEFAULT_CAMERA_ROTATION
+    reset()
+    yield toolkit
+    reset()
@@ -0,0 +1,26 @@
+import pytest
+
+def test_animation_without_apply_cannot_be_created(scene):
+    class Broken(scene.Animation):
+        pass
+    with pytest.raises(TypeError):
+        Broken(1.0)
+
+def test_animation_is_applied_until_it_finishes(scene):
+    class Record(scene.Animation):
+        def __init__(self, duration):
+            super().__init__(duration)
+            self.values = []
+
+        def apply(self, t):
+            self.values.append(t)
+
+    scheduler = scene.AnimationScheduler()
+    animation = Record(1.0)
+    animation.start(scheduler)
+    start = animation.start_time
+    scheduler.update(start + 0.5)
+    scheduler.update(start + 2.0)
+    assert animation.values == [0.5, 1.0]
+    assert not animation.is_alive()
+    assert not scheduler.is_active()
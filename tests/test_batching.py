@@ -0,0 +1,29 @@
+import pytest
+
+def test_renderable_sees_its_batch_change(scene):
+    member = scene.Builder.block((0, 0, 0), 1, 1, 1)
+    batch = scene.Batching.StaticBatch(member)
+    holder = scene.Renderable(batch)
+    before = holder.bounds[1].tolist()
+    member.applyTransformation(scene.TransformationMatrix.translate(10, 0, 0))
+    after = holder.bounds[1].tolist()
+    assert after[0] == pytest.approx(before[0] + 10)
+
+def test_batch_changes_reach_the_index(scene):
+    member = scene.Builder.block((0, 0, -50), 1, 1, 1)
+    holder = scene.Renderable(scene.Batching.StaticBatch(member))
+    scene.add_renderable(holder)
+    assert scene.visible_renderables() == [holder]
+    member.applyTransformation(scene.TransformationMatrix.translate(100000, 0, 0))
+    assert scene.visible_renderables() == []
+
+def test_batch_is_rebuilt_once_per_change(scene):
+    member = scene.Builder.block((0, 0, 0), 1, 1, 1)
+    batch = scene.Batching.StaticBatch(member)
+    batch.get_bounds()
+    rebuilds = batch.rebuilds
+    batch.get_bounds()
+    assert batch.rebuilds == rebuilds
+    member.applyTransformation(scene.TransformationMatrix.translate(1, 0, 0))
+    batch.get_bounds_key()
+    assert batch.rebuilds == rebuilds + 1
@@ -0,0 +1,35 @@
+import pytest
+
+def make_controller(scene, rotation=(0, 0, 0)):
+    camera = scene.Camera.Camera((0, 0, 0), rotation)
+    return camera, scene.Camera.CameraController(camera, 10, 90)
+
+def test_release_is_not_lost_after_many_events(scene):
+    camera, controller = make_controller(scene)
+    controller.start()
+    try:
+        scene.InputHandler.key_down(b'w', 0, 0)
+        for i in range(5000):
+            scene.InputHandler.mouse_passive_drag(i, i)
+        scene.InputHandler.key_up(b'w', 0, 0)
+        assert not controller.is_active()
+        controller.update(1.0, 100, 100)
+        assert camera.position == (0, 0, 0)
+    finally:
+        controller.stop_listening()
+
+def test_held_key_moves_the_camera(scene):
+    camera, controller = make_controller(scene)
+    controller.start()
+    try:
+        scene.InputHandler.key_down(b'w', 0, 0)
+        controller.update(1.0, 100, 100)
+        assert camera.position != (0, 0, 0)
+    finally:
+        scene.InputHandler.key_up(b'w', 0, 0)
+        controller.stop_listening()
+
+def test_quaternion_rotation_is_rejected(scene):
+    camera, controller = make_controller(scene, scene.Quaternion.from_euler_angles(0, 0, 0))
+    with pytest.raises(TypeError):
+        controller.start()
@@ -0,0 +1,42 @@
+import threading
+import time
+import pytest
+
+def run_in_thread(scene, func):
+    '''Call func from another thread while the render loop draws frames, returns its result or exception.'''
+    outcome = {}
+    def worker():
+        try:
+            outcome['result'] = func()
+        except Exception as e:
+            outcome['error'] = e
+    thread = threading.Thread(target=worker)
+    def on_frame(i, pixels):
+        if i == 0:
+            thread.start()
+        time.sleep(0.01)
+    scene.width, scene.height = 16, 16
+    scene.StartHeadless(20, backend='cpu', on_frame=on_frame)
+    thread.join(5)
+    return outcome
+
+def test_edits_from_other_threads_return_their_result(scene):
+    scene.add_renderable(scene.Builder.block((0, 0, 0), 1, 1, 1))
+    matrix = scene.TransformationMatrix.translate(1, 0, 0)
+    scene.push_matrix(matrix)
+    outcome = run_in_thread(scene, scene.pop_matrix)
+    assert outcome['result'] == [matrix]
+
+def test_edits_from_other_threads_raise_their_errors(scene):
+    outcome = run_in_thread(scene, scene.undo)
+    assert isinstance(outcome['error'], ValueError)
+
+def test_edits_after_the_loop_stopped_are_applied(scene):
+    scene._render_thread = threading.Thread()
+    try:
+        timer = threading.Timer(0.2, setattr, (scene, '_render_thread', None))
+        timer.start()
+        scene.add_renderable(scene.Builder.block((0, 0, 0), 1, 1, 1))
+    finally:
+        scene._render_thread = None
+    assert len(scene.to_render) == 1
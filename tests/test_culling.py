@@ -0,0 +1,17 @@
+import numpy as np
+
+def test_boxes_outside_a_plane_are_rejected(scene):
+    frustum = scene.Culling.Frustum(np.identity(4))
+    lows = np.array([(-0.5, -0.5, -0.5), (4, 0, 0), (0.9, 0.9, 0.9)])
+    highs = np.array([(0.5, 0.5, 0.5), (5, 1, 1), (2, 2, 2)])
+    assert frustum.intersects_boxes(lows, highs).tolist() == [True, False, True]
+
+def test_objects_without_bounds_are_kept(scene):
+    frustum = scene.Culling.Frustum(np.identity(4))
+    far = scene.Mesh(np.array([(10, 10, 10), (11, 11, 11), (10, 11, 10)], dtype=np.float32), None, np.array([(0, 1, 2)]))
+
+    class Unbounded:
+        def render(self):
+            pass
+
+    assert scene.Culling.cull([far, Unbounded()], frustum) == [1]
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+def make_renderable(scene):
+    scene.add_renderable(scene.Builder.block((0, 0, 0), 1, 1, 1))
+    return scene.to_render[-1]
+
+def translation(stack):
+    return stack.composite().array[3, :3].tolist()
+
+def test_undo_redo_restore_the_stack(scene):
+    r = make_renderable(scene)
+    scene.push_matrix(scene.TransformationMatrix.translate(1, 0, 0))
+    scene.push_matrix(scene.TransformationMatrix.translate(0, 2, 0))
+    scene.undo()
+    assert translation(r.transformation) == [1, 0, 0]
+    scene.redo()
+    assert translation(r.transformation) == [1, 2, 0]
+    assert len(r.transformation) == 3
+
+def test_undo_without_edits_raises_value_error(scene):
+    with pytest.raises(ValueError):
+        scene.undo()
+
+def test_compaction_bounds_the_stack(scene):
+    scene.history.limit = 2
+    r = make_renderable(scene)
+    for _ in range(10):
+        scene.push_matrix(scene.TransformationMatrix.translate(1, 0, 0))
+    # The transform, one baked matrix and the two matrices that can still be undone.
+    assert len(r.transformation) == 4
+    assert translation(r.transformation) == [10, 0, 0]
+    scene.undo()
+    scene.undo()
+    assert translation(r.transformation) == [8, 0, 0]
+    with pytest.raises(ValueError):
+        scene.undo()
+
+def test_compaction_keeps_the_transform(scene):
+    scene.history.limit = 2
+    r = make_renderable(scene)
+    for _ in range(4):
+        scene.push_matrix(scene.TransformationMatrix.translate(1, 0, 0))
+    assert r.transformation[0] is r.transform.matrix
+    r.transform.position = (100, 0, 0)
+    r.transform.reset()
+    assert translation(r.transformation) == [104, 0, 0]
+
+def test_compaction_keeps_live_matrices(scene):
+    scene.history.limit = 1
+    r = make_renderable(scene)
+    changed = scene.TransformationMatrix()
+    animation = scene.RotateOverTime(90, (0, 0, 1), None)
+    scene.push_matrix(changed)
+    changed.reset(scene.TransformationMatrix.translate(5, 0, 0).array)
+    scene.push_matrix(animation.current)
+    animation.start()
+    scene.push_matrix(scene.TransformationMatrix.translate(1, 0, 0))
+    scene.push_matrix(scene.TransformationMatrix.translate(1, 0, 0))
+    assert any(m is changed for m in r.transformation)
+    assert any(m is animation.current for m in r.transformation)
+    # The animation still moves the renderable.
+    before = r.transformation.composite().array.copy()
+    animation.stop()
+    scene.animation_scheduler.update()
+    assert not np.allclose(before, r.transformation.composite().array)
+
+def test_deleting_a_renderable_forgets_its_edits(scene):
+    make_renderable(scene)
+    scene.push_matrix(scene.TransformationMatrix.translate(1, 0, 0))
+    scene.pop_renderable()
+    assert len(scene.history) == 0
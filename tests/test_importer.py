@@ -0,0 +1,73 @@
+import numpy as np
+
+OBJ = b'''v 0 0 0
+v 1 0 0
+v 1 1 0
+v 0 1 0
+f 1 2 3 4
+f -4 -2 -1
+l 1 3
+'''
+
+PLY = b'''ply
+format ascii 1.0
+element vertex 3
+property float x
+property float y
+property float z
+property uchar red
+property uchar green
+property uchar blue
+element face 1
+property list uchar int vertex_indices
+end_header
+0 0 0 255 0 0
+1 0 0 0 255 0
+0 1 0 0 0 255
+3 0 1 2
+'''
+
+STL = b'''solid t
+facet normal 0 0 1
+outer loop
+vertex 0 0 0
+vertex 1 0 0
+vertex 0 1 0
+endloop
+endfacet
+facet normal 0 0 1
+outer loop
+vertex 1 0 0
+vertex 1 1 0
+vertex 0 1 0
+endloop
+endfacet
+endsolid t
+'''
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+def test_obj_faces_are_split_into_triangles(scene, tmp_path):
+    mesh = scene.Importer.load_mesh(write(tmp_path, 'a.obj', OBJ), cache=False)
+    assert mesh.triangles.tolist() == [[0, 1, 2], [0, 2, 3], [0, 2, 3]]
+    assert mesh.lines.tolist() == [[0, 2]]
+
+def test_ply_colors_are_read(scene, tmp_path):
+    mesh = scene.Importer.load_mesh(write(tmp_path, 'a.ply', PLY), cache=False)
+    assert mesh.triangles.tolist() == [[0, 1, 2]]
+    assert np.allclose(mesh.colors[0], (1, 0, 0, 1))
+
+def test_stl_corners_are_shared(scene, tmp_path):
+    mesh = scene.Importer.load_mesh(write(tmp_path, 'a.stl', STL), cache=False)
+    assert len(mesh.vertices) == 4 and len(mesh.triangles) == 2
+
+def test_cache_is_used_and_matches(scene, tmp_path):
+    path = write(tmp_path, 'a.obj', OBJ)
+    first = scene.Importer.load_mesh(path)
+    cached = scene.Importer.load_mesh(path)
+    assert isinstance(cached.vertices, np.memmap)
+    assert np.array_equal(first.vertices, cached.vertices)
+    assert np.array_equal(first.triangles, cached.triangles)
@@ -0,0 +1,17 @@
+import numpy as np
+
+def triangle(scene):
+    return scene.Mesh(np.array([(0, 0, 0), (1, 0, 0), (0, 1, 0)], dtype=np.float32), None, np.array([(0, 1, 2)]))
+
+def test_bounds_follow_the_instances(scene):
+    instanced = scene.Instancing.InstancedMesh(triangle(scene), [scene.TransformationMatrix.translate(x, 0, 0) for x in (0, 5)])
+    assert instanced.bounds[1].tolist() == [6, 1, 0]
+    instanced.set_matrix(1, scene.TransformationMatrix.translate(-5, 0, 0))
+    assert instanced.bounds[0].tolist() == [-5, 0, 0]
+
+def test_bake_holds_every_instance(scene):
+    instanced = scene.Instancing.InstancedMesh(triangle(scene), [scene.TransformationMatrix.translate(x, 0, 0) for x in range(3)], (1, 0, 0, 1))
+    baked = instanced.bake()
+    assert len(baked.vertices) == 9 and len(baked.triangles) == 3
+    assert instanced.instance_of(2) == 2
+    assert np.allclose(baked.colors[:, 1], 0)
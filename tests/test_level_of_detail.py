@@ -0,0 +1,21 @@
+import numpy as np
+
+def test_levels_change_with_hysteresis(scene):
+    meshes = [scene.Mesh(np.zeros((3, 3), dtype=np.float32), None, np.array([(0, 1, 2)])) for _ in range(3)]
+    chain = scene.LevelOfDetail.LODChain(meshes, [100, 10, 0], hysteresis=0.2)
+    assert chain.choose_level(50) == 1
+    chain.level = 1
+    # Past the threshold, but not by the hysteresis.
+    assert chain.choose_level(110) == 1
+    assert chain.choose_level(121) == 0
+    assert chain.choose_level(9) == 1
+    assert chain.choose_level(7) == 2
+
+def test_far_shapes_use_coarser_levels(scene):
+    near = scene.Builder.circle_lod(5)
+    far = scene.Builder.circle_lod(5)
+    near.transformation[0].reset(scene.TransformationMatrix.translate(0, 0, 50).array)
+    far.transformation[0].reset(scene.TransformationMatrix.translate(0, 0, -1500).array)
+    scene.select_levels([near, far])
+    chain = lambda r: r.childs[0]
+    assert chain(near).level < chain(far).level
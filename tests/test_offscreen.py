@@ -0,0 +1,41 @@
+import numpy as np
+
+def line_mesh(scene, a, b):
+    mesh = scene.Mesh(())
+    mesh.update(np.array([a, b], dtype=np.float32), np.ones((2, 4), dtype=np.float32),
+        np.zeros((0, 3), dtype=np.uint32), np.array([[0, 1]], dtype=np.uint32))
+    return mesh
+
+def test_lines_near_the_camera_are_clipped(scene):
+    renderer = scene.Offscreen.SoftwareRenderer(32, 32)
+    renderer.clear()
+    # w of the second point is 1e-9: unclipped it would span about 1e10 pixels.
+    matrix = np.identity(4)
+    matrix[2, 3] = 1.0
+    matrix[3, 3] = 0.0
+    mesh = line_mesh(scene, (0, 0, 0.5), (0.5, 0, 1e-9))
+    renderer.draw(mesh, matrix)
+    drawn = renderer.pixels()[..., 0] > 0
+    # The line goes from the center to the right edge.
+    assert drawn[16, 16:].all()
+    assert not drawn[16, :15].any()
+
+def test_lines_on_screen_are_drawn_whole(scene):
+    renderer = scene.Offscreen.SoftwareRenderer(32, 32)
+    renderer.clear()
+    renderer.draw(line_mesh(scene, (-0.5, 0, 0), (0.5, 0, 0)), np.identity(4))
+    drawn = np.flatnonzero(renderer.pixels()[..., 0].any(axis=0))
+    assert drawn.min() == 8 and drawn.max() == 24
+
+def test_triangles_with_infinite_vertices_are_skipped(scene):
+    renderer = scene.Offscreen.SoftwareRenderer(32, 32)
+    renderer.clear()
+    # w is the z of the vertex: the last one has w = 0 and projects to infinity.
+    matrix = np.identity(4)
+    matrix[2, 3] = 1.0
+    matrix[3, 3] = 0.0
+    mesh = scene.Mesh(())
+    mesh.update(np.array([(-0.5, -0.4, 1), (0.5, -0.5, 1), (0.5, 0.5, 0)], dtype=np.float32), np.ones((3, 4), dtype=np.float32),
+        np.array([[0, 1, 2]], dtype=np.uint32), np.zeros((0, 2), dtype=np.uint32))
+    renderer.draw(mesh, matrix)
+    assert not (renderer.pixels()[..., 0] > 0).any()
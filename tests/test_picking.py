@@ -0,0 +1,12 @@
+def test_pick_returns_the_nearest_renderable(scene):
+    # The camera looks toward -z, the block with the greater z is the nearest.
+    near = scene.Builder.block((0, 0, -20), 5, 5, 5)
+    far = scene.Builder.block((0, 0, -40), 5, 5, 5)
+    scene.add_renderable(far)
+    scene.add_renderable(near)
+    hit = scene.pick(scene.width // 2, scene.height // 2)
+    assert hit is not None and hit.renderable is near
+
+def test_pick_misses_empty_space(scene):
+    scene.add_renderable(scene.Builder.block((0, 0, -40), 5, 5, 5))
+    assert scene.pick(0, 0) is None
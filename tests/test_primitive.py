@@ -0,0 +1,22 @@
+import pytest
+
+def test_vertices_write_to_the_primitive(scene):
+    tri = scene.Tri((0, 0, 0), (1, 0, 0), (0, 1, 0))
+    renderable = scene.Renderable(tri)
+    assert renderable.bounds[0].tolist() == [0, 0, 0]
+    tri.vertices[0].x = -5
+    tri.vertices[2] = scene.Vector(0, 2, 0)
+    assert tri.points.tolist() == [[-5, 0, 0], [1, 0, 0], [0, 2, 0]]
+    assert renderable.bounds[0].tolist() == [-5, 0, 0]
+    assert renderable.bounds[1].tolist() == [1, 2, 0]
+
+def test_vertex_slices_are_read_only(scene):
+    tri = scene.Tri((0, 0, 0), (1, 0, 0), (0, 1, 0))
+    with pytest.raises(ValueError):
+        tri.vertices[0:2][0] = (1, 1, 1)
+
+def test_renderable_accepts_any_child(scene):
+    child = object()
+    assert scene.Renderable(child).childs == [child]
+    with pytest.raises(TypeError):
+        scene.Renderable().attach(child)
@@ -0,0 +1,34 @@
+import gc
+
+def test_frames_include_the_update(scene):
+    scene.add_renderable(scene.Builder.block((0, 0, -50), 1, 1, 1))
+    scene.width, scene.height = 16, 16
+    scene.profiler.reset()
+    scene.profiler.enable()
+    try:
+        scene.StartHeadless(3, backend='cpu')
+    finally:
+        scene.profiler.disable()
+    frames = list(scene.profiler.frames)
+    assert len(frames) == 3
+    for frame in frames:
+        assert frame['update'] >= 0
+        assert frame['total'] >= sum(frame[phase] for phase in scene.profiler.PHASES) - 1e-9
+
+def test_draw_costs_go_away_with_their_renderable(scene):
+    profiler = scene.Profiler.FrameProfiler()
+
+    class Drawn:
+        def render(self):
+            pass
+
+    obj = Drawn()
+    profiler.draw(obj, 0)
+    assert len(profiler.draw_costs) == 1
+    del obj
+    gc.collect()
+    assert len(profiler.draw_costs) == 0
+    # A new object at the same address starts from no cost.
+    other = Drawn()
+    profiler.draw(other, 1)
+    assert [c['count'] for c in profiler.draw_costs.values()] == [1]
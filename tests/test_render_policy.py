@@ -0,0 +1,35 @@
+import time
+
+def test_on_demand_redraws_only_on_change(scene):
+    policy = scene.RenderPolicy.RenderPolicy('on_demand', 30)
+    assert policy.should_redraw(False)
+    assert not policy.should_redraw(False)
+    assert policy.should_redraw(True)
+    policy.request_redraw()
+    assert policy.should_redraw(False)
+
+def test_waking_up_does_not_catch_up_the_idle_time(scene):
+    steps = []
+    update = steps.append
+    scene.add_update(update)
+    try:
+        scene.update_scene()
+        del steps[:]
+        scene.render_policy.set_mode('on_demand')
+        scene.render_policy.should_redraw(False)
+        assert not scene.render_policy.should_redraw(False)
+        # Idle for longer than the steps the loop may run at once.
+        time.sleep(scene.update_loop.step * (scene.update_loop.max_steps + 1))
+        assert scene.render_policy.should_redraw(True)
+        scene.update_scene()
+        assert steps == []
+    finally:
+        scene.remove_update(update)
+        scene.render_policy.set_mode('continuous')
+
+def test_effective_fps(scene):
+    policy = scene.RenderPolicy.RenderPolicy('capped', 30)
+    for i in range(100):
+        policy.frame_drawn(i * 0.02)
+    assert policy.get_effective_fps(1.99) == 50
+    assert policy.report()['target_fps'] == 30
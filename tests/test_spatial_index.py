@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+def cube(scene, x):
+    return scene.Builder.block((x, 0, -50), 1, 1, 1)
+
+def visible(scene):
+    return scene.visible_renderables()
+
+def test_index_follows_a_replaced_list(scene):
+    scene.add_renderable(cube(scene, 0))
+    objects = [cube(scene, x) for x in range(-4, 5, 2)]
+    scene.to_render = objects
+    assert visible(scene) == objects
+    assert len(scene.scene_index) == len(objects)
+
+def test_index_follows_the_order_of_the_list(scene):
+    for x in range(3):
+        scene.add_renderable(cube(scene, x))
+    visible(scene)
+    scene.to_render.reverse()
+    assert visible(scene) == scene.to_render
+
+def test_index_follows_direct_edits_of_the_list(scene):
+    a, b, c = cube(scene, 0), cube(scene, 1), cube(scene, 1000)
+    scene.add_renderable(a)
+    scene.add_renderable(b)
+    scene.to_render[1] = c
+    assert visible(scene) == [a]
+    assert b not in scene.scene_index
+
+def test_duplicates_keep_the_index_in_use(scene):
+    a, b = cube(scene, 0), cube(scene, 1)
+    scene.add_renderable(a)
+    scene.add_renderable(a)
+    assert visible(scene) == [a]
+    scene.add_renderable(b)
+    assert visible(scene) == [a, b]
+    assert len(scene.scene_index) == 2
+
+def test_sync_matches_the_list(scene):
+    index = scene.SpatialIndex.BoundingVolumeHierarchy()
+    objects = [cube(scene, x) for x in range(10)]
+    index.sync(objects)
+    index.sync(objects[5:] + objects[:3])
+    assert len(index) == 8
+    found = index.query_box(np.array((-100, -100, -100)), np.array((100, 100, 100)))
+    assert found == objects[5:] + objects[:3]
@@ -0,0 +1,20 @@
+import pytest
+
+def test_steps_and_alpha(scene):
+    loop = scene.UpdateLoop.FixedTimestep(0.1, 3)
+    steps, alphas = [], []
+    loop.add(steps.append, alphas.append)
+    assert loop.advance(0.25) == 2
+    assert steps == [0.1, 0.1]
+    assert alphas[-1] == pytest.approx(0.5)
+
+def test_late_time_is_dropped(scene):
+    loop = scene.UpdateLoop.FixedTimestep(0.1, 3)
+    assert loop.advance(1.05) == 3
+    assert loop.dropped == pytest.approx(0.7)
+    assert loop.accumulator < loop.step
+
+def test_remove_unknown_update(scene):
+    loop = scene.UpdateLoop.FixedTimestep()
+    with pytest.raises(ValueError):
+        loop.remove(print)
@@ -0,0 +1,13 @@
+import numpy as np
+
+def test_vectors_hash_by_identity(scene):
+    a, b = scene.Vector(1, 2, 3), scene.Vector(1, 2, 3)
+    assert len({a, b}) == 2
+    assert a.equals(b) and a.equals((1, 2, 3))
+    assert not a.equals((1, 2, 4))
+
+def test_vector_array_round_trip(scene):
+    points = scene.VectorArray(np.arange(9, dtype=np.float64).reshape(3, 3))
+    assert points[1].equals((3, 4, 5))
+    points[1] = scene.Vector(0, 0, 1)
+    assert points.array[1].tolist() == [0, 0, 1]